@@ -2,16 +2,55 @@
 """
 Módulo para gerenciar um cache em memória simples para dados que mudam pouco,
 como prompts e parâmetros, evitando chamadas repetidas ao banco de dados.
+
+Alterações feitas no banco (por qualquer worker ou instância) são aplicadas pela
+verificação periódica de app/services/configuracao.py.
 """
 import logging
+from dataclasses import dataclass, field, replace
 from supabase import Client
-from typing import Dict, Any
+from typing import Any, Callable, Dict, List, Optional, Set
 
 logger = logging.getLogger(__name__)
 
-# Dicionários globais que servirão como nosso cache.
-PROMPTS_CACHE: Dict[str, Any] = {}
-PARAMETROS_CACHE: Dict[str, Any] = {}
+@dataclass(frozen=True)
+class RetratoConfiguracao:
+    """
+    Parâmetros e prompts vigentes. Um retrato nunca é alterado: a recarga monta um
+    novo e o troca de uma vez, então uma requisição não vê metade de uma atualização.
+    'versao' identifica o estado das tabelas no banco (ver 'versao_configuracao').
+    """
+    parametros: Dict[str, Any] = field(default_factory=dict)
+    prompts: Dict[str, Any] = field(default_factory=dict)
+    versao: Optional[str] = None
+
+_retrato = RetratoConfiguracao()
+
+# Funções chamadas após cada troca de retrato, com os nomes dos parâmetros e dos
+# prompts alterados; usadas pelos módulos que guardam estado derivado da configuração.
+ObservadorConfiguracao = Callable[[Set[str], Set[str]], None]
+_observadores: List[ObservadorConfiguracao] = []
+
+def registrar_observador_configuracao(observador: ObservadorConfiguracao):
+    _observadores.append(observador)
+
+def _alterados(anterior: Dict[str, Any], novo: Dict[str, Any]) -> Set[str]:
+    return {nome for nome in anterior.keys() | novo.keys() if anterior.get(nome) != novo.get(nome)}
+
+def _publicar(novo: RetratoConfiguracao):
+    """Troca o retrato vigente e avisa os observadores sobre o que mudou."""
+    global _retrato
+    anterior, _retrato = _retrato, novo
+    parametros_alterados = _alterados(anterior.parametros, novo.parametros)
+    prompts_alterados = _alterados(anterior.prompts, novo.prompts)
+    if not (parametros_alterados or prompts_alterados):
+        return
+    logger.info(f"🔄 Configuração atualizada. Parâmetros: {sorted(parametros_alterados)} | Prompts: {sorted(prompts_alterados)}")
+    for observador in list(_observadores):
+        try:
+            observador(parametros_alterados, prompts_alterados)
+        except Exception as e:
+            logger.error(f"❌ Erro ao aplicar a configuração atualizada em '{getattr(observador, '__qualname__', observador)}': {e}")
 
 def _converter_valor(valor_str: str) -> Any:
     """Tenta converter o valor string do banco para um tipo Python apropriado."""
@@ -25,38 +64,54 @@ def _converter_valor(valor_str: str) -> Any:
     except (ValueError, TypeError):
         return str(valor_str)
 
+def _parametros_das_linhas(linhas: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {item['nome']: _converter_valor(item['valor']) for item in linhas}
+
+def _prompts_das_linhas(linhas: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {item['nome']: item for item in linhas}
+
 def carregar_parametros_para_cache(supabase: Client):
     """Carrega os parâmetros da tabela 'parametros' e os armazena no cache."""
-    global PARAMETROS_CACHE
     logger.info("⚙️ Carregando parâmetros para o cache em memória...")
     try:
         response = supabase.table("parametros").select("nome, valor").execute()
         if response.data:
-            PARAMETROS_CACHE = {item['nome']: _converter_valor(item['valor']) for item in response.data}
-            logger.info(f"✅ {len(PARAMETROS_CACHE)} parâmetros carregados para o cache.")
+            # Sem versão: a próxima verificação periódica recarrega o retrato completo.
+            _publicar(replace(_retrato, parametros=_parametros_das_linhas(response.data), versao=None))
+            logger.info(f"✅ {len(_retrato.parametros)} parâmetros carregados para o cache.")
     except Exception as e:
         logger.error(f"❌ Erro crítico ao carregar parâmetros para o cache: {e}")
 
 def carregar_prompts_para_cache(supabase: Client):
     """Carrega os prompts da tabela 'prompts' e os armazena no cache."""
-    global PROMPTS_CACHE
     logger.info("⚙️ Carregando prompts para o cache em memória...")
     try:
         response = supabase.table("prompts").select("nome, conteudo").eq("ativo", True).execute()
         if response.data:
-            PROMPTS_CACHE = {item['nome']: item for item in response.data}
-            logger.info(f"✅ {len(PROMPTS_CACHE)} prompts carregados para o cache.")
+            _publicar(replace(_retrato, prompts=_prompts_das_linhas(response.data), versao=None))
+            logger.info(f"✅ {len(_retrato.prompts)} prompts carregados para o cache.")
     except Exception as e:
         logger.error(f"❌ Erro crítico ao carregar prompts para o cache: {e}")
 
+def versao_configuracao_em_cache() -> Optional[str]:
+    return _retrato.versao
+
+def publicar_configuracao(versao: str, linhas_parametros: List[Dict[str, Any]], linhas_prompts: List[Dict[str, Any]]):
+    """Publica um retrato completo lido do banco na versão informada (usado pela recarga periódica)."""
+    _publicar(RetratoConfiguracao(
+        parametros=_parametros_das_linhas(linhas_parametros),
+        prompts=_prompts_das_linhas(linhas_prompts),
+        versao=versao,
+    ))
+
 def obter_parametro(nome: str, default: Any = None) -> Any:
     """Busca um parâmetro do cache em memória."""
-    return PARAMETROS_CACHE.get(nome, default)
+    return _retrato.parametros.get(nome, default)
 
 def obter_prompt(nome: str) -> Any:
     """Busca um prompt do cache em memória."""
-    return PROMPTS_CACHE.get(nome)
+    return _retrato.prompts.get(nome)
 
 def obter_todos_parametros() -> Dict[str, Any]:
     """Retorna uma cópia de todos os parâmetros que estão em cache."""
-    return PARAMETROS_CACHE.copy()
+    return dict(_retrato.parametros)
@@ -0,0 +1,257 @@
+# app/core/cache_embeddings.py
+"""
+Cache de embeddings na frente de 'gerar_embedding_openai'.
+
+A chave é o par (modelo, hash do texto normalizado). Há dois níveis:
+- memória: um LRU limitado pelo parâmetro 'cache_embeddings_tamanho';
+- disco (opcional): um arquivo SQLite com os vetores em float32, habilitado quando
+  o parâmetro 'cache_embeddings_arquivo' aponta para um caminho.
+
+Quando o parâmetro 'embedding_model' muda, as entradas do modelo antigo são descartadas.
+
+O nível em disco nunca roda no event loop: as leituras vão para uma thread
+('asyncio.to_thread') e as gravações entram numa fila consumida por uma thread
+escritora, que grava em lotes com um único commit. É também a thread escritora
+que abre o arquivo, no startup e quando 'cache_embeddings_arquivo' muda.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from app.core.cache import obter_parametro, registrar_observador_configuracao
+from app.utils.cache_lru import CacheLRU
+
+logger = logging.getLogger(__name__)
+
+_cache_memoria = CacheLRU(tamanho_maximo=2048)
+_modelo_atual: Optional[str] = None
+_conexao_disco: Optional[sqlite3.Connection] = None
+_caminho_disco: Optional[str] = None
+_lock_disco = threading.Lock()
+_estatisticas_disco = {"acertos": 0, "falhas": 0, "gravadas": 0, "lotes_gravados": 0}
+
+# Máximo de embeddings gravados por commit pela thread escritora
+LOTE_GRAVACAO_DISCO = 256
+# Máximo de variáveis por consulta do SQLite (limite padrão antigo: 999)
+LOTE_LEITURA_DISCO = 500
+# Itens da fila: ("abrir", None), ("guardar", (chave, modelo, vetor, criado_em)),
+# ("limpar", modelo) ou ("parar", None)
+_fila_disco: "queue.Queue[Tuple[str, Any]]" = queue.Queue()
+_escritor_disco: Optional[threading.Thread] = None
+_lock_escritor = threading.Lock()
+
+
+def normalizar_texto_embedding(texto: str) -> str:
+    """Normaliza o texto enviado ao modelo de embedding (espaços e quebras de linha)."""
+    return " ".join(texto.split())
+
+
+def _chave(modelo: str, texto_normalizado: str) -> str:
+    return hashlib.sha256(f"{modelo}\x00{texto_normalizado}".encode("utf-8")).hexdigest()
+
+
+def _abrir_conexao_disco():
+    """
+    Executado na thread escritora: abre o arquivo SQLite do parâmetro
+    'cache_embeddings_arquivo' (ou nenhum, se vazio) e fecha o anterior.
+    """
+    global _conexao_disco, _caminho_disco
+    caminho = obter_parametro("cache_embeddings_arquivo", default="") or ""
+    if caminho == (_caminho_disco or "") and (_conexao_disco is not None or not caminho):
+        return
+    conexao = None
+    if caminho:
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+            conexao = sqlite3.connect(caminho, check_same_thread=False)
+            conexao.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "chave TEXT PRIMARY KEY, modelo TEXT NOT NULL, vetor BLOB NOT NULL, criado_em REAL NOT NULL)"
+            )
+            conexao.commit()
+            logger.info(f"✅ Cache de embeddings em disco aberto em '{caminho}'.")
+        except Exception as e:
+            logger.error(f"❌ Erro ao abrir o cache de embeddings em disco '{caminho}': {e}")
+            conexao, caminho = None, ""
+    with _lock_disco:
+        anterior = _conexao_disco
+        _conexao_disco, _caminho_disco = conexao, caminho or None
+        if anterior is not None:
+            anterior.close()
+
+
+def iniciar_cache_embeddings():
+    """Agenda a abertura do nível em disco na thread escritora (startup da aplicação)."""
+    _enfileirar_disco("abrir", None)
+
+
+def _aplicar_configuracao(parametros_alterados: Set[str], prompts_alterados: Set[str]):
+    if "cache_embeddings_arquivo" in parametros_alterados:
+        _enfileirar_disco("abrir", None)
+
+
+registrar_observador_configuracao(_aplicar_configuracao)
+
+
+def _verificar_modelo(modelo: str):
+    """Descarta as entradas de outros modelos quando o modelo de embedding muda."""
+    global _modelo_atual
+    tamanho = int(obter_parametro("cache_embeddings_tamanho", default=2048))
+    if tamanho != _cache_memoria.tamanho_maximo:
+        _cache_memoria.redimensionar(tamanho)
+    if _modelo_atual == modelo:
+        return
+    if _modelo_atual is not None:
+        logger.info(f"🧹 Modelo de embedding alterado de '{_modelo_atual}' para '{modelo}'. Limpando o cache.")
+        _cache_memoria.limpar()
+        if _conexao_disco is not None:
+            _enfileirar_disco("limpar", modelo)
+    _modelo_atual = modelo
+
+
+def _enfileirar_disco(operacao: str, dados: Any):
+    global _escritor_disco
+    with _lock_escritor:
+        if _escritor_disco is None or not _escritor_disco.is_alive():
+            _escritor_disco = threading.Thread(target=_executar_escritor_disco, name="cache-embeddings-disco", daemon=True)
+            _escritor_disco.start()
+    _fila_disco.put((operacao, dados))
+
+
+def _executar_escritor_disco():
+    """Thread escritora: agrupa as gravações pendentes e grava cada grupo num único commit."""
+    global _conexao_disco, _caminho_disco
+    while True:
+        itens = [_fila_disco.get()]
+        while len(itens) < LOTE_GRAVACAO_DISCO:
+            try:
+                itens.append(_fila_disco.get_nowait())
+            except queue.Empty:
+                break
+        parar = any(operacao == "parar" for operacao, _ in itens)
+        linhas = [dados for operacao, dados in itens if operacao == "guardar"]
+        modelos_mantidos = [dados for operacao, dados in itens if operacao == "limpar"]
+        try:
+            if any(operacao == "abrir" for operacao, _ in itens):
+                _abrir_conexao_disco()
+            with _lock_disco:
+                conexao = _conexao_disco
+                if conexao is not None:
+                    for modelo in modelos_mantidos:
+                        conexao.execute("DELETE FROM embeddings WHERE modelo <> ?", (modelo,))
+                    if linhas:
+                        conexao.executemany(
+                            "INSERT OR REPLACE INTO embeddings (chave, modelo, vetor, criado_em) VALUES (?, ?, ?, ?)",
+                            linhas,
+                        )
+                    conexao.commit()
+                    _estatisticas_disco["gravadas"] += len(linhas)
+                    _estatisticas_disco["lotes_gravados"] += 1
+        except Exception as e:
+            logger.warning(f"Erro ao gravar {len(linhas)} embeddings no cache em disco: {e}")
+        finally:
+            for _ in itens:
+                _fila_disco.task_done()
+        if parar:
+            with _lock_disco:
+                if _conexao_disco is not None:
+                    _conexao_disco.close()
+                    _conexao_disco, _caminho_disco = None, None
+            return
+
+
+def _ler_do_disco(chaves: List[str]) -> Dict[str, List[float]]:
+    """Executado fora do event loop: busca os vetores das chaves no SQLite."""
+    encontrados: Dict[str, List[float]] = {}
+    try:
+        with _lock_disco:
+            # Lida sob o lock: a thread escritora pode trocar (e fechar) a conexão.
+            conexao = _conexao_disco
+            if conexao is None:
+                return encontrados
+            for inicio in range(0, len(chaves), LOTE_LEITURA_DISCO):
+                parte = chaves[inicio:inicio + LOTE_LEITURA_DISCO]
+                marcadores = ",".join("?" * len(parte))
+                for chave, vetor in conexao.execute(
+                    f"SELECT chave, vetor FROM embeddings WHERE chave IN ({marcadores})", parte
+                ):
+                    encontrados[chave] = np.frombuffer(vetor, dtype=np.float32).tolist()
+            _estatisticas_disco["acertos"] += len(encontrados)
+            _estatisticas_disco["falhas"] += len(set(chaves)) - len(encontrados)
+    except Exception as e:
+        logger.warning(f"Erro ao ler o cache de embeddings em disco: {e}")
+    return encontrados
+
+
+async def obter_embeddings_cacheados(modelo: str, textos: List[str]) -> List[Optional[List[float]]]:
+    """Busca os embeddings dos textos na memória e, numa única consulta fora do event loop, no disco."""
+    _verificar_modelo(modelo)
+    chaves = [_chave(modelo, normalizar_texto_embedding(texto)) for texto in textos]
+    resultados: List[Optional[List[float]]] = [_cache_memoria.obter(chave) for chave in chaves]
+
+    faltantes = [chave for chave, vetor in zip(chaves, resultados) if vetor is None]
+    if not faltantes or _conexao_disco is None:
+        return resultados
+    encontrados = await asyncio.to_thread(_ler_do_disco, faltantes)
+    for indice, chave in enumerate(chaves):
+        vetor = encontrados.get(chave)
+        if resultados[indice] is None and vetor is not None:
+            _cache_memoria.guardar(chave, vetor)
+            resultados[indice] = vetor
+    return resultados
+
+
+async def obter_embedding_cacheado(modelo: str, texto: str) -> Optional[List[float]]:
+    """Busca o embedding do texto na memória e, em seguida, no disco."""
+    return (await obter_embeddings_cacheados(modelo, [texto]))[0]
+
+
+def guardar_embedding(modelo: str, texto: str, vetor: List[float]):
+    """Guarda o embedding na memória e agenda a sua gravação em disco (não bloqueia)."""
+    _verificar_modelo(modelo)
+    chave = _chave(modelo, normalizar_texto_embedding(texto))
+    _cache_memoria.guardar(chave, vetor)
+    if _conexao_disco is None:
+        return
+    _enfileirar_disco("guardar", (chave, modelo, np.asarray(vetor, dtype=np.float32).tobytes(), time.time()))
+
+
+def encerrar_cache_embeddings(timeout: float = 10.0):
+    """Grava os embeddings pendentes e encerra a thread escritora (shutdown da aplicação)."""
+    global _escritor_disco
+    escritor = _escritor_disco
+    if escritor is None or not escritor.is_alive():
+        return
+    _fila_disco.put(("parar", None))
+    escritor.join(timeout)
+    if escritor.is_alive():
+        logger.warning(f"⚠️ Cache de embeddings em disco: {_fila_disco.qsize()} gravações pendentes no encerramento.")
+    _escritor_disco = None
+
+
+def obter_estatisticas_cache_embeddings() -> Dict[str, Any]:
+    """Retorna as taxas de acerto dos níveis de memória e disco."""
+    with _lock_disco:
+        estatisticas_disco = dict(_estatisticas_disco)
+    total_disco = estatisticas_disco["acertos"] + estatisticas_disco["falhas"]
+    total_consultas = _cache_memoria.acertos + _cache_memoria.falhas
+    acertos_total = _cache_memoria.acertos + estatisticas_disco["acertos"]
+    return {
+        "modelo": _modelo_atual,
+        "taxa_acerto_total": round(acertos_total / total_consultas, 4) if total_consultas else 0.0,
+        "memoria": _cache_memoria.estatisticas(),
+        "disco": {
+            "habilitado": _conexao_disco is not None,
+            **estatisticas_disco,
+            "gravacoes_pendentes": _fila_disco.qsize(),
+            "taxa_acerto": round(estatisticas_disco["acertos"] / total_disco, 4) if total_disco else 0.0,
+        },
+    }
@@ -1,23 +1,90 @@
 # app/core/clients.py
+import asyncio
 import logging
 from functools import lru_cache
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Awaitable, TypeVar, AsyncIterator, Sequence
 
+import numpy as np
 from openai import AsyncOpenAI
-from supabase import create_client, Client
+from supabase import create_client, Client, acreate_client, AsyncClient
 import weaviate
+from weaviate.classes.init import AdditionalConfig, Timeout
 from weaviate.classes.query import Filter
+from weaviate.config import ConnectionConfig
+from weaviate.util import generate_uuid5
 
 from app.core.config import get_settings
 from app.core.cache import obter_parametro
+from app.core.cache_embeddings import obter_embedding_cacheado, obter_embeddings_cacheados, guardar_embedding, normalizar_texto_embedding
+from app.core.indice_local import (
+    indice_local_ativo, indice_local_disponivel, substituir_indice_local,
+    carregar_indice_local_do_disco, buscar_no_indice_local, obter_do_indice_local,
+)
+from app.utils.tokens import contar_tokens, dividir_em_trechos
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
 @lru_cache(maxsize=1)
 def get_supabase_client() -> Client:
     settings = get_settings()
     return create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
 
+supabase_async_client: Optional[AsyncClient] = None
+
+weaviate_async_client: Optional[weaviate.WeaviateAsyncClient] = None
+
+async def initialize_async_clients():
+    """
+    Inicializa os clientes assíncronos (Supabase e Weaviate), usados nos caminhos
+    de requisição para não bloquear o event loop durante as chamadas de rede.
+    """
+    global supabase_async_client, weaviate_async_client
+    settings = get_settings()
+    logger.info("⚙️ Inicializando cliente assíncrono do Supabase...")
+    try:
+        supabase_async_client = await acreate_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
+        logger.info("✅ Cliente Supabase assíncrono inicializado.")
+    except Exception as e:
+        logger.error(f"❌ Erro ao inicializar o cliente Supabase assíncrono: {e}")
+
+    weaviate_url = obter_parametro("weaviate_url")
+    if weaviate_url and settings.WEAVIATE_API_KEY:
+        logger.info("⚙️ Inicializando cliente assíncrono do Weaviate...")
+        try:
+            timeout_consulta = int(obter_parametro("weaviate_timeout_consulta", default=10))
+            client = weaviate.use_async_with_weaviate_cloud(
+                cluster_url=weaviate_url,
+                auth_credentials=weaviate.auth.AuthApiKey(settings.WEAVIATE_API_KEY),
+                headers={"X-OpenAI-Api-Key": settings.OPENAI_API_KEY},
+                additional_config=AdditionalConfig(
+                    connection=ConnectionConfig(
+                        session_pool_connections=int(obter_parametro("weaviate_pool_conexoes", default=10)),
+                        session_pool_maxsize=int(obter_parametro("weaviate_pool_maximo", default=50)),
+                    ),
+                    timeout=Timeout(init=30, query=timeout_consulta, insert=120),
+                ),
+            )
+            await client.connect()
+            weaviate_async_client = client
+            logger.info("✅ Cliente Weaviate assíncrono inicializado e conectado.")
+        except Exception as e:
+            logger.error(f"❌ Erro ao conectar o cliente Weaviate assíncrono: {e}")
+
+async def close_async_clients():
+    """Fecha as conexões dos clientes assíncronos no desligamento da aplicação."""
+    if weaviate_async_client:
+        try:
+            await weaviate_async_client.close()
+        except Exception as e:
+            logger.warning(f"Erro ao fechar o cliente Weaviate assíncrono: {e}")
+
+def get_supabase_async_client() -> AsyncClient:
+    if not supabase_async_client:
+        raise RuntimeError("Cliente Supabase assíncrono não foi inicializado.")
+    return supabase_async_client
+
 @lru_cache(maxsize=1)
 def get_openai_client() -> AsyncOpenAI:
     settings = get_settings()
@@ -49,21 +116,159 @@ def get_weaviate_client() -> weaviate.WeaviateClient:
         raise RuntimeError("Cliente Weaviate não foi inicializado.")
     return weaviate_client
 
+def get_weaviate_async_client() -> weaviate.WeaviateAsyncClient:
+    if not weaviate_async_client:
+        raise RuntimeError("Cliente Weaviate assíncrono não foi inicializado.")
+    return weaviate_async_client
+
+async def executar_consulta_weaviate(consulta: Awaitable[T]) -> T:
+    """
+    Aguarda uma consulta do cliente Weaviate assíncrono respeitando o timeout
+    configurado no parâmetro 'weaviate_timeout_consulta' (em segundos).
+    """
+    timeout = float(obter_parametro("weaviate_timeout_consulta", default=10))
+    return await asyncio.wait_for(consulta, timeout=timeout)
+
+# Propriedades de 'Article' devolvidas pela busca RAG (no Weaviate ou no índice local).
+PROPRIEDADES_BUSCA_ARTIGOS = ["title", "url", "content", "resumo", "movidesk_id"]
+
+async def iterar_objetos_weaviate(
+    nome_colecao: str,
+    return_properties: Optional[Sequence[str]] = None,
+    include_vector: bool = False,
+    tamanho_pagina: int = 200
+) -> AsyncIterator[Any]:
+    """Percorre todos os objetos de uma coleção com paginação por cursor ('after')."""
+    collection = get_weaviate_async_client().collections.get(nome_colecao)
+    cursor = None
+    while True:
+        resposta = await executar_consulta_weaviate(collection.query.fetch_objects(
+            limit=tamanho_pagina, after=cursor,
+            return_properties=list(return_properties) if return_properties else None,
+            include_vector=include_vector
+        ))
+        if not resposta.objects:
+            break
+        for obj in resposta.objects:
+            yield obj
+        cursor = resposta.objects[-1].uuid
+
+async def recarregar_indice_local():
+    """
+    Recarrega do Weaviate a réplica local dos vetores de 'Article' (parâmetro
+    'indice_local_ativo'). Se o Weaviate falhar, tenta abrir o índice persistido em disco.
+    """
+    if not indice_local_ativo():
+        return
+    vetores, propriedades = [], []
+    try:
+        async for obj in iterar_objetos_weaviate(
+            "Article", return_properties=PROPRIEDADES_BUSCA_ARTIGOS + ["categoria"], include_vector=True
+        ):
+            vetor = obj.vector.get("default") if isinstance(obj.vector, dict) else obj.vector
+            if not vetor:
+                continue
+            vetores.append(vetor)
+            propriedades.append({**obj.properties, "id": str(obj.uuid)})
+        substituir_indice_local(vetores, propriedades)
+    except Exception as e:
+        logger.error(f"❌ Erro ao carregar o índice vetorial local do Weaviate: {e}")
+        carregar_indice_local_do_disco()
+
 def _calcular_custo(model: str, prompt_tokens: int, completion_tokens: int) -> float:
     precos = {"gpt-4o": {"prompt": 5.0, "completion": 15.0}, "gpt-3.5-turbo": {"prompt": 0.50, "completion": 1.50}}
     modelo_precos = precos.get(model, precos.get(obter_parametro("modelo"), precos["gpt-3.5-turbo"]))
     return ((prompt_tokens / 1_000_000) * modelo_precos["prompt"]) + ((completion_tokens / 1_000_000) * modelo_precos["completion"])
 
 async def gerar_embedding_openai(texto: str) -> Optional[List[float]]:
-    client = get_openai_client()
     embedding_model = obter_parametro("embedding_model", default="text-embedding-ada-002")
+    embedding = await obter_embedding_cacheado(embedding_model, texto)
+    if embedding is not None:
+        return embedding
+    client = get_openai_client()
     try:
-        response = await client.embeddings.create(model=embedding_model, input=texto.replace("\n", " "))
-        return response.data[0].embedding
+        response = await client.embeddings.create(model=embedding_model, input=normalizar_texto_embedding(texto))
+        embedding = response.data[0].embedding
+        guardar_embedding(embedding_model, texto, embedding)
+        return embedding
     except Exception as e:
         logger.error(f"❌ Erro ao gerar embedding: {e}")
         return None
 
+async def gerar_embeddings_em_lote(textos: List[str]) -> List[Optional[List[float]]]:
+    """
+    Gera embeddings para vários textos usando a forma multi-entrada da API.
+
+    Os textos são agrupados em lotes limitados por tokens ('embedding_tokens_por_lote')
+    e por quantidade de entradas. Textos maiores que o limite do modelo
+    ('embedding_max_tokens_entrada') são divididos em trechos, e o vetor final é a
+    média dos trechos ponderada pelo número de tokens, renormalizada.
+
+    Returns:
+        Uma lista alinhada com 'textos'; textos vazios ou que falharam resultam em None.
+    """
+    embedding_model = obter_parametro("embedding_model", default="text-embedding-ada-002")
+    max_tokens_entrada = int(obter_parametro("embedding_max_tokens_entrada", default=8000))
+    tokens_por_lote = int(obter_parametro("embedding_tokens_por_lote", default=200_000))
+    max_entradas_por_lote = 2048
+
+    resultados: List[Optional[List[float]]] = [None] * len(textos)
+    # Cada trecho pendente: (índice do texto, texto do trecho, nº de tokens)
+    trechos: List[tuple] = []
+    validos = [indice for indice, texto in enumerate(textos) if texto and texto.strip()]
+    em_cache = await obter_embeddings_cacheados(embedding_model, [textos[indice] for indice in validos])
+    for indice, vetor in zip(validos, em_cache):
+        if vetor is not None:
+            resultados[indice] = vetor
+            continue
+        texto = textos[indice]
+        for trecho in dividir_em_trechos(normalizar_texto_embedding(texto), embedding_model, max_tokens_entrada):
+            trechos.append((indice, trecho, contar_tokens(trecho, embedding_model)))
+
+    if not trechos:
+        return resultados
+
+    lotes: List[List[tuple]] = [[]]
+    tokens_lote_atual = 0
+    for item in trechos:
+        if lotes[-1] and (tokens_lote_atual + item[2] > tokens_por_lote or len(lotes[-1]) >= max_entradas_por_lote):
+            lotes.append([])
+            tokens_lote_atual = 0
+        lotes[-1].append(item)
+        tokens_lote_atual += item[2]
+
+    client = get_openai_client()
+    vetores_por_texto: Dict[int, List[tuple]] = {}
+    for numero_lote, lote in enumerate(lotes, start=1):
+        try:
+            response = await client.embeddings.create(model=embedding_model, input=[item[1] for item in lote])
+        except Exception as e:
+            logger.error(f"❌ Erro ao gerar o lote {numero_lote}/{len(lotes)} de embeddings: {e}")
+            continue
+        for item, dado in zip(lote, sorted(response.data, key=lambda d: d.index)):
+            vetores_por_texto.setdefault(item[0], []).append((dado.embedding, item[2]))
+        logger.info(f"Lote {numero_lote}/{len(lotes)}: {len(lote)} embeddings gerados.")
+
+    trechos_por_texto: Dict[int, int] = {}
+    for item in trechos:
+        trechos_por_texto[item[0]] = trechos_por_texto.get(item[0], 0) + 1
+
+    for indice, vetores in vetores_por_texto.items():
+        if len(vetores) != trechos_por_texto[indice]:
+            # Algum trecho do texto falhou; é melhor não ter vetor do que ter um vetor parcial.
+            continue
+        if len(vetores) == 1:
+            vetor = vetores[0][0]
+        else:
+            matriz = np.asarray([v for v, _ in vetores], dtype=np.float32)
+            pesos = np.asarray([n for _, n in vetores], dtype=np.float32)
+            media = (matriz * pesos[:, None]).sum(axis=0) / pesos.sum()
+            vetor = (media / np.linalg.norm(media)).tolist()
+        resultados[indice] = vetor
+        guardar_embedding(embedding_model, textos[indice], vetor)
+
+    return resultados
+
 async def generate_chat_completion(system_prompt: str, user_message: str, model: str, temperature: float) -> Dict[str, Any]:
     """Versão assíncrona que gera a resposta completa do chat e retorna um dicionário."""
     client = get_openai_client()
@@ -79,20 +284,125 @@ async def generate_chat_completion(system_prompt: str, user_message: str, model:
     except Exception as e:
         logger.error(f"❌ Erro ao gerar chat completion: {e}")
         return {"content": "Desculpe, ocorreu um erro ao gerar a resposta.", "usage": None, "cost": 0.0}
+
+async def gerar_chat_completion_stream(system_prompt: str, user_message: str, model: str, temperature: float) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Versão com streaming do chat completion. Emite {"tipo": "token", "conteudo": ...}
+    à medida que os tokens chegam e, por último, {"tipo": "uso", "usage": ..., "cost": ...}.
+    """
+    client = get_openai_client()
+    usage = None
+    try:
+        messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_message}]
+        stream = await client.chat.completions.create(
+            model=model, messages=messages, temperature=temperature,
+            stream=True, stream_options={"include_usage": True}
+        )
+        async for chunk in stream:
+            if chunk.usage:
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield {"tipo": "token", "conteudo": chunk.choices[0].delta.content}
+    except Exception as e:
+        logger.error(f"❌ Erro ao gerar chat completion com streaming: {e}")
+        yield {"tipo": "token", "conteudo": "Desculpe, ocorreu um erro ao gerar a resposta."}
+    custo = _calcular_custo(model, usage.prompt_tokens, usage.completion_tokens) if usage else 0.0
+    yield {"tipo": "uso", "usage": usage, "cost": custo}
         
-def buscar_artigos_por_embedding(near_vector: List[float], limit: int, categoria: Optional[str] = None) -> List[Dict]:
-    client = get_weaviate_client()
+def _similaridade(distancia: Optional[float]) -> Optional[float]:
+    """Converte a distância de cosseno do Weaviate na similaridade registrada nas fontes da mensagem."""
+    return round(1 - distancia, 4) if distancia is not None else None
+
+async def buscar_artigos_por_embedding(near_vector: List[float], limit: int, categoria: Optional[str] = None) -> List[Dict]:
+    if indice_local_disponivel():
+        return buscar_no_indice_local(near_vector, int(limit), categoria)
     filters = None
     if categoria and categoria != 'geral':
         filters = Filter.by_property("categoria").equal(categoria)
     try:
-        collection = client.collections.get("Article")
-        results = collection.query.near_vector(
+        collection = get_weaviate_async_client().collections.get("Article")
+        results = await executar_consulta_weaviate(collection.query.near_vector(
             near_vector=near_vector, limit=limit, filters=filters,
             return_metadata=["distance"],
-            return_properties=["title", "url", "content", "resumo", "movidesk_id"]
-        )
-        return [obj.properties for obj in results.objects]
+            return_properties=PROPRIEDADES_BUSCA_ARTIGOS
+        ))
+        return [
+            {**obj.properties, "id": str(obj.uuid), "score": _similaridade(obj.metadata.distance)}
+            for obj in results.objects
+        ]
+    except asyncio.TimeoutError:
+        logger.error("❌ Timeout ao buscar artigos por embedding no Weaviate.")
+        return []
     except Exception as e:
         logger.error(f"❌ Erro ao buscar artigos por embedding: {e}")
         return []
+
+async def buscar_artigos_por_ids(ids: Sequence[str]) -> Dict[str, Dict]:
+    """Propriedades dos artigos pelos seus ids (UUID), do índice local ou do Weaviate. Retorna {} em caso de erro."""
+    ids = [i for i in dict.fromkeys(ids) if i]
+    encontrados = obter_do_indice_local(ids) if indice_local_disponivel() else {}
+    faltantes = [i for i in ids if i not in encontrados]
+    if not faltantes:
+        return encontrados
+    try:
+        collection = get_weaviate_async_client().collections.get("Article")
+        results = await executar_consulta_weaviate(collection.query.fetch_objects(
+            filters=Filter.by_id().contains_any(faltantes), limit=len(faltantes),
+            return_properties=PROPRIEDADES_BUSCA_ARTIGOS
+        ))
+        for obj in results.objects:
+            encontrados[str(obj.uuid)] = {**obj.properties, "id": str(obj.uuid)}
+    except asyncio.TimeoutError:
+        logger.error("❌ Timeout ao buscar artigos por id no Weaviate.")
+    except Exception as e:
+        logger.error(f"❌ Erro ao buscar artigos por id: {e}")
+    return encontrados
+
+async def buscar_passagens_por_embedding(near_vector: List[float], limit: int, categoria: Optional[str] = None) -> List[Dict]:
+    """
+    Busca as passagens mais próximas na coleção 'ArticlePassage' e as agrupa por
+    artigo. Retorna até 'limit' artigos, na ordem da melhor passagem de cada um,
+    com 'content' formado apenas pelas passagens encontradas (em ordem de posição).
+    """
+    filters = None
+    if categoria and categoria != 'geral':
+        filters = Filter.by_property("categoria").equal(categoria)
+    passagens_por_artigo = int(obter_parametro("rag_passagens_por_artigo", default=3))
+    try:
+        collection = get_weaviate_async_client().collections.get("ArticlePassage")
+        results = await executar_consulta_weaviate(collection.query.near_vector(
+            near_vector=near_vector, limit=int(limit) * passagens_por_artigo, filters=filters,
+            return_metadata=["distance"],
+            return_properties=["movidesk_id", "posicao", "title", "url", "content"]
+        ))
+    except asyncio.TimeoutError:
+        logger.error("❌ Timeout ao buscar passagens por embedding no Weaviate.")
+        return []
+    except Exception as e:
+        logger.error(f"❌ Erro ao buscar passagens por embedding: {e}")
+        return []
+
+    # Os resultados chegam ordenados por distância; o primeiro de cada artigo define a sua ordem.
+    grupos: Dict[Any, List[Dict]] = {}
+    melhor_score: Dict[Any, Optional[float]] = {}
+    for obj in results.objects:
+        movidesk_id = obj.properties.get("movidesk_id")
+        grupo = grupos.setdefault(movidesk_id, [])
+        melhor_score.setdefault(movidesk_id, _similaridade(obj.metadata.distance))
+        if len(grupo) < passagens_por_artigo:
+            grupo.append(obj.properties)
+    artigos = []
+    for movidesk_id, passagens in list(grupos.items())[:int(limit)]:
+        passagens.sort(key=lambda p: p.get("posicao") or 0)
+        artigos.append({
+            # Os artigos importados do Movidesk têm o UUID derivado do movidesk_id.
+            "id": str(generate_uuid5(movidesk_id)) if movidesk_id is not None else None,
+            "movidesk_id": movidesk_id,
+            "title": passagens[0].get("title", ""),
+            "url": passagens[0].get("url", ""),
+            "resumo": "",
+            "content": "\n[...]\n".join(p.get("content", "") for p in passagens),
+            "score": melhor_score[movidesk_id],
+            "posicoes": [p.get("posicao") for p in passagens],
+        })
+    return artigos
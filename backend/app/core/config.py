@@ -9,6 +9,9 @@ from typing import Optional
 
 class Settings(BaseSettings):
     # --- Configurações da API e Conexões ---
+    # Chaves aceitas no cabeçalho 'X-Api-Key', separadas por vírgula. Cada item pode
+    # ter um rótulo, usado nas estatísticas e nos logs: "painel:chave1,streamlit:chave2".
+    # O item inteiro também é aceito, então chaves antigas que contêm ':' seguem válidas.
     ALLOWED_API_KEYS: str
     SUPABASE_URL: str
     SUPABASE_KEY: str
@@ -0,0 +1,165 @@
+# app/core/indice_local.py
+"""
+Réplica em memória dos vetores da coleção 'Article' para a busca RAG.
+
+A base tem poucas centenas de artigos: um produto escalar sobre uma matriz
+float32 normalizada responde em frações de milissegundo, sem a ida e volta ao
+Weaviate Cloud. A matriz pode ser persistida em '.npy' e aberta com mmap
+(parâmetro 'indice_local_arquivo'), compartilhando as páginas entre workers.
+
+O índice é um retrato imutável: a recarga monta um novo e o troca atomicamente.
+"""
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.core.cache import obter_parametro
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class _RetratoIndice:
+    matriz: np.ndarray
+    propriedades: List[Dict[str, Any]]
+    # categoria -> índices das linhas da matriz, para o filtro por categoria
+    linhas_por_categoria: Dict[str, np.ndarray] = field(default_factory=dict)
+
+
+_retrato: Optional[_RetratoIndice] = None
+
+
+def indice_local_ativo() -> bool:
+    return str(obter_parametro("indice_local_ativo", default="false")).lower() == "true"
+
+
+def indice_local_disponivel() -> bool:
+    """Indica se a busca pode ser atendida pelo índice local."""
+    return indice_local_ativo() and _retrato is not None
+
+
+def _normalizar_linhas(matriz: np.ndarray) -> np.ndarray:
+    normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+    normas[normas == 0] = 1.0
+    return (matriz / normas).astype(np.float32)
+
+
+def _montar_retrato(matriz: np.ndarray, propriedades: List[Dict[str, Any]]) -> _RetratoIndice:
+    categorias: Dict[str, List[int]] = {}
+    for linha, props in enumerate(propriedades):
+        categorias.setdefault(props.get("categoria") or "geral", []).append(linha)
+    return _RetratoIndice(
+        matriz=matriz,
+        propriedades=propriedades,
+        linhas_por_categoria={c: np.asarray(linhas, dtype=np.int64) for c, linhas in categorias.items()},
+    )
+
+
+def _persistir(matriz: np.ndarray, propriedades: List[Dict[str, Any]], caminho: str) -> np.ndarray:
+    """Grava a matriz e as propriedades em disco e devolve a matriz aberta com mmap."""
+    os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+    temporario = f"{caminho}.tmp.npy"
+    np.save(temporario, matriz)
+    os.replace(temporario, caminho)
+    with open(f"{caminho}.json.tmp", "w", encoding="utf-8") as arquivo:
+        json.dump(propriedades, arquivo, ensure_ascii=False)
+    os.replace(f"{caminho}.json.tmp", f"{caminho}.json")
+    return np.load(caminho, mmap_mode="r")
+
+
+def substituir_indice_local(vetores: Sequence[Sequence[float]], propriedades: List[Dict[str, Any]]):
+    """Monta um novo retrato a partir dos vetores e propriedades e o publica."""
+    global _retrato
+    if not propriedades:
+        logger.warning("Nenhum vetor de artigo encontrado; o índice local ficará vazio e a busca usará o Weaviate.")
+        _retrato = None
+        return
+    matriz = _normalizar_linhas(np.asarray(vetores, dtype=np.float32).reshape(len(propriedades), -1))
+    caminho = obter_parametro("indice_local_arquivo", default="") or ""
+    if caminho:
+        try:
+            matriz = _persistir(matriz, propriedades, caminho)
+        except Exception as e:
+            logger.error(f"❌ Erro ao persistir o índice local em '{caminho}', mantendo-o só em memória: {e}")
+    _retrato = _montar_retrato(matriz, propriedades)
+    logger.info(f"✅ Índice vetorial local carregado com {len(propriedades)} artigos.")
+
+
+def carregar_indice_local_do_disco() -> bool:
+    """Abre com mmap o índice persistido por outro processo; retorna False se não existir."""
+    global _retrato
+    caminho = obter_parametro("indice_local_arquivo", default="") or ""
+    if not caminho or not os.path.exists(caminho) or not os.path.exists(f"{caminho}.json"):
+        return False
+    try:
+        matriz = np.load(caminho, mmap_mode="r")
+        with open(f"{caminho}.json", encoding="utf-8") as arquivo:
+            propriedades = json.load(arquivo)
+        if matriz.shape[0] != len(propriedades):
+            logger.warning("Índice local em disco inconsistente; será recarregado do Weaviate.")
+            return False
+        _retrato = _montar_retrato(matriz, propriedades)
+        logger.info(f"✅ Índice vetorial local aberto de '{caminho}' com {len(propriedades)} artigos.")
+        return True
+    except Exception as e:
+        logger.error(f"❌ Erro ao abrir o índice local em '{caminho}': {e}")
+        return False
+
+
+def descartar_indice_local():
+    global _retrato
+    _retrato = None
+
+
+def buscar_no_indice_local(near_vector: Sequence[float], limit: int, categoria: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Top-k por similaridade de cosseno, com o mesmo formato de retorno da busca no Weaviate."""
+    retrato = _retrato
+    if retrato is None or limit <= 0:
+        return []
+    consulta = np.asarray(near_vector, dtype=np.float32)
+    norma = np.linalg.norm(consulta)
+    if norma == 0:
+        return []
+    consulta = consulta / norma
+
+    if categoria and categoria != 'geral':
+        linhas = retrato.linhas_por_categoria.get(categoria)
+        if linhas is None:
+            return []
+        similaridades = retrato.matriz[linhas] @ consulta
+    else:
+        linhas = None
+        similaridades = retrato.matriz @ consulta
+
+    k = min(int(limit), similaridades.shape[0])
+    melhores = np.argpartition(-similaridades, k - 1)[:k]
+    melhores = melhores[np.argsort(-similaridades[melhores])]
+    scores = similaridades[melhores]
+    if linhas is not None:
+        melhores = linhas[melhores]
+    return [
+        {**retrato.propriedades[int(i)], "score": round(float(score), 4)}
+        for i, score in zip(melhores, scores)
+    ]
+
+
+def obter_do_indice_local(ids: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+    """Propriedades dos artigos do índice local com os ids (UUID do Weaviate) informados."""
+    retrato = _retrato
+    if retrato is None:
+        return {}
+    procurados = set(ids)
+    return {props["id"]: props for props in retrato.propriedades if props.get("id") in procurados}
+
+
+def estatisticas_indice_local() -> Dict[str, Any]:
+    retrato = _retrato
+    return {
+        "ativo": indice_local_ativo(),
+        "artigos": len(retrato.propriedades) if retrato else 0,
+        "mmap": isinstance(retrato.matriz, np.memmap) if retrato else False,
+    }
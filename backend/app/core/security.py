@@ -3,63 +3,189 @@
 
 """
 Módulo de segurança para a API, incluindo a validação de chaves.
+
+As chaves vêm da variável 'ALLOWED_API_KEYS', separadas por vírgula. Cada chave
+pode ter um rótulo para identificar quem a usa: "painel:chave1,streamlit:chave2".
+Sem rótulo, a chave é identificada pelos seus 4 últimos caracteres. Como uma chave
+antiga pode conter ':', o item inteiro também continua aceito como chave.
 """
+import hashlib
+import hmac
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, Optional, Tuple
+
 from fastapi import Security, HTTPException, status
 from fastapi.security import APIKeyHeader
 import logging
 
 # Importa a função para obter as configurações da aplicação
-from app.core.config import get_settings
+from app.core.config import Settings, get_settings
 
 logger = logging.getLogger(__name__)
 
 # Define que a chave de API será procurada no cabeçalho 'X-Api-Key'
 api_key_header = APIKeyHeader(name="X-Api-Key", auto_error=False)
 
+# Intervalo mínimo entre as verificações de alteração de 'ALLOWED_API_KEYS'
+INTERVALO_VERIFICACAO_SEGUNDOS = 30
+
+
+def _digest(chave: str) -> bytes:
+    return hashlib.sha256(chave.encode("utf-8")).digest()
+
+
+@dataclass(frozen=True)
+class _RegistroChaves:
+    # (digest da chave, rótulo); as chaves em si não ficam em memória
+    chaves: FrozenSet[Tuple[bytes, str]]
+    origem: str
+    # Itens configurados (uma chave com rótulo ocupa duas posições em 'chaves')
+    quantidade: int
+
+    @classmethod
+    def montar(cls, chaves_permitidas: str) -> "_RegistroChaves":
+        chaves, rotulos = set(), []
+        for item in chaves_permitidas.split(","):
+            item = item.strip()
+            if not item:
+                continue
+            rotulo, separador, chave = item.partition(":")
+            if separador and rotulo.strip() and chave.strip():
+                rotulo = rotulo.strip()
+                chaves.add((_digest(chave.strip()), rotulo))
+                rotulos.append(rotulo)
+            else:
+                rotulo = f"...{item[-4:]}"
+            # O item inteiro também vale: uma chave que já continha ':' segue funcionando.
+            chaves.add((_digest(item), rotulo))
+        if rotulos:
+            # Aviso para o caso de uma chave antiga conter ':' e ter sido lida como rótulo.
+            logger.warning(
+                f"🔑 Itens de ALLOWED_API_KEYS lidos como 'rotulo:chave': {', '.join(rotulos)}. "
+                "O item inteiro também continua aceito como chave."
+            )
+        quantidade = sum(1 for item in chaves_permitidas.split(",") if item.strip())
+        return cls(chaves=frozenset(chaves), origem=chaves_permitidas, quantidade=quantidade)
+
+    def identificar(self, chave: str) -> Optional[str]:
+        """Retorna o rótulo da chave, comparando com todas as chaves registradas em tempo constante."""
+        candidato = _digest(chave)
+        encontrado = None
+        for digest, rotulo in self.chaves:
+            if hmac.compare_digest(digest, candidato):
+                encontrado = rotulo
+        return encontrado
+
+
+_registro: Optional[_RegistroChaves] = None
+_proxima_verificacao = 0.0
+_lock = threading.Lock()
+_requisicoes_por_chave: Counter = Counter()
+_requisicoes_recusadas = 0
+
+
+def _chaves_configuradas() -> Optional[str]:
+    """Valor atual de 'ALLOWED_API_KEYS' (variável de ambiente ou .env), sem o cache de 'get_settings'."""
+    try:
+        return Settings().ALLOWED_API_KEYS or ""
+    except Exception as e:
+        logger.warning(f"Não foi possível reler ALLOWED_API_KEYS: {e}")
+        return None
+
+
+def recarregar_chaves_api() -> int:
+    """Relê as configurações e monta um novo registro de chaves. Retorna o número de chaves."""
+    global _registro
+    get_settings.cache_clear()
+    chaves_permitidas = get_settings().ALLOWED_API_KEYS or ""
+    with _lock:
+        if _registro is None or _registro.origem != chaves_permitidas:
+            _registro = _RegistroChaves.montar(chaves_permitidas)
+            logger.info(f"🔑 Registro de chaves de API carregado com {_registro.quantidade} chaves.")
+    return _registro.quantidade
+
+
+def _obter_registro() -> _RegistroChaves:
+    """Retorna o registro atual; recarrega-o se 'ALLOWED_API_KEYS' mudou (verificado a cada 30s)."""
+    global _proxima_verificacao
+    agora = time.monotonic()
+    if _registro is None:
+        recarregar_chaves_api()
+    elif agora >= _proxima_verificacao:
+        _proxima_verificacao = agora + INTERVALO_VERIFICACAO_SEGUNDOS
+        chaves_permitidas = _chaves_configuradas()
+        if chaves_permitidas is not None and chaves_permitidas != _registro.origem:
+            recarregar_chaves_api()
+    return _registro
+
+
+def _contar_requisicao(rotulo: Optional[str]):
+    """Contabiliza uma requisição autorizada (pelo rótulo) ou recusada (None)."""
+    global _requisicoes_recusadas
+    # 'get_api_key' roda no threadpool do FastAPI; sem o lock, incrementos se perdem.
+    with _lock:
+        if rotulo is None:
+            _requisicoes_recusadas += 1
+        else:
+            _requisicoes_por_chave[rotulo] += 1
+
+
+def obter_estatisticas_chaves_api() -> Dict[str, Any]:
+    """Requisições autorizadas por rótulo de chave e requisições recusadas."""
+    with _lock:
+        registro = _registro
+        return {
+            "chaves_registradas": registro.quantidade if registro else 0,
+            "requisicoes_por_chave": dict(_requisicoes_por_chave),
+            "requisicoes_recusadas": _requisicoes_recusadas,
+        }
+
+
 def get_api_key(api_key: str = Security(api_key_header)) -> str:
     """
     Dependência que valida a chave de API recebida na requisição.
-    
-    Esta função agora verifica se a chave fornecida está numa lista de chaves permitidas,
-    definida na variável de ambiente 'ALLOWED_API_KEYS'.
-    
+
+    A chave fornecida é comparada com o registro montado a partir da variável de
+    ambiente 'ALLOWED_API_KEYS' e contabilizada pelo rótulo da chave.
+
     Raises:
         HTTPException: Se a chave não for fornecida ou não for válida.
-        
+
     Returns:
         A chave de API se ela for válida.
     """
-    settings = get_settings()
+    registro = _obter_registro()
 
-    # 1. Verifica se a variável com a lista de chaves está configurada
-    allowed_keys_str = settings.ALLOWED_API_KEYS
-    if not allowed_keys_str:
+    # 1. Verifica se há chaves permitidas configuradas
+    if not registro.chaves:
         logger.critical("Nenhuma chave de API permitida está configurada no ambiente (ALLOWED_API_KEYS).")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="O servidor não está configurado corretamente para autenticação."
         )
 
-    # 2. Transforma a string de chaves separadas por vírgula numa lista
-    # Ex: "key1,key2" -> ["key1", "key2"]
-    valid_api_keys = [key.strip() for key in allowed_keys_str.split(",")]
-
-    # 3. Verifica se uma chave foi fornecida no cabeçalho da requisição
+    # 2. Verifica se uma chave foi fornecida no cabeçalho da requisição
     if not api_key:
+        _contar_requisicao(None)
         raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN, 
+            status_code=status.HTTP_403_FORBIDDEN,
             detail="Chave de API não fornecida."
         )
 
-    # 4. Verifica se a chave fornecida está na lista de chaves válidas
-    if api_key not in valid_api_keys:
-        logger.warning(f"Tentativa de acesso com chave de API inválida: {api_key}")
+    # 3. Verifica se a chave fornecida está entre as chaves registradas
+    rotulo = registro.identificar(api_key)
+    if rotulo is None:
+        _contar_requisicao(None)
+        logger.warning(f"Tentativa de acesso com chave de API inválida terminada em '...{api_key[-4:]}'.")
         raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN, 
+            status_code=status.HTTP_403_FORBIDDEN,
             detail="Chave de API inválida ou não autorizada."
         )
 
-    # 5. Se tudo estiver correto, retorna a chave
-    logger.info(f"Acesso autorizado para a chave de API terminada em '...{api_key[-4:]}'.")
+    # 4. Se tudo estiver correto, contabiliza e retorna a chave
+    _contar_requisicao(rotulo)
+    logger.debug(f"Acesso autorizado para a chave de API '{rotulo}'.")
     return api_key
-
@@ -3,6 +3,7 @@
 Ponto de entrada principal da aplicação FastAPI.
 Gerencia o ciclo de vida e a inclusão de todas as rotas da API.
 """
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
@@ -12,8 +13,24 @@ from fastapi.middleware.cors import CORSMiddleware
 from app.routers import api_router
 
 # --- CORREÇÃO: Importa apenas do clients e do novo cache ---
-from app.core.clients import get_supabase_client, initialize_dynamic_clients
-from app.core.cache import carregar_parametros_para_cache, carregar_prompts_para_cache, obter_parametro
+from app.core.clients import get_supabase_client, initialize_dynamic_clients, initialize_async_clients, close_async_clients, recarregar_indice_local
+from app.core.cache_embeddings import iniciar_cache_embeddings, encerrar_cache_embeddings
+from app.core.cache import carregar_parametros_para_cache, carregar_prompts_para_cache, obter_parametro, registrar_observador_configuracao
+from app.services.sincronizacao_artigos import iniciar_sincronizacao_periodica
+from app.services.classificador import iniciar_carregamento_classificador, encerrar_classificador
+from app.services.metricas import iniciar_consolidacao_metricas
+from app.services.sessoes import iniciar_gravacao_atividade_sessoes, gravar_atividade_sessoes
+from app.services.gravacao_mensagens import iniciar_gravacao_mensagens, encerrar_gravacao_mensagens
+from app.services.usuarios import aquecer_cache_usuarios
+from app.core.security import recarregar_chaves_api
+from app.services.configuracao import iniciar_atualizacao_configuracao
+
+def _aplicar_nivel_log(parametros_alterados, prompts_alterados):
+    """Aplica sem reinício uma alteração do parâmetro 'log_level'."""
+    if "log_level" in parametros_alterados:
+        logging.getLogger().setLevel(str(obter_parametro("log_level", default="INFO")).upper())
+
+registrar_observador_configuracao(_aplicar_nivel_log)
 
 # --- GERENCIADOR DE CICLO DE VIDA (LIFESPAN) ---
 @asynccontextmanager
@@ -39,12 +56,52 @@ async def lifespan(app: FastAPI):
     logger.info("🚀 Iniciando sequência de startup da aplicação...")
     logger.info(f"Nível de log configurado para: {log_level_str}")
     
-    # 3. Inicializa outros clientes que possam depender dos parâmetros em cache.
+    # 3. Monta o registro das chaves de API e inicializa outros clientes que possam
+    #    depender dos parâmetros em cache.
+    recarregar_chaves_api()
     initialize_dynamic_clients()
+    await initialize_async_clients()
+    # O arquivo do cache de embeddings em disco é aberto pela sua thread escritora.
+    iniciar_cache_embeddings()
+    await recarregar_indice_local()
+    try:
+        usuarios_carregados = await aquecer_cache_usuarios()
+        logger.info(f"✅ Cache de usuários aquecido com {usuarios_carregados} usuários recentes.")
+    except Exception as e:
+        logger.error(f"❌ Erro ao aquecer o cache de usuários: {e}")
+    # O modelo do classificador (PyTorch ou ONNX, pelo parâmetro 'classificador_backend') carrega em
+    # segundo plano; até ficar pronto, as perguntas são classificadas por uma heurística.
+    tarefa_classificador = iniciar_carregamento_classificador()
+    # As mensagens do chat são gravadas em lote, em segundo plano ('mensagens_fila_maxima', 'mensagens_lote_maximo').
+    iniciar_gravacao_mensagens()
+
+    # 4. Agenda as tarefas periódicas: sincronização incremental de artigos ('sync_intervalo_minutos'),
+    #    consolidação das métricas diárias ('metricas_consolidacao_intervalo_minutos'), gravação
+    #    em lote da atividade das sessões ('sessao_gravacao_atividade_segundos') e recarga de
+    #    parâmetros e prompts alterados ('configuracao_intervalo_segundos').
+    tarefas_periodicas = [
+        iniciar_sincronizacao_periodica(),
+        iniciar_consolidacao_metricas(),
+        iniciar_gravacao_atividade_sessoes(),
+        iniciar_atualizacao_configuracao(),
+    ]
     
     logger.info("✅ Aplicação iniciada e pronta para receber requisições!")
     yield
     logger.info("🔌 Encerrando a aplicação...")
+    for tarefa in tarefas_periodicas:
+        tarefa.cancel()
+    await asyncio.gather(*tarefas_periodicas, return_exceptions=True)
+    await encerrar_gravacao_mensagens()
+    try:
+        await gravar_atividade_sessoes()
+    except Exception as e:
+        logger.error(f"❌ Erro ao gravar a atividade das sessões no encerramento: {e}")
+    if not tarefa_classificador.done():
+        logger.warning("Encerrando com o classificador ainda carregando.")
+    await asyncio.to_thread(encerrar_classificador)
+    await asyncio.to_thread(encerrar_cache_embeddings)
+    await close_async_clients()
 
 # --- INICIALIZAÇÃO DA APLICAÇÃO ---
 app = FastAPI(
@@ -5,7 +5,7 @@ from fastapi import APIRouter, HTTPException, Query
 from typing import Optional, Dict, Any
 import math
 
-from app.core.clients import get_weaviate_client
+from app.core.clients import get_weaviate_async_client, executar_consulta_weaviate
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -21,7 +21,7 @@ async def listar_artigos_base_conhecimento(
     Retorna os artigos da página solicitada e informações de totalização.
     """
     try:
-        client = get_weaviate_client()
+        client = get_weaviate_async_client()
         collection = client.collections.get("Article")
         
         # Calcula o 'offset' para a paginação
@@ -36,12 +36,12 @@ async def listar_artigos_base_conhecimento(
         # Se houver um termo de busca, usa a busca por palavra-chave (BM25)
         if termo_busca:
             logger.info(f"Buscando artigos com o termo: '{termo_busca}', página: {pagina}")
-            response = collection.query.bm25(
+            response = await executar_consulta_weaviate(collection.query.bm25(
                 query=termo_busca,
                 limit=limite,
                 offset=offset,
                 return_properties=return_properties
-            )
+            ))
             # A busca BM25 não retorna um total, então uma abordagem seria fazer um count separado
             # ou simplesmente não mostrar o total na busca, o que é mais performático.
             # Por simplicidade, não calcularemos o total exato durante a busca.
@@ -52,15 +52,15 @@ async def listar_artigos_base_conhecimento(
             logger.info(f"Listando todos os artigos, página: {pagina}")
             
             # Para obter o total de artigos, usamos a função de agregação
-            aggregate_result = collection.aggregate.over_all(total_count=True)
+            aggregate_result = await executar_consulta_weaviate(collection.aggregate.over_all(total_count=True))
             total_itens = aggregate_result.total_count
             total_paginas = math.ceil(total_itens / limite) if total_itens > 0 else 1
             
-            response = collection.query.fetch_objects(
+            response = await executar_consulta_weaviate(collection.query.fetch_objects(
                 limit=limite,
                 offset=offset,
                 # NOTA: fetch_objects não aceita return_properties, ele retorna o objeto inteiro
-            )
+            ))
         
         # Extrai as propriedades dos objetos retornados
         artigos = [obj.properties for obj in response.objects]
@@ -1,7 +1,9 @@
+import json
 from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
 
 from app.models.api import RequisicaoChat, RespostaChat
-from app.services.fluxo_chat import processar_pergunta
+from app.services.fluxo_chat import processar_pergunta, processar_pergunta_stream
 from app.services.usuarios import obter_ou_criar_usuario
 from app.core.security import get_api_key
 
@@ -13,7 +15,7 @@ async def perguntar_chat(
     api_key: str = Depends(get_api_key)
 ):
     """Endpoint de chat que retorna uma resposta JSON completa."""
-    id_usuario = obter_ou_criar_usuario(requisicao.email_usuario, requisicao.nome_usuario)
+    id_usuario = await obter_ou_criar_usuario(requisicao.email_usuario, requisicao.nome_usuario)
     
     resposta_completa = await processar_pergunta(
         id_usuario=id_usuario,
@@ -21,3 +23,20 @@ async def perguntar_chat(
     )
     
     return resposta_completa
+
+@router.post("/perguntar/stream")
+async def perguntar_chat_stream(
+    requisicao: RequisicaoChat,
+    api_key: str = Depends(get_api_key)
+):
+    """
+    Endpoint de chat com streaming (NDJSON): um objeto JSON por linha, com os eventos
+    'sessao', 'classificacao', 'fontes', 'token' (um por trecho gerado) e 'fim'.
+    """
+    id_usuario = await obter_ou_criar_usuario(requisicao.email_usuario, requisicao.nome_usuario)
+
+    async def gerar_linhas():
+        async for evento in processar_pergunta_stream(pergunta=requisicao.pergunta, id_usuario=id_usuario):
+            yield json.dumps(evento, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(gerar_linhas(), media_type="application/x-ndjson")
@@ -17,9 +17,9 @@ router = APIRouter()
 
 # --- CORREÇÃO: Nome da função e variável da requisição atualizados ---
 @router.post("/", status_code=status.HTTP_201_CREATED)
-def registrar_feedback(requisicao: RequisicaoFeedback, api_key: str = Depends(get_api_key)):
+async def registrar_feedback(requisicao: RequisicaoFeedback, api_key: str = Depends(get_api_key)):
     """Endpoint para registrar o feedback de um usuário sobre uma resposta da IA."""
-    sucesso = salvar_feedback_db(
+    sucesso = await salvar_feedback_db(
         id_mensagem=requisicao.id_mensagem,
         tipo_feedback=requisicao.tipo_feedback
     )
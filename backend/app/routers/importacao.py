@@ -6,6 +6,7 @@ from fastapi import APIRouter, HTTPException, Query, BackgroundTasks, Depends, s
 from app.core.security import get_api_key
 # --- Importa tanto a função quanto a variável de estado do serviço ---
 from app.services.importador_artigos import importar_artigos_movidesk, import_status
+from app.services.sincronizacao_artigos import sincronizar_artigos_movidesk
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -54,4 +55,34 @@ async def endpoint_importar_artigos(
         
     except Exception as e:
         logger.error(f"❌ Erro ao agendar a tarefa de importação: {e}")
-        raise HTTPException(status_code=500, detail=f"Erro ao iniciar a importação: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Erro ao iniciar a importação: {str(e)}")
+
+
+@router.post(
+    "/sincronizar",
+    tags=["Importação"],
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Inicia a sincronização incremental de artigos do Movidesk em segundo plano"
+)
+async def endpoint_sincronizar_artigos(
+    background_tasks: BackgroundTasks,
+    api_key: str = Depends(get_api_key)
+):
+    """
+    Agenda uma sincronização incremental: apenas artigos novos, alterados ou
+    removidos no Movidesk são processados.
+
+    - Retorna **202 Accepted** imediatamente se a tarefa for agendada.
+    - Retorna **409 Conflict** se uma importação ou sincronização já estiver em andamento.
+    """
+    logger.info("🚀 Endpoint de sincronização de artigos chamado.")
+
+    if import_status["in_progress"]:
+        logger.warning("Requisição de sincronização bloqueada pois uma importação já está em andamento.")
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Uma importação já está em andamento. Aguarde a conclusão da anterior antes de iniciar uma nova."
+        )
+
+    background_tasks.add_task(sincronizar_artigos_movidesk)
+    return {"message": "Solicitação de sincronização aceita. O processo foi iniciado em segundo plano."}
@@ -30,7 +30,7 @@ def get_mensagens_sessao(
     return {"mensagens": mensagens}
 
 @router.post("/")
-def criar_mensagem(mensagem: MensagemCreate = Body(...)):
+async def criar_mensagem(mensagem: MensagemCreate = Body(...)):
     """
     Cria uma nova mensagem.
     
@@ -40,7 +40,7 @@ def criar_mensagem(mensagem: MensagemCreate = Body(...)):
     Returns:
         Status da operação
     """
-    success = salvar_mensagem(
+    success = await salvar_mensagem(
         mensagem.usuario_id,
         mensagem.sessao_id,
         mensagem.pergunta,
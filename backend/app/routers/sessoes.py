@@ -6,7 +6,9 @@ from pydantic import BaseModel
 from typing import Dict, Any, Optional, List
 from app.services.sessoes import (
     obter_ou_criar_sessao,
-    listar_sessoes_usuario
+    obter_detalhes_sessao,
+    listar_sessoes_usuario,
+    atualizar_ultima_atividade
 )
 from app.utils.logger import get_logger
 
@@ -31,7 +33,7 @@ async def obter_detalhe_sessao_alternativo(sessao_id: int):
     """
     try:
         logger.info(f"Obtendo detalhes da sessão {sessao_id} via endpoint /detalhe/{sessao_id}")
-        sessao = obter_detalhes_sessao(sessao_id)
+        sessao = await obter_detalhes_sessao(sessao_id)
         if not sessao:
             logger.warning(f"Sessão {sessao_id} não encontrada no endpoint /detalhe/{sessao_id}")
             raise HTTPException(
@@ -57,7 +59,7 @@ async def obter_detalhes_sessao_por_id(sessao_id: int):
     """
     try:
         logger.info(f"Obtendo detalhes da sessão {sessao_id} via endpoint /{sessao_id}/detalhes")
-        sessao = obter_detalhes_sessao(sessao_id)
+        sessao = await obter_detalhes_sessao(sessao_id)
         if not sessao:
             logger.warning(f"Sessão {sessao_id} não encontrada no endpoint /{sessao_id}/detalhes")
             raise HTTPException(
@@ -83,7 +85,7 @@ async def obter_sessao(sessao_id: int):
     """
     try:
         logger.info(f"Obtendo detalhes da sessão {sessao_id}")
-        sessao = obter_detalhes_sessao(sessao_id)
+        sessao = await obter_detalhes_sessao(sessao_id)
         if not sessao:
             logger.warning(f"Sessão {sessao_id} não encontrada")
             raise HTTPException(
@@ -110,10 +112,7 @@ async def criar_sessao(request: SessaoRequest):
         logger.info(f"Solicitação para criar sessão para usuário {request.usuario_id}")
         
         # Garantimos que a função seja chamada com await já que é assíncrona
-        sessao_id = await obter_ou_criar_sessao(
-            usuario_id=request.usuario_id,
-            criar_nova=request.criar_nova
-        )
+        sessao_id = await obter_ou_criar_sessao(usuario_id=request.usuario_id)
         
         logger.info(f"Sessão {sessao_id} obtida/criada com sucesso para usuário {request.usuario_id}")
         return {
@@ -178,7 +177,7 @@ async def listar_sessoes(usuario_id: int, incluir_inativas: bool = False):
     Lista todas as sessões de um usuário.
     """
     try:
-        sessoes = listar_sessoes_usuario(usuario_id, incluir_inativas)
+        sessoes = await listar_sessoes_usuario(usuario_id)
         return {"sessoes": sessoes, "total": len(sessoes)}
     except Exception as e:
         logger.error(f"Erro ao listar sessões: {str(e)}")
@@ -14,6 +14,14 @@ from app.core.clients import (
     get_weaviate_client,
     get_openai_client
 )
+from app.core.cache_embeddings import obter_estatisticas_cache_embeddings
+from app.core.indice_local import estatisticas_indice_local
+from app.services.classificador import obter_estatisticas_classificador, estado_classificador
+from app.services.cache_classificador import obter_estatisticas_cache_classificador
+from app.services.metricas import obter_estatisticas_cache_metricas
+from app.services.usuarios import obter_estatisticas_cache_usuarios
+from app.core.security import obter_estatisticas_chaves_api
+from app.services.gravacao_mensagens import obter_estatisticas_gravacao_mensagens
 from app.utils.logger import get_logger
 
 router = APIRouter()
@@ -119,6 +127,17 @@ async def check_health():
         ))
         logger.error(f"Erro ao verificar OpenAI: {str(e)}")
     
+    # 4. Verificar o carregamento do classificador (feito em segundo plano no startup)
+    estado = dict(estado_classificador)
+    if estado["status"] == "erro":
+        overall_status = "degraded"
+    services.append(ServiceStatus(
+        service="classificador",
+        status={"pronto": "ok", "erro": "error"}.get(estado["status"], "loading"),
+        error=estado["erro"],
+        details=estado
+    ))
+    
     # Calcular tempo de atividade
     uptime_seconds = time.time() - START_TIME
     uptime = str(timedelta(seconds=int(uptime_seconds)))
@@ -135,3 +154,40 @@ async def check_health():
         system_info=platform.platform(),
         timestamp=datetime.now().isoformat()
     )
+
+@router.get("/caches")
+async def obter_estatisticas_caches() -> Dict[str, Any]:
+    """
+    Retorna as estatísticas (tamanho e taxa de acerto) dos caches em memória da aplicação.
+    """
+    return {
+        "embeddings": obter_estatisticas_cache_embeddings(),
+        "indice_local": estatisticas_indice_local(),
+        "classificador": obter_estatisticas_cache_classificador(),
+        "metricas": obter_estatisticas_cache_metricas(),
+        "usuarios": obter_estatisticas_cache_usuarios(),
+    }
+
+@router.get("/classificador")
+async def obter_metricas_classificador() -> Dict[str, Any]:
+    """
+    Retorna o backend do classificador e as métricas dos micro-lotes de inferência
+    (profundidade da fila, número e tamanho dos lotes).
+    """
+    return obter_estatisticas_classificador()
+
+@router.get("/gravacao-mensagens")
+async def obter_metricas_gravacao_mensagens() -> Dict[str, Any]:
+    """
+    Retorna o estado da fila de gravação das mensagens do chat (profundidade,
+    lotes gravados, novas tentativas e mensagens perdidas).
+    """
+    return obter_estatisticas_gravacao_mensagens()
+
+@router.get("/chaves-api")
+async def obter_metricas_chaves_api() -> Dict[str, Any]:
+    """
+    Retorna o número de requisições autorizadas por chave de API (pelo rótulo,
+    nunca a chave) e o número de requisições recusadas.
+    """
+    return obter_estatisticas_chaves_api()
@@ -11,7 +11,7 @@ class UsuarioCreate(BaseModel):
     nome: Optional[str] = None
 
 @router.post("/")
-def criar_usuario(usuario: UsuarioCreate):
+async def criar_usuario(usuario: UsuarioCreate):
     """
     Cria um novo usuário ou retorna um existente.
     
@@ -22,7 +22,7 @@ def criar_usuario(usuario: UsuarioCreate):
         ID do usuário
     """
     try:
-        usuario_id = obter_ou_criar_usuario(usuario.login, usuario.nome)
+        usuario_id = await obter_ou_criar_usuario(usuario.login, usuario.nome)
         return {"usuario_id": usuario_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -5,13 +5,15 @@ Responsável por operações CRUD (Criar, Ler, Atualizar, Excluir)
 nos artigos utilizados pelo RAG.
 """
 
+import asyncio
 import logging
 from typing import List, Dict, Any, Optional
 
 # Importa as funções de cliente necessárias
 from datetime import datetime, timezone # <-- CORREÇÃO: Importa datetime e timezone
 # Importa as funções de cliente necessárias
-from app.core.clients import get_weaviate_client, gerar_embedding_openai
+from app.core.clients import get_weaviate_async_client, executar_consulta_weaviate, gerar_embedding_openai, recarregar_indice_local
+from app.services.cache_semantico import invalidar_cache_semantico
 # A importação de time_utils foi removida, pois não é mais necessária aqui.
 
 
@@ -28,7 +30,7 @@ async def buscar_artigos(
     - Se não, faz uma busca geral com filtros (fetch_objects).
     """
     try:
-        client = get_weaviate_client()
+        client = get_weaviate_async_client()
         collection = client.collections.get("Article")
         
         # Define filtros para a busca, se uma categoria for fornecida
@@ -40,17 +42,17 @@ async def buscar_artigos(
         # Executa a consulta com a lógica correta
         if query:
             # Busca semântica (vetorial) se uma query for fornecida
-            results = collection.query.near_text(
+            results = await executar_consulta_weaviate(collection.query.near_text(
                 query=query,
                 limit=limite,
                 filters=filters
-            )
+            ))
         else:
             # Busca geral com filtros ou simplesmente lista todos os artigos
-            results = collection.query.fetch_objects(
+            results = await executar_consulta_weaviate(collection.query.fetch_objects(
                 limit=limite,
                 filters=filters
-            )
+            ))
             
         # Processa os resultados para um formato limpo
         artigos = [obj.properties for obj in results.objects]
@@ -73,7 +75,7 @@ async def criar_artigo(
     Cria um novo artigo de forma assíncrona.
     """
     try:
-        client = get_weaviate_client()
+        client = get_weaviate_async_client()
         collection = client.collections.get("Article")
         
         embedding = await gerar_embedding_openai(conteudo)
@@ -90,12 +92,14 @@ async def criar_artigo(
             "creation_date": datetime.now(timezone.utc).isoformat(),
         }
         
-        uuid_gerado = collection.data.insert(
+        uuid_gerado = await collection.data.insert(
             properties=artigo_data,
             vector=embedding
         )
         
         logger.info(f"Artigo '{titulo}' criado com sucesso (UUID: {uuid_gerado})")
+        await asyncio.to_thread(invalidar_cache_semantico, f"artigo '{titulo}' criado")
+        await recarregar_indice_local()
         return {"id": str(uuid_gerado), "titulo": titulo, "status": "success"}
         
     except Exception as e:
@@ -114,7 +118,7 @@ async def atualizar_artigo(
     Atualiza um artigo existente. Se o conteúdo for alterado, o vetor é recalculado.
     """
     try:
-        client = get_weaviate_client()
+        client = get_weaviate_async_client()
         collection = client.collections.get("Article")
         
         update_data = {}
@@ -129,12 +133,14 @@ async def atualizar_artigo(
             vetor_para_atualizar = await gerar_embedding_openai(conteudo)
         
         if update_data:
-            collection.data.update(
+            await collection.data.update(
                 uuid=artigo_id,
                 properties=update_data,
                 vector=vetor_para_atualizar
             )
             logger.info(f"Artigo {artigo_id} atualizado com sucesso")
+            await asyncio.to_thread(invalidar_cache_semantico, f"artigo {artigo_id} atualizado")
+            await recarregar_indice_local()
             return {"status": "success", "id": artigo_id}
         else:
             return {"status": "no_change", "message": "Nenhum dado fornecido para atualização"}
@@ -148,12 +154,14 @@ async def excluir_artigo(artigo_id: str) -> Dict[str, Any]:
     Exclui um artigo da base de conhecimento.
     """
     try:
-        client = get_weaviate_client()
+        client = get_weaviate_async_client()
         collection = client.collections.get("Article")
         
-        collection.data.delete(uuid=artigo_id)
+        await collection.data.delete_by_id(uuid=artigo_id)
         
         logger.info(f"Artigo {artigo_id} excluído com sucesso")
+        await asyncio.to_thread(invalidar_cache_semantico, f"artigo {artigo_id} excluído")
+        await recarregar_indice_local()
         return {"status": "success", "id": artigo_id}
         
     except Exception as e:
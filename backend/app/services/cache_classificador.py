@@ -0,0 +1,117 @@
+# app/services/cache_classificador.py
+"""
+Cache das classificações: texto normalizado da pergunta → categorias mais
+prováveis (top-k com pontuações).
+
+- memória: LRU limitado por 'cache_classificador_tamanho', com TTL de
+  'cache_classificador_ttl_horas';
+- disco: um arquivo JSON pequeno ('cache_classificador_arquivo') gravado no
+  shutdown e recarregado quando o modelo fica pronto.
+
+As entradas pertencem a uma versão do modelo; se a versão muda, o cache é descartado.
+"""
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from app.core.cache import obter_parametro, registrar_observador_configuracao
+from app.utils.cache_lru import CacheLRU
+
+logger = logging.getLogger(__name__)
+
+_cache = CacheLRU(tamanho_maximo=1024)
+_versao_modelo: Optional[str] = None
+
+
+def _ttl_segundos() -> float:
+    return float(obter_parametro("cache_classificador_ttl_horas", default=24)) * 3600
+
+
+def _caminho_arquivo() -> str:
+    return obter_parametro("cache_classificador_arquivo", default="dados/cache_classificador.json") or ""
+
+
+def _configurar_cache():
+    tamanho = int(obter_parametro("cache_classificador_tamanho", default=1024))
+    if tamanho != _cache.tamanho_maximo:
+        _cache.redimensionar(tamanho)
+    _cache.ttl_segundos = _ttl_segundos()
+
+
+def _aplicar_configuracao(parametros_alterados: Set[str], prompts_alterados: Set[str]):
+    # O novo TTL vale para as entradas guardadas a partir de agora.
+    if parametros_alterados & {"cache_classificador_tamanho", "cache_classificador_ttl_horas"}:
+        _configurar_cache()
+
+
+registrar_observador_configuracao(_aplicar_configuracao)
+
+
+def definir_versao_modelo(versao: str):
+    """Associa o cache à versão do modelo carregado e restaura as entradas salvas em disco."""
+    global _versao_modelo
+    _configurar_cache()
+    if versao != _versao_modelo:
+        if _versao_modelo is not None:
+            logger.info(f"🧹 Versão do classificador alterada para '{versao}'. Limpando o cache de classificações.")
+        _cache.limpar()
+        _versao_modelo = versao
+    _carregar_do_disco()
+
+
+def _carregar_do_disco():
+    caminho = _caminho_arquivo()
+    if not caminho or not os.path.exists(caminho):
+        return
+    try:
+        with open(caminho, encoding="utf-8") as arquivo:
+            dados = json.load(arquivo)
+    except Exception as e:
+        logger.warning(f"Erro ao ler o cache de classificações em '{caminho}': {e}")
+        return
+    if dados.get("versao") != _versao_modelo:
+        logger.info("Cache de classificações em disco é de outra versão do modelo; ignorado.")
+        return
+    ttl, agora, restauradas = _ttl_segundos(), time.time(), 0
+    for texto, resultado, guardado_em in dados.get("itens", []):
+        restante = ttl - (agora - guardado_em)
+        if restante > 0:
+            _cache.guardar(texto, (resultado, guardado_em), ttl_segundos=restante)
+            restauradas += 1
+    logger.info(f"✅ {restauradas} classificações restauradas de '{caminho}'.")
+
+
+def salvar_cache_classificador():
+    """Grava as entradas válidas em disco (chamado no shutdown da aplicação)."""
+    caminho = _caminho_arquivo()
+    if not caminho or _versao_modelo is None:
+        return
+    itens = [[texto, resultado, guardado_em] for texto, (resultado, guardado_em) in _cache.itens()]
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+        temporario = f"{caminho}.tmp"
+        with open(temporario, "w", encoding="utf-8") as arquivo:
+            json.dump({"versao": _versao_modelo, "itens": itens}, arquivo, ensure_ascii=False)
+        os.replace(temporario, caminho)
+        logger.info(f"💾 {len(itens)} classificações salvas em '{caminho}'.")
+    except Exception as e:
+        logger.warning(f"Erro ao salvar o cache de classificações em '{caminho}': {e}")
+
+
+def obter_classificacao_cacheada(texto_normalizado: str) -> Optional[List[Dict[str, Any]]]:
+    if _versao_modelo is None:
+        return None
+    item = _cache.obter(texto_normalizado)
+    return item[0] if item is not None else None
+
+
+def guardar_classificacao(texto_normalizado: str, resultado: List[Dict[str, Any]]):
+    if _versao_modelo is None:
+        return
+    _cache.guardar(texto_normalizado, (resultado, time.time()))
+
+
+def obter_estatisticas_cache_classificador() -> Dict[str, Any]:
+    return {"versao_modelo": _versao_modelo, **_cache.estatisticas()}
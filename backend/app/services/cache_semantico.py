@@ -0,0 +1,92 @@
+# app/services/cache_semantico.py
+"""
+Cache semântico de respostas do chat.
+
+Perguntas quase idênticas reaproveitam a resposta já gerada em vez de pagar
+novamente pela busca RAG e pela geração. As entradas do cache são as próprias
+mensagens da IA que têm a coluna 'mensagens.embedding' preenchida e foram
+gravadas na geração atual do cache ('cache_semantico_geracao'); a busca é feita
+pela função 'match_respostas_cache' (ver scripts/supabase.sql), que aplica o
+limiar de similaridade, o TTL e ignora respostas com feedback negativo.
+"""
+import logging
+from typing import Any, Dict, List, Optional
+
+from app.core.cache import obter_parametro
+from app.core.clients import get_supabase_client, get_supabase_async_client
+
+logger = logging.getLogger(__name__)
+
+# Parâmetros cuja alteração muda as respostas geradas e, portanto, invalida o cache.
+PARAMETROS_QUE_INVALIDAM_CACHE = {
+    "modelo",
+    "temperatura",
+    "embedding_model",
+    "rag_search_limit",
+    "indexacao_modo",
+    "rag_passagens_por_artigo",
+    "prompt_chat_padrao",
+    "prompt_chat_geral",
+}
+
+def cache_semantico_ativo() -> bool:
+    """Indica se o cache semântico de respostas está habilitado nos parâmetros."""
+    return bool(obter_parametro("cache_semantico_ativo", default=True))
+
+async def buscar_resposta_em_cache(embedding: List[float]) -> Optional[Dict[str, Any]]:
+    """
+    Procura uma resposta já gerada para uma pergunta semanticamente equivalente.
+
+    Returns:
+        Dicionário com 'id', 'pergunta', 'resposta', 'metadados' e 'similarity'
+        da mensagem encontrada, ou None se não houver entrada válida no cache.
+    """
+    limiar = float(obter_parametro("cache_semantico_limiar", default=0.95))
+    ttl_horas = float(obter_parametro("cache_semantico_ttl_horas", default=24))
+    try:
+        supabase = get_supabase_async_client()
+        response = await supabase.rpc("match_respostas_cache", {
+            "embedding_input": embedding,
+            "min_similarity": limiar,
+            "match_count": 1,
+            "validade_segundos": int(ttl_horas * 3600),
+        }).execute()
+        if response.data:
+            entrada = response.data[0]
+            logger.info(f"🎯 Cache semântico: HIT na mensagem {entrada['id']} (similaridade {entrada['similarity']:.4f})")
+            return entrada
+        logger.info("Cache semântico: MISS")
+        return None
+    except Exception as e:
+        logger.error(f"❌ Erro ao consultar o cache semântico: {e}")
+        return None
+
+# Última geração produzida por uma invalidação feita neste processo; os demais
+# processos a recebem com a recarga periódica dos parâmetros.
+_geracao_invalidada = 0
+
+def geracao_cache_semantico() -> int:
+    """Geração do cache em vigor; gravada com cada resposta que entra no cache."""
+    return int(obter_parametro("cache_semantico_geracao", default=0))
+
+def resposta_obsoleta_para_cache(dados_mensagem: Dict[str, Any]) -> bool:
+    """Indica se a mensagem foi gerada numa geração do cache já invalidada."""
+    geracao = dados_mensagem.get("cache_geracao")
+    return geracao is not None and geracao < max(geracao_cache_semantico(), _geracao_invalidada)
+
+def invalidar_cache_semantico(motivo: str) -> bool:
+    """
+    Invalida todas as entradas do cache semântico, avançando a sua geração.
+    Deve ser chamada quando prompts, parâmetros de geração ou artigos mudam.
+    """
+    global _geracao_invalidada
+    try:
+        supabase = get_supabase_client()
+        response = supabase.rpc("invalidar_cache_respostas").execute()
+        if response.data is not None:
+            _geracao_invalidada = max(_geracao_invalidada, int(response.data))
+        logger.info(f"🧹 Cache semântico invalidado (geração {response.data}): {motivo}")
+        return True
+    except Exception as e:
+        logger.error(f"❌ Erro ao invalidar o cache semântico ({motivo}): {e}")
+        return False
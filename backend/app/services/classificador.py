@@ -1,36 +1,203 @@
 # app/services/classificador.py
 
+import asyncio
 import logging
+import os
 import re
-from transformers import pipeline, Pipeline
-import torch
-from typing import Optional
+import time
+from typing import Any, Dict, List, Optional, Set
 
-logger = logging.getLogger(__name__)
+import numpy as np
+
+from app.core.cache import obter_parametro, registrar_observador_configuracao
+from app.utils.microlotes import ProcessadorMicroLotes
+from app.services.cache_classificador import (
+    definir_versao_modelo,
+    guardar_classificacao,
+    obter_classificacao_cacheada,
+    salvar_cache_classificador,
+)
 
-# Detecta se há GPU disponível, caso contrário usa a CPU
-device = 0 if torch.cuda.is_available() else -1
+logger = logging.getLogger(__name__)
 
 # O "endereço" do modelo agora aponta para o seu repositório no Hugging Face Hub
 MODEL_ID = "sisand/classificador-sisandinho"
 
-# Carrega o pipeline de classificação com o modelo da nuvem
-logger.info(f"🔍 A carregar o modelo '{MODEL_ID}' do Hugging Face Hub...")
-classificador_pipeline: Optional[Pipeline] = None # Inicializa como None para segurança
-try:
-    # A biblioteca transformers usará o MODEL_ID para descarregar e carregar o modelo.
-    # Se o seu repositório for privado, é necessário configurar um token de acesso.
-    classificador_pipeline = pipeline(
-        "text-classification",
-        model=MODEL_ID,
-        device=device,
-        top_k=3 # Retorna as 3 categorias mais prováveis
+# Pasta com o modelo exportado para ONNX (gerada por scripts/exportar_classificador_onnx.py)
+DIRETORIO_ONNX_PADRAO = "dados/classificador_onnx"
+ARQUIVO_ONNX_QUANTIZADO = "modelo_int8.onnx"
+
+# Número de categorias mais prováveis devolvidas pelo classificador
+TOP_K = 3
+
+
+class ClassificadorPyTorch:
+    """Backend original: pipeline do transformers executado com PyTorch."""
+    nome = "pytorch"
+
+    def __init__(self, modelo: str = MODEL_ID):
+        # Importações locais: a imagem que usa apenas o ONNX não precisa carregar o torch.
+        import torch
+        from transformers import pipeline
+
+        # Detecta se há GPU disponível, caso contrário usa a CPU
+        device = 0 if torch.cuda.is_available() else -1
+        # A biblioteca transformers usará o MODEL_ID para descarregar e carregar o modelo.
+        # Se o seu repositório for privado, é necessário configurar um token de acesso.
+        self.pipeline = pipeline("text-classification", model=modelo, device=device, top_k=TOP_K)
+        # Versão usada para invalidar o cache de classificações (commit do modelo no Hub).
+        self.versao = f"pytorch:{modelo}@{getattr(self.pipeline.model.config, '_commit_hash', None) or 'local'}"
+
+    def classificar(self, textos: List[str]) -> List[List[Dict[str, Any]]]:
+        # batch_size faz o pipeline executar um único forward com as entradas preenchidas (padding).
+        return self.pipeline(textos, truncation=True, batch_size=len(textos))
+
+
+class ClassificadorOnnx:
+    """Backend ONNX Runtime sobre o modelo exportado e quantizado (int8 dinâmico)."""
+    nome = "onnx"
+
+    def __init__(self, diretorio: str = DIRETORIO_ONNX_PADRAO):
+        import onnxruntime as ort
+        from transformers import AutoConfig, AutoTokenizer
+
+        opcoes = ort.SessionOptions()
+        opcoes.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        threads = int(obter_parametro("classificador_threads", default=0))
+        if threads > 0:
+            opcoes.intra_op_num_threads = threads
+        caminho_modelo = os.path.join(diretorio, ARQUIVO_ONNX_QUANTIZADO)
+        self.sessao = ort.InferenceSession(caminho_modelo, sess_options=opcoes, providers=["CPUExecutionProvider"])
+        # Uma nova exportação muda o tamanho/data do arquivo e, portanto, a versão.
+        info = os.stat(caminho_modelo)
+        self.versao = f"onnx:{caminho_modelo}:{info.st_size}:{int(info.st_mtime)}"
+        self.entradas = {entrada.name for entrada in self.sessao.get_inputs()}
+        self.tokenizador = AutoTokenizer.from_pretrained(diretorio)
+        self.id2label = AutoConfig.from_pretrained(diretorio).id2label
+
+    def classificar(self, textos: List[str]) -> List[List[Dict[str, Any]]]:
+        tokens = self.tokenizador(textos, padding=True, truncation=True, return_tensors="np")
+        logits = self.sessao.run(None, {k: v.astype(np.int64) for k, v in tokens.items() if k in self.entradas})[0]
+        # softmax numericamente estável, como o pipeline do transformers
+        exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+        probabilidades = exp / exp.sum(axis=1, keepdims=True)
+        return [
+            [{"label": self.id2label[int(i)], "score": float(p[i])} for i in np.argsort(-p)[:TOP_K]]
+            for p in probabilidades
+        ]
+
+
+classificador_backend: Optional[Any] = None # Inicializa como None para segurança
+
+# Estado do carregamento do modelo, exposto em /api/status/health.
+# status: 'pendente' -> 'carregando' -> 'pronto' | 'erro'
+estado_classificador: Dict[str, Any] = {
+    "status": "pendente",
+    "backend": None,
+    "duracao_s": None,
+    "erro": None,
+    "respostas_heuristica": 0,
+}
+
+# Vocabulário das saudações; uma pergunta formada só por estas palavras é 'social'.
+PALAVRAS_SOCIAIS = {
+    "oi", "ola", "olá", "e", "ai", "aí", "salve", "bom", "boa", "dia", "tarde", "noite", "semana",
+    "final", "de", "tudo", "bem", "certo", "como", "vai", "você", "voce", "está", "esta", "estão",
+    "pessoal", "equipe", "time", "clientes", "a", "todos", "obrigado", "obrigada", "valeu", "tchau",
+    "até", "ate", "logo", "mais", "bemvindo", "bemvinda", "seja", "por", "aqui",
+}
+
+
+def _classificar_lote(textos: List[str]) -> List[List[Dict[str, Any]]]:
+    """Executado na thread do processador de micro-lotes, com o backend carregado no momento."""
+    backend = classificador_backend
+    if backend is None:
+        raise RuntimeError("O classificador não está carregado.")
+    return backend.classificar(textos)
+
+
+# Perguntas concorrentes são reunidas em micro-lotes e classificadas numa thread dedicada,
+# fora do event loop do uvicorn.
+processador_classificador = ProcessadorMicroLotes(_classificar_lote, nome="classificador")
+
+
+def _configurar_processador():
+    processador_classificador.configurar(
+        tamanho_maximo_lote=int(obter_parametro("classificador_lote_maximo", default=16)),
+        espera_maxima_ms=float(obter_parametro("classificador_espera_lote_ms", default=5)),
+    )
+
+
+def _aplicar_configuracao(parametros_alterados: Set[str], prompts_alterados: Set[str]):
+    # Os limites dos micro-lotes valem a partir do próximo lote; trocar o backend exige reiniciar.
+    if parametros_alterados & {"classificador_lote_maximo", "classificador_espera_lote_ms"}:
+        _configurar_processador()
+
+
+registrar_observador_configuracao(_aplicar_configuracao)
+
+
+def _marcar_pronto(inicio: float):
+    definir_versao_modelo(classificador_backend.versao)
+    estado_classificador.update(
+        status="pronto",
+        backend=classificador_backend.nome,
+        duracao_s=round(time.perf_counter() - inicio, 2),
+        erro=None,
     )
-    logger.info("✅ Modelo do Hub carregado com sucesso.")
-except Exception as e:
-    logger.error(f"❌ FALHA CRÍTICA AO CARREGAR O MODELO DO HUB: {e}")
-    # Se o modelo não puder ser carregado, a aplicação ainda pode subir,
-    # mas a função de classificação retornará um valor padrão.
+
+
+def carregar_classificador():
+    """
+    Carrega o backend de inferência escolhido pelo parâmetro 'classificador_backend'
+    ('pytorch' ou 'onnx'). Se o ONNX não puder ser carregado, recorre ao PyTorch.
+    """
+    global classificador_backend
+    estado_classificador["status"] = "carregando"
+    inicio = time.perf_counter()
+    _configurar_processador()
+    backend = str(obter_parametro("classificador_backend", default="pytorch")).strip().lower()
+    if backend == "onnx":
+        diretorio = obter_parametro("classificador_onnx_dir", default=DIRETORIO_ONNX_PADRAO)
+        logger.info(f"🔍 A carregar o classificador ONNX de '{diretorio}'...")
+        try:
+            classificador_backend = ClassificadorOnnx(diretorio)
+            logger.info("✅ Classificador ONNX carregado com sucesso.")
+            _marcar_pronto(inicio)
+            return
+        except Exception as e:
+            logger.error(f"❌ Falha ao carregar o classificador ONNX, a usar o PyTorch: {e}")
+
+    logger.info(f"🔍 A carregar o modelo '{MODEL_ID}' do Hugging Face Hub...")
+    try:
+        classificador_backend = ClassificadorPyTorch(MODEL_ID)
+        logger.info("✅ Modelo do Hub carregado com sucesso.")
+        _marcar_pronto(inicio)
+    except Exception as e:
+        logger.error(f"❌ FALHA CRÍTICA AO CARREGAR O MODELO DO HUB: {e}")
+        estado_classificador.update(status="erro", erro=str(e), duracao_s=round(time.perf_counter() - inicio, 2))
+        # Se o modelo não puder ser carregado, a aplicação ainda pode subir,
+        # mas a função de classificação retornará um valor padrão.
+
+
+def iniciar_carregamento_classificador() -> asyncio.Task:
+    """
+    Carrega o modelo em segundo plano, sem atrasar o startup. Enquanto não estiver
+    pronto, 'classificar_pergunta' responde com a heurística de saudações.
+    """
+    return asyncio.create_task(asyncio.to_thread(carregar_classificador))
+
+
+def encerrar_classificador():
+    """Encerra a thread de inferência e persiste o cache de classificações (shutdown da aplicação)."""
+    processador_classificador.parar()
+    salvar_cache_classificador()
+
+
+def obter_estatisticas_classificador() -> Dict[str, Any]:
+    """Backend em uso e métricas dos micro-lotes (profundidade da fila, tamanhos de lote)."""
+    backend = classificador_backend
+    return {"backend": backend.nome if backend else None, **processador_classificador.estatisticas()}
 
 
 def normalizar_texto(texto: str) -> str:
@@ -41,24 +208,41 @@ def normalizar_texto(texto: str) -> str:
     return texto
 
 
+def classificar_por_heuristica(texto_normalizado: str) -> str:
+    """Classificação rápida usada enquanto o modelo não está pronto: saudações são 'social'."""
+    palavras = texto_normalizado.split()
+    if palavras and len(palavras) <= 8 and all(p in PALAVRAS_SOCIAIS for p in palavras):
+        return "social"
+    return "geral"
+
+
 async def classificar_pergunta(pergunta: str) -> str:
     """
     Classifica a pergunta do usuário usando o modelo do Hugging Face.
     Retorna a categoria com maior pontuação ou 'geral' se a confiança for baixa.
     """
-    # Verificação de segurança para garantir que o pipeline foi carregado
-    if not classificador_pipeline:
-        logger.error("O pipeline de classificação não está disponível. A retornar 'geral'.")
-        return "geral"
-
     texto_normalizado = normalizar_texto(pergunta)
 
+    # Enquanto o modelo carrega (ou se falhou), responde com a heurística.
+    backend = classificador_backend
+    if not backend:
+        categoria = classificar_por_heuristica(texto_normalizado)
+        estado_classificador["respostas_heuristica"] += 1
+        logger.warning(f"O classificador não está pronto ({estado_classificador['status']}). Heurística: '{categoria}'.")
+        return categoria
+
     try:
-        logger.info(f"🧠 A classificar pergunta com o modelo fine-tuneado: {pergunta}")
-        resultado = classificador_pipeline(texto_normalizado, truncation=True)
-        logger.info(f"🎯 Resultado da classificação: {resultado}")
+        resultado = obter_classificacao_cacheada(texto_normalizado)
+        if resultado is not None:
+            logger.info(f"🎯 Classificação obtida do cache: {resultado}")
+        else:
+            logger.info(f"🧠 A classificar pergunta com o modelo fine-tuneado ({backend.nome}): {pergunta}")
+            # A inferência é CPU-bound; roda fora do event loop, em lote com outras perguntas concorrentes.
+            resultado = await processador_classificador.submeter(texto_normalizado)
+            guardar_classificacao(texto_normalizado, resultado)
+            logger.info(f"🎯 Resultado da classificação: {resultado}")
 
-        melhor_resultado = resultado[0][0]
+        melhor_resultado = resultado[0]
         melhor_categoria = melhor_resultado['label']
         melhor_pontuacao = melhor_resultado['score']
 
@@ -72,4 +256,4 @@ async def classificar_pergunta(pergunta: str) -> str:
         return melhor_categoria.lower()
     except Exception as e:
         logger.error(f"❌ Erro durante a classificação: {e}")
-        return "geral"
\ No newline at end of file
+        return "geral"
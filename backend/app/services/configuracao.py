@@ -0,0 +1,49 @@
+# app/services/configuracao.py
+"""
+Recarga periódica dos parâmetros e prompts em todos os workers.
+
+A cada 'configuracao_intervalo_segundos', cada processo consulta a versão da
+configuração no banco ('versao_configuracao': último 'atualizado_em' e número de
+linhas de 'parametros' e 'prompts'). Só quando a versão muda as duas tabelas são
+relidas e o retrato em memória é trocado, avisando os observadores registrados.
+"""
+import asyncio
+import logging
+
+from app.core.cache import obter_parametro, publicar_configuracao, versao_configuracao_em_cache
+from app.core.clients import get_supabase_async_client
+
+logger = logging.getLogger(__name__)
+
+
+async def atualizar_configuracao_se_alterada() -> bool:
+    """Recarrega parâmetros e prompts se a versão no banco mudou. Retorna True se recarregou."""
+    supabase = get_supabase_async_client()
+    versao = (await supabase.rpc("versao_configuracao", {}).execute()).data
+    if not versao or versao == versao_configuracao_em_cache():
+        return False
+    parametros, prompts = await asyncio.gather(
+        supabase.table("parametros").select("nome, valor").execute(),
+        supabase.table("prompts").select("nome, conteudo").eq("ativo", True).execute(),
+    )
+    publicar_configuracao(versao, parametros.data or [], prompts.data or [])
+    return True
+
+
+async def _executar_atualizacao_periodica():
+    """Laço da verificação da configuração; o intervalo é relido a cada ciclo (0 = desligada)."""
+    while True:
+        intervalo_segundos = float(obter_parametro("configuracao_intervalo_segundos", default=15))
+        if intervalo_segundos <= 0:
+            await asyncio.sleep(60)
+            continue
+        await asyncio.sleep(intervalo_segundos)
+        try:
+            await atualizar_configuracao_se_alterada()
+        except Exception as e:
+            logger.error(f"❌ Erro ao verificar a versão da configuração: {e}")
+
+
+def iniciar_atualizacao_configuracao() -> asyncio.Task:
+    """Agenda a verificação periódica da configuração (parâmetro 'configuracao_intervalo_segundos')."""
+    return asyncio.create_task(_executar_atualizacao_periodica())
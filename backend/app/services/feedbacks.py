@@ -1,27 +1,55 @@
 # app/services/feedbacks.py
+import asyncio
 import logging
+import time
 from typing import Literal
-from app.core.clients import get_supabase_client
+from postgrest.exceptions import APIError
+from app.core.clients import get_supabase_async_client
+from app.services.gravacao_mensagens import aguardar_gravacao_mensagem
 from datetime import datetime, timezone
 
 logger = logging.getLogger(__name__)
 
-def salvar_feedback_db(id_mensagem: int, tipo_feedback: Literal["positivo", "negativo"]) -> bool:
+# Tempo máximo de espera pela gravação da mensagem referenciada (em segundos)
+ESPERA_MAXIMA_MENSAGEM = 30.0
+# Código do Postgres para violação de chave estrangeira
+VIOLACAO_CHAVE_ESTRANGEIRA = "23503"
+
+def _mensagem_ainda_nao_gravada(erro: APIError) -> bool:
+    detalhes = erro.args[0] if erro.args and isinstance(erro.args[0], dict) else {}
+    return getattr(erro, "code", None) == VIOLACAO_CHAVE_ESTRANGEIRA or detalhes.get("code") == VIOLACAO_CHAVE_ESTRANGEIRA
+
+async def salvar_feedback_db(id_mensagem: int, tipo_feedback: Literal["positivo", "negativo"]) -> bool:
     """Salva um feedback (positivo ou negativo) para uma mensagem específica."""
-    try:
-        supabase = get_supabase_client()
-        
-        # --- CORREÇÃO AQUI: Usa 'mensagem_id' para corresponder ao seu banco de dados ---
-        dados_feedback = {
-            "mensagem_id": id_mensagem,
-            "tipo": tipo_feedback,
-            "criado_em": datetime.now(timezone.utc).isoformat()
-        }
-        
-        supabase.table("feedbacks").insert(dados_feedback).execute()
-        
-        logger.info(f"Feedback '{tipo_feedback}' salvo para a mensagem ID {id_mensagem}.")
-        return True
-    except Exception as e:
-        logger.error(f"Erro ao salvar feedback para a mensagem ID {id_mensagem}: {e}")
+    # A mensagem pode ainda estar na fila de gravação deste processo; o feedback a referencia.
+    if not await aguardar_gravacao_mensagem(id_mensagem, timeout=ESPERA_MAXIMA_MENSAGEM):
+        logger.error(f"Mensagem ID {id_mensagem} ainda não foi gravada; feedback não registrado.")
         return False
+    supabase = get_supabase_async_client()
+
+    # --- CORREÇÃO AQUI: Usa 'mensagem_id' para corresponder ao seu banco de dados ---
+    dados_feedback = {
+        "mensagem_id": id_mensagem,
+        "tipo": tipo_feedback,
+        "criado_em": datetime.now(timezone.utc).isoformat()
+    }
+
+    # Se a mensagem foi respondida por outro worker/instância, ela pode ainda estar na fila
+    # de gravação de lá: a chave estrangeira falha e o insert é repetido até ela chegar ao banco.
+    limite = time.monotonic() + ESPERA_MAXIMA_MENSAGEM
+    espera = 0.25
+    while True:
+        try:
+            await supabase.table("feedbacks").insert(dados_feedback).execute()
+            logger.info(f"Feedback '{tipo_feedback}' salvo para a mensagem ID {id_mensagem}.")
+            return True
+        except APIError as e:
+            if not _mensagem_ainda_nao_gravada(e) or time.monotonic() + espera > limite:
+                logger.error(f"Erro ao salvar feedback para a mensagem ID {id_mensagem}: {e}")
+                return False
+            logger.info(f"Mensagem ID {id_mensagem} ainda não está no banco; nova tentativa do feedback em {espera}s.")
+            await asyncio.sleep(espera)
+            espera = min(espera * 2, 4.0)
+        except Exception as e:
+            logger.error(f"Erro ao salvar feedback para a mensagem ID {id_mensagem}: {e}")
+            return False
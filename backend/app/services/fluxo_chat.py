@@ -1,71 +1,82 @@
 import logging
 import time
 import asyncio
-from typing import List, Dict, Any, Optional
-from datetime import datetime
+from typing import List, Dict, Any, Optional, Awaitable, TypeVar, Tuple, AsyncIterator, Set
+from datetime import datetime, timezone
 
 from app.models.api import RespostaChat
-from app.core.clients import generate_chat_completion, _calcular_custo, buscar_artigos_por_embedding, gerar_embedding_openai
+from app.core.clients import generate_chat_completion, gerar_chat_completion_stream, _calcular_custo, buscar_artigos_por_embedding, buscar_artigos_por_ids, buscar_passagens_por_embedding, gerar_embedding_openai
 from app.core.cache import obter_parametro, obter_prompt
 from app.services.classificador import classificar_pergunta
-from app.services.sessoes import obter_ou_criar_sessao, obter_detalhes_sessao
-from app.services.mensagens import salvar_mensagem
+from app.services.sessoes import resolver_sessao
+from app.services.mensagens import reservar_id_mensagem, montar_dados_mensagem, montar_fontes_resposta
+from app.services.gravacao_mensagens import gravar_mensagem
+from app.services.cache_semantico import cache_semantico_ativo, buscar_resposta_em_cache, geracao_cache_semantico
+from app.services.passagens_artigos import indexacao_por_passagens
 from app.utils.time_utils import formatar_timestamp_para_brt
 
 logger = logging.getLogger(__name__)
 
-async def buscar_artigos_weaviate(pergunta: str, categoria: Optional[str]) -> list:
+T = TypeVar("T")
+
+async def _cronometrar(etapa: str, tarefa: Awaitable[T], tempos_etapas: Dict[str, float]) -> T:
+    """Executa uma etapa do pipeline e registra sua duração (em ms) em 'tempos_etapas'."""
+    inicio = time.perf_counter()
+    try:
+        return await tarefa
+    finally:
+        tempos_etapas[etapa] = round((time.perf_counter() - inicio) * 1000, 1)
+
+async def _preparar_sessao_e_mensagem(pergunta: str, id_usuario: int, tempos_etapas: Dict[str, float]):
+    """
+    Ramo de persistência do pipeline: obtém a sessão (com seus detalhes, em geral
+    já em memória) e reserva o id da mensagem. A mensagem só é gravada no final,
+    já completa, por '_salvar_resposta'.
+    """
+    detalhes_sessao, id_mensagem_pergunta = await asyncio.gather(
+        _cronometrar("sessao", resolver_sessao(id_usuario), tempos_etapas),
+        _cronometrar("reservar_id_mensagem", reservar_id_mensagem(), tempos_etapas),
+    )
+    return detalhes_sessao["id"], detalhes_sessao, id_mensagem_pergunta
+
+async def buscar_artigos_weaviate(pergunta: str, categoria: Optional[str], embedding: Optional[List[float]] = None) -> list:
     logger.info(f"Iniciando busca RAG para a pergunta: '{pergunta}'")
-    embedding = await gerar_embedding_openai(pergunta)
+    if embedding is None:
+        embedding = await gerar_embedding_openai(pergunta)
     if embedding is None:
         logger.warning("Não foi possível gerar o embedding da pergunta.")
         return []
     limite_rag = obter_parametro("rag_search_limit", default=3)
-    artigos_encontrados = buscar_artigos_por_embedding(near_vector=embedding, categoria=None, limit=limite_rag)
+    if indexacao_por_passagens():
+        artigos_encontrados = await buscar_passagens_por_embedding(near_vector=embedding, categoria=None, limit=limite_rag)
+        if artigos_encontrados:
+            return artigos_encontrados
+        # Coleção de passagens ainda vazia (base não reindexada): usa os artigos inteiros.
+        logger.warning("Nenhuma passagem encontrada; buscando artigos inteiros.")
+    artigos_encontrados = await buscar_artigos_por_embedding(near_vector=embedding, categoria=None, limit=limite_rag)
     return artigos_encontrados
 
-async def processar_pergunta(pergunta: str, id_usuario: int) -> RespostaChat:
-    inicio = time.time()
-    logger.info(f"🧠 Pergunta recebida para Usuário ID {id_usuario}: '{pergunta}'")
-    
-    id_sessao = obter_ou_criar_sessao(usuario_id=id_usuario)
-    detalhes_sessao = obter_detalhes_sessao(id_sessao)
-    id_mensagem_pergunta = salvar_mensagem(pergunta=pergunta, resposta="", usuario_id=id_usuario, sessao_id=id_sessao, tipo_resposta="usuario")
-    
-    categoria = await classificar_pergunta(pergunta)
-    precisa_rag = categoria not in ["social", "geral"]
-    logger.info(f"📚 Categoria: '{categoria}' | Precisa de RAG: {precisa_rag}")
-    
-    artigos_encontrados = []
-    system_prompt = ""
-    nome_prompt_usado = ""
+async def _obter_embedding_e_cache(pergunta: str, usar_cache: bool, tempos_etapas: Dict[str, float]):
+    """Gera o embedding da pergunta e, se o cache semântico estiver ativo, consulta-o em seguida."""
+    embedding = await _cronometrar("embedding", gerar_embedding_openai(pergunta), tempos_etapas)
+    entrada_cache = None
+    if usar_cache and embedding is not None:
+        entrada_cache = await _cronometrar("cache_semantico", buscar_resposta_em_cache(embedding), tempos_etapas)
+    return embedding, entrada_cache
 
-    if precisa_rag:
-        artigos_encontrados = await buscar_artigos_weaviate(pergunta, categoria)
-        if artigos_encontrados:
-            contexto = "\n\n---\n\n".join([f"Título: {a.get('title', '')}\nConteúdo: {a.get('content', '')}" for a in artigos_encontrados])
-            nome_prompt_usado = obter_parametro("prompt_chat_padrao", default="chat_padrao")
-            prompt_obj = obter_prompt(nome_prompt_usado)
-            system_prompt = prompt_obj['conteudo'].format(historico_texto="", context=contexto, question=pergunta) if prompt_obj else ""
-        else:
-            precisa_rag = False
-
-    if not precisa_rag:
-        nome_prompt_usado = obter_parametro("prompt_chat_geral", default="chat_geral")
-        prompt_obj = obter_prompt(nome_prompt_usado)
-        system_prompt = prompt_obj['conteudo'].format(pergunta=pergunta) if prompt_obj else ""
-        
-    dados_llm = await generate_chat_completion(
-        system_prompt=system_prompt,
-        user_message=pergunta,
-        model=obter_parametro("modelo", default="gpt-4o"),
-        temperature=float(obter_parametro("temperatura", default=0.0))
-    )
-    resposta_final = dados_llm.get("content", "Desculpe, não consegui gerar uma resposta no momento.")
+async def _montar_fontes(artigos: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Fontes no mesmo formato com ou sem cache semântico. No cache, os artigos são só
+    referências (sem 'resumo'); o resumo vem do índice local ou do Weaviate, pelo id.
+    """
+    sem_resumo = [a["id"] for a in artigos if "resumo" not in a and a.get("id")]
+    resumos: Dict[str, str] = {}
+    if sem_resumo:
+        resumos = {i: a.get("resumo") for i, a in (await buscar_artigos_por_ids(sem_resumo)).items()}
+    return montar_fontes_resposta(artigos, resumos)
 
-    tempo_total = round(time.time() - inicio, 2)
-    usage = dados_llm.get("usage")
-    
+def _formatar_inicio_sessao(detalhes_sessao: Optional[Dict[str, Any]]) -> Tuple[str, str]:
+    """Retorna a data e a hora de início da sessão no horário de Brasília."""
     data_inicio_sessao_str, hora_inicio_sessao_str = "N/A", ""
     if detalhes_sessao and 'criado_em' in detalhes_sessao:
         data_hora_formatada = formatar_timestamp_para_brt(detalhes_sessao['criado_em'])
@@ -73,32 +84,265 @@ async def processar_pergunta(pergunta: str, id_usuario: int) -> RespostaChat:
             partes = data_hora_formatada.split(" ")
             data_inicio_sessao_str = partes[0]
             hora_inicio_sessao_str = partes[1]
+    return data_inicio_sessao_str, hora_inicio_sessao_str
 
-    salvar_mensagem(
-        id_da_mensagem_a_atualizar=id_mensagem_pergunta,
+async def _preparar_resposta(pergunta: str, id_usuario: int, tempos_etapas: Dict[str, float]) -> Dict[str, Any]:
+    """
+    Executa tudo o que antecede a geração: sessão, mensagem, classificação, embedding,
+    cache semântico, busca RAG e montagem do prompt. Compartilhado entre o endpoint
+    com resposta completa e o endpoint com streaming.
+    """
+    usar_cache = cache_semantico_ativo()
+    # Lida antes dos prompts e parâmetros: se a configuração mudar durante a resposta,
+    # ela fica com a geração anterior e não entra no cache.
+    geracao_cache = geracao_cache_semantico()
+    # A mensagem é gravada só no final; 'criado_em' registra a chegada da pergunta.
+    criado_em = datetime.now(timezone.utc).isoformat()
+
+    # --- Etapa 1: ramos independentes em paralelo ---
+    # O embedding (seguido da consulta ao cache semântico) é iniciado enquanto a
+    # classificação roda; sem cache e sem necessidade de RAG, a tarefa é cancelada.
+    tarefa_embedding = asyncio.create_task(_obter_embedding_e_cache(pergunta, usar_cache, tempos_etapas))
+    try:
+        (id_sessao, detalhes_sessao, id_mensagem_pergunta), categoria = await asyncio.gather(
+            _preparar_sessao_e_mensagem(pergunta, id_usuario, tempos_etapas),
+            _cronometrar("classificacao", classificar_pergunta(pergunta), tempos_etapas),
+        )
+    except BaseException:
+        tarefa_embedding.cancel()
+        raise
+
+    precisa_rag = categoria not in ["social", "geral"]
+    logger.info(f"📚 Categoria: '{categoria}' | Precisa de RAG: {precisa_rag}")
+    
+    artigos_encontrados = []
+    system_prompt = ""
+    nome_prompt_usado = ""
+    embedding, entrada_cache = None, None
+    metadados_cache: Optional[Dict[str, Any]] = None
+
+    if usar_cache or precisa_rag:
+        embedding, entrada_cache = await tarefa_embedding
+    else:
+        tarefa_embedding.cancel()
+    if usar_cache:
+        metadados_cache = {"hit": entrada_cache is not None}
+
+    if entrada_cache:
+        # --- Cache semântico: reaproveita a resposta e pula a busca e a geração ---
+        metadados_origem = entrada_cache.get("metadados") or {}
+        metadados_cache.update({"mensagem_origem_id": entrada_cache["id"], "similaridade": round(entrada_cache["similarity"], 4)})
+        artigos_encontrados = metadados_origem.get("artigos_fonte") or []
+        precisa_rag = bool(metadados_origem.get("rag_utilizado", False))
+        nome_prompt_usado = metadados_origem.get("prompt_usado", "")
+    else:
+        # --- Etapa 2: recuperação (reaproveita o embedding especulativo) ---
+        if precisa_rag:
+            artigos_encontrados = await _cronometrar("busca_artigos", buscar_artigos_weaviate(pergunta, categoria, embedding), tempos_etapas)
+            if artigos_encontrados:
+                contexto = "\n\n---\n\n".join([f"Título: {a.get('title', '')}\nConteúdo: {a.get('content', '')}" for a in artigos_encontrados])
+                nome_prompt_usado = obter_parametro("prompt_chat_padrao", default="chat_padrao")
+                prompt_obj = obter_prompt(nome_prompt_usado)
+                system_prompt = prompt_obj['conteudo'].format(historico_texto="", context=contexto, question=pergunta) if prompt_obj else ""
+            else:
+                precisa_rag = False
+
+        if not precisa_rag:
+            nome_prompt_usado = obter_parametro("prompt_chat_geral", default="chat_geral")
+            prompt_obj = obter_prompt(nome_prompt_usado)
+            system_prompt = prompt_obj['conteudo'].format(pergunta=pergunta) if prompt_obj else ""
+
+    fontes = await _cronometrar("fontes", _montar_fontes(artigos_encontrados), tempos_etapas) if artigos_encontrados else []
+
+    return {
+        "id_sessao": id_sessao,
+        "detalhes_sessao": detalhes_sessao,
+        "id_mensagem": id_mensagem_pergunta,
+        "criado_em": criado_em,
+        "categoria": categoria,
+        "precisa_rag": precisa_rag,
+        "artigos": artigos_encontrados,
+        "fontes": fontes,
+        "system_prompt": system_prompt,
+        "nome_prompt": nome_prompt_usado,
+        "usar_cache": usar_cache,
+        "geracao_cache": geracao_cache,
+        "embedding": embedding,
+        "entrada_cache": entrada_cache,
+        "metadados_cache": metadados_cache,
+    }
+
+async def _salvar_resposta(
+    contexto: Dict[str, Any],
+    pergunta: str,
+    id_usuario: int,
+    resposta_final: str,
+    dados_llm: Dict[str, Any],
+    tempo_total: float,
+    tempos_etapas: Dict[str, float],
+    **extras: Any
+):
+    """
+    Persiste a mensagem completa (pergunta, resposta, uso, custo e tempos) numa única
+    escrita, agendada na fila de gravação em segundo plano.
+    """
+    usage = dados_llm.get("usage")
+    dados_mensagem = montar_dados_mensagem(
         pergunta=pergunta,
         resposta=resposta_final,
         usuario_id=id_usuario,
-        sessao_id=id_sessao,
+        sessao_id=contexto["id_sessao"],
         tipo_resposta="ia",
-        prompt_usado=nome_prompt_usado,
-        classificacao=categoria,
-        rag_utilizado=precisa_rag,
+        prompt_usado=contexto["nome_prompt"],
+        classificacao=contexto["categoria"],
+        rag_utilizado=contexto["precisa_rag"],
         custo_total=dados_llm.get("cost", 0.0),
         tokens_prompt=usage.prompt_tokens if usage else 0,
         tokens_completion=usage.completion_tokens if usage else 0,
-        artigos_fonte=artigos_encontrados,
-        tempo_processamento=tempo_total
+        artigos_fonte=contexto["artigos"],
+        tempo_processamento=tempo_total,
+        tempos_etapas=tempos_etapas,
+        cache_semantico=contexto["metadados_cache"],
+        # Só respostas geradas com sucesso (e completas) passam a alimentar o cache semântico.
+        embedding=contexto["embedding"] if (contexto["usar_cache"] and usage and not contexto["entrada_cache"] and not extras.get("interrompida")) else None,
+        **extras
     )
+    if "embedding" in dados_mensagem:
+        dados_mensagem["cache_geracao"] = contexto["geracao_cache"]
+    dados_mensagem["criado_em"] = contexto["criado_em"]
+    if contexto["id_mensagem"]:
+        dados_mensagem["id"] = contexto["id_mensagem"]
+    await gravar_mensagem(dados_mensagem)
+
+# Gravações de respostas interrompidas: referências mantidas até terminarem.
+_gravacoes_em_segundo_plano: Set["asyncio.Future[None]"] = set()
+
+def _salvar_em_segundo_plano(gravacao: Awaitable[None]):
+    """Agenda a gravação numa tarefa própria, que não é cancelada com a requisição."""
+    tarefa = asyncio.ensure_future(gravacao)
+    _gravacoes_em_segundo_plano.add(tarefa)
+    tarefa.add_done_callback(_gravacoes_em_segundo_plano.discard)
+
+def _parametros_geracao(contexto: Dict[str, Any], pergunta: str) -> Dict[str, Any]:
+    """Monta os argumentos da chamada ao LLM a partir do contexto preparado."""
+    return {
+        "system_prompt": contexto["system_prompt"],
+        "user_message": pergunta,
+        "model": obter_parametro("modelo", default="gpt-4o"),
+        "temperature": float(obter_parametro("temperatura", default=0.0)),
+    }
+
+async def processar_pergunta(pergunta: str, id_usuario: int) -> RespostaChat:
+    inicio = time.time()
+    logger.info(f"🧠 Pergunta recebida para Usuário ID {id_usuario}: '{pergunta}'")
+    tempos_etapas: Dict[str, float] = {}
+
+    contexto = await _preparar_resposta(pergunta, id_usuario, tempos_etapas)
+
+    if contexto["entrada_cache"]:
+        resposta_final = contexto["entrada_cache"]["resposta"]
+        dados_llm: Dict[str, Any] = {"content": resposta_final, "usage": None, "cost": 0.0}
+    else:
+        # --- Etapa 3: geração ---
+        dados_llm = await _cronometrar("geracao", generate_chat_completion(**_parametros_geracao(contexto, pergunta)), tempos_etapas)
+        resposta_final = dados_llm.get("content", "Desculpe, não consegui gerar uma resposta no momento.")
+
+    tempo_total = round(time.time() - inicio, 2)
+    logger.info(f"⏱️ Tempos por etapa (ms): {tempos_etapas} | Total: {tempo_total}s")
+    data_inicio_sessao_str, hora_inicio_sessao_str = _formatar_inicio_sessao(contexto["detalhes_sessao"])
+
+    await _salvar_resposta(contexto, pergunta, id_usuario, resposta_final, dados_llm, tempo_total, tempos_etapas)
 
     return RespostaChat(
-        id_mensagem=id_mensagem_pergunta,
-        id_sessao=id_sessao,
+        id_mensagem=contexto["id_mensagem"],
+        id_sessao=contexto["id_sessao"],
         data_inicio_sessao=data_inicio_sessao_str,
         hora_inicio_sessao=hora_inicio_sessao_str,
         resposta=resposta_final,
-        categoria=categoria,
-        artigos=artigos_encontrados,
+        categoria=contexto["categoria"],
+        artigos=contexto["fontes"],
         tempo_processamento=tempo_total,
-        prompt_usado=nome_prompt_usado
-    )
\ No newline at end of file
+        prompt_usado=contexto["nome_prompt"]
+    )
+
+async def processar_pergunta_stream(pergunta: str, id_usuario: int) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Versão com streaming de 'processar_pergunta'. Emite, nesta ordem, eventos de
+    'sessao', 'classificacao', 'fontes', vários 'token' e um 'fim' final. A mensagem
+    é agendada para gravação antes do evento 'fim', incluindo o tempo até o primeiro token;
+    se o cliente desconectar antes, a resposta parcial é gravada com 'interrompida'.
+    """
+    inicio = time.time()
+    logger.info(f"🧠 Pergunta (stream) recebida para Usuário ID {id_usuario}: '{pergunta}'")
+    tempos_etapas: Dict[str, float] = {}
+
+    contexto = await _preparar_resposta(pergunta, id_usuario, tempos_etapas)
+    data_inicio_sessao_str, hora_inicio_sessao_str = _formatar_inicio_sessao(contexto["detalhes_sessao"])
+
+    tempo_primeiro_token: Optional[float] = None
+    partes: List[str] = []
+    dados_llm: Dict[str, Any] = {"usage": None, "cost": 0.0}
+    inicio_geracao: Optional[float] = None
+    gravada = False
+    try:
+        yield {
+            "tipo": "sessao",
+            "id_sessao": contexto["id_sessao"],
+            "id_mensagem": contexto["id_mensagem"],
+            "data_inicio_sessao": data_inicio_sessao_str,
+            "hora_inicio_sessao": hora_inicio_sessao_str,
+        }
+        yield {"tipo": "classificacao", "categoria": contexto["categoria"], "prompt_usado": contexto["nome_prompt"]}
+        yield {
+            "tipo": "fontes",
+            "artigos": contexto["fontes"],
+        }
+
+        if contexto["entrada_cache"]:
+            resposta_final = contexto["entrada_cache"]["resposta"]
+            dados_llm["content"] = resposta_final
+            tempo_primeiro_token = round(time.time() - inicio, 2)
+            partes.append(resposta_final)
+            yield {"tipo": "token", "conteudo": resposta_final}
+        else:
+            # --- Etapa 3: geração com streaming ---
+            inicio_geracao = time.perf_counter()
+            async for evento in gerar_chat_completion_stream(**_parametros_geracao(contexto, pergunta)):
+                if evento["tipo"] == "token":
+                    if tempo_primeiro_token is None:
+                        tempo_primeiro_token = round(time.time() - inicio, 2)
+                        tempos_etapas["primeiro_token"] = round((time.perf_counter() - inicio_geracao) * 1000, 1)
+                    partes.append(evento["conteudo"])
+                    yield evento
+                else:
+                    dados_llm = {"usage": evento["usage"], "cost": evento["cost"]}
+            tempos_etapas["geracao"] = round((time.perf_counter() - inicio_geracao) * 1000, 1)
+            resposta_final = "".join(partes).strip() or "Desculpe, não consegui gerar uma resposta no momento."
+
+        tempo_total = round(time.time() - inicio, 2)
+        logger.info(f"⏱️ Tempos por etapa (ms): {tempos_etapas} | Primeiro token: {tempo_primeiro_token}s | Total: {tempo_total}s")
+
+        await _salvar_resposta(
+            contexto, pergunta, id_usuario, resposta_final, dados_llm, tempo_total, tempos_etapas,
+            tempo_primeiro_token=tempo_primeiro_token
+        )
+        gravada = True
+    finally:
+        if not gravada:
+            # Cliente desconectado (GeneratorExit/cancelamento no 'yield') ou erro na geração:
+            # grava o que foi gerado até aqui, fora desta tarefa, que pode estar sendo cancelada.
+            if inicio_geracao is not None and "geracao" not in tempos_etapas:
+                tempos_etapas["geracao"] = round((time.perf_counter() - inicio_geracao) * 1000, 1)
+            tempo_total = round(time.time() - inicio, 2)
+            logger.warning(f"⚠️ Resposta da mensagem ID {contexto['id_mensagem']} interrompida após {tempo_total}s; gravando a resposta parcial.")
+            _salvar_em_segundo_plano(_salvar_resposta(
+                contexto, pergunta, id_usuario, "".join(partes).strip(), dados_llm, tempo_total, tempos_etapas,
+                tempo_primeiro_token=tempo_primeiro_token, interrompida=True
+            ))
+
+    yield {
+        "tipo": "fim",
+        "id_mensagem": contexto["id_mensagem"],
+        "tempo_processamento": tempo_total,
+        "tempo_primeiro_token": tempo_primeiro_token,
+    }
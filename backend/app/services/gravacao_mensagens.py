@@ -0,0 +1,163 @@
+# app/services/gravacao_mensagens.py
+"""
+Gravação assíncrona (write-behind) das mensagens do chat.
+
+A resposta é devolvida ao usuário sem esperar o banco: a linha completa da
+mensagem (com o id já reservado) entra numa fila limitada e uma tarefa em
+segundo plano a grava em lotes, com novas tentativas. No shutdown a fila é
+esvaziada antes de os clientes serem fechados.
+"""
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+from app.core.cache import obter_parametro
+from app.core.clients import get_supabase_async_client
+from app.services.cache_semantico import resposta_obsoleta_para_cache
+
+logger = logging.getLogger(__name__)
+
+# Esperas entre as tentativas de gravação de um lote (em segundos)
+ESPERAS_NOVAS_TENTATIVAS = (0.5, 2, 5, 15)
+
+_fila: Optional["asyncio.Queue[Dict[str, Any]]"] = None
+_tarefa: Optional[asyncio.Task] = None
+# id da mensagem -> futuro resolvido quando a gravação termina (True = gravada)
+_pendentes: Dict[int, "asyncio.Future[bool]"] = {}
+_estatisticas = {"enfileiradas": 0, "gravadas": 0, "lotes": 0, "novas_tentativas": 0, "perdidas": 0, "removidas_do_cache": 0}
+
+
+async def _gravar_lote(lote: List[Dict[str, Any]]):
+    # Respostas que aguardavam na fila durante uma invalidação do cache semântico
+    # foram geradas com a configuração anterior e não devem alimentá-lo.
+    for mensagem in lote:
+        if mensagem.get("embedding") is not None and resposta_obsoleta_para_cache(mensagem):
+            mensagem["embedding"] = None
+            _estatisticas["removidas_do_cache"] += 1
+    supabase = get_supabase_async_client()
+    if all("id" in mensagem for mensagem in lote):
+        # upsert pelo id: se uma tentativa anterior chegou ao banco, repeti-la não duplica a linha.
+        await supabase.table("mensagens").upsert(lote, on_conflict="id", returning="minimal").execute()
+    else:
+        await supabase.table("mensagens").insert(lote, returning="minimal").execute()
+
+
+async def _gravar_com_novas_tentativas(lote: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Grava o lote; se continuar falhando, grava linha a linha. Retorna as mensagens não gravadas."""
+    for espera in (*ESPERAS_NOVAS_TENTATIVAS, None):
+        try:
+            await _gravar_lote(lote)
+            return []
+        except Exception as e:
+            if espera is None:
+                logger.error(f"❌ Falha ao gravar lote de {len(lote)} mensagens: {e}")
+                break
+            _estatisticas["novas_tentativas"] += 1
+            logger.warning(f"Erro ao gravar lote de {len(lote)} mensagens, nova tentativa em {espera}s: {e}")
+            await asyncio.sleep(espera)
+
+    if len(lote) == 1:
+        return lote
+    # Uma linha inválida não deve impedir a gravação das demais.
+    falhas = []
+    for mensagem in lote:
+        try:
+            await _gravar_lote([mensagem])
+        except Exception as e:
+            logger.error(f"❌ Mensagem ID {mensagem.get('id')} não pôde ser gravada: {e}")
+            falhas.append(mensagem)
+    return falhas
+
+
+def _resolver_pendentes(lote: List[Dict[str, Any]], falhas: List[Dict[str, Any]]):
+    ids_falhos = {m["id"] for m in falhas}
+    for mensagem in lote:
+        futuro = _pendentes.pop(mensagem["id"], None)
+        if futuro is not None and not futuro.done():
+            futuro.set_result(mensagem["id"] not in ids_falhos)
+
+
+async def _executar_gravacao(fila: "asyncio.Queue[Dict[str, Any]]"):
+    while True:
+        lote = [await fila.get()]
+        # Enquanto o lote anterior era gravado, outras mensagens se acumularam na fila.
+        lote_maximo = int(obter_parametro("mensagens_lote_maximo", default=50))
+        while len(lote) < lote_maximo and not fila.empty():
+            lote.append(fila.get_nowait())
+        try:
+            falhas = await _gravar_com_novas_tentativas(lote)
+            _estatisticas["lotes"] += 1
+            _estatisticas["gravadas"] += len(lote) - len(falhas)
+            _estatisticas["perdidas"] += len(falhas)
+            _resolver_pendentes(lote, falhas)
+        finally:
+            for _ in lote:
+                fila.task_done()
+
+
+def iniciar_gravacao_mensagens() -> asyncio.Task:
+    """Cria a fila (tamanho pelo parâmetro 'mensagens_fila_maxima') e agenda a tarefa de gravação."""
+    global _fila, _tarefa
+    _fila = asyncio.Queue(maxsize=int(obter_parametro("mensagens_fila_maxima", default=1000)))
+    _tarefa = asyncio.create_task(_executar_gravacao(_fila))
+    return _tarefa
+
+
+async def gravar_mensagem(dados_mensagem: Dict[str, Any]):
+    """
+    Agenda a gravação da mensagem completa (com 'id' reservado); com a fila cheia,
+    aguarda espaço. Sem id ou sem a gravação em segundo plano ativa, grava diretamente.
+    """
+    if "id" not in dados_mensagem or _fila is None or _tarefa is None or _tarefa.done():
+        try:
+            await _gravar_lote([dados_mensagem])
+        except Exception as e:
+            logger.error(f"Erro ao salvar mensagem: {e}")
+        return
+    _pendentes[dados_mensagem["id"]] = asyncio.get_running_loop().create_future()
+    try:
+        await _fila.put(dados_mensagem)
+    except BaseException:
+        _pendentes.pop(dados_mensagem["id"], None)
+        raise
+    _estatisticas["enfileiradas"] += 1
+
+
+async def aguardar_gravacao_mensagem(id_mensagem: int, timeout: float = 30.0) -> bool:
+    """
+    Aguarda a mensagem chegar ao banco (por exemplo, antes de gravar um feedback
+    que a referencia). Retorna False se a gravação falhou ou não terminou a tempo.
+    """
+    futuro = _pendentes.get(id_mensagem)
+    if futuro is None:
+        return True
+    try:
+        return await asyncio.wait_for(asyncio.shield(futuro), timeout)
+    except asyncio.TimeoutError:
+        return False
+
+
+async def encerrar_gravacao_mensagens(timeout: float = 30.0):
+    """Esvazia a fila (shutdown da aplicação) e encerra a tarefa de gravação."""
+    global _tarefa
+    if _fila is None or _tarefa is None:
+        return
+    if not _fila.empty() or _pendentes:
+        logger.info(f"💾 Gravando {_fila.qsize()} mensagens pendentes antes de encerrar...")
+    try:
+        await asyncio.wait_for(_fila.join(), timeout)
+    except asyncio.TimeoutError:
+        logger.error(f"❌ {_fila.qsize()} mensagens não foram gravadas antes do encerramento.")
+    _tarefa.cancel()
+    await asyncio.gather(_tarefa, return_exceptions=True)
+    _tarefa = None
+
+
+def obter_estatisticas_gravacao_mensagens() -> Dict[str, Any]:
+    return {
+        "ativa": _tarefa is not None and not _tarefa.done(),
+        "profundidade_fila": _fila.qsize() if _fila is not None else 0,
+        "fila_maxima": _fila.maxsize if _fila is not None else 0,
+        "aguardando_gravacao": len(_pendentes),
+        **_estatisticas,
+    }
@@ -2,13 +2,15 @@
 
 import logging
 import asyncio
+import random
 import httpx
 from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime, timezone, timedelta
 import re
-from app.core.clients import get_weaviate_client, get_openai_client
+from app.core.clients import get_weaviate_client, get_weaviate_async_client, gerar_embeddings_em_lote, recarregar_indice_local
 from app.core.config import get_settings
 from app.core.cache import obter_parametro
+from app.services.cache_semantico import invalidar_cache_semantico
 from weaviate.classes.config import Property, DataType
 from weaviate.collections.classes.filters import Filter
 from weaviate.collections.classes.data import DataObject
@@ -17,6 +19,10 @@ from weaviate.exceptions import WeaviateInsertManyAllFailedError
 from dateutil import parser
 import csv
 
+from app.utils.limitador_taxa import LimitadorTaxa
+from app.services.manifesto_artigos import descartar_manifesto
+from app.services.passagens_artigos import criar_colecao_passagens, remover_colecao_passagens, indexacao_por_passagens, indexar_passagens
+
 
 logger = logging.getLogger(__name__)
 import_status = {"in_progress": False, "message": "Nenhuma importação em andamento."}
@@ -51,6 +57,47 @@ def normalizar_data_movidesk(data_iso: str) -> Optional[str]:
     return normalizar_para_iso_brasilia(data_iso)
 
 
+# --- ACESSO À API DO MOVIDESK (LIMITE DE TAXA + RETENTATIVAS) ---
+_limitador_movidesk: Optional[LimitadorTaxa] = None
+
+def _obter_limitador_movidesk() -> LimitadorTaxa:
+    """Retorna o limitador de taxa compartilhado, recriando-o se o parâmetro mudar."""
+    global _limitador_movidesk
+    taxa = float(obter_parametro("movi_requisicoes_por_segundo", default=2))
+    if _limitador_movidesk is None or _limitador_movidesk.taxa_por_segundo != taxa:
+        _limitador_movidesk = LimitadorTaxa(taxa_por_segundo=taxa, capacidade=max(1, int(taxa)))
+    return _limitador_movidesk
+
+
+async def _requisitar_movidesk(client: httpx.AsyncClient, url: str, params: Dict[str, Any], timeout: float) -> httpx.Response:
+    """
+    Faz um GET na API do Movidesk respeitando o limite de taxa e repetindo a chamada,
+    com backoff exponencial, em erros de rede, 429 e 5xx.
+    """
+    max_tentativas = int(obter_parametro("movi_max_tentativas", default=4))
+    limitador = _obter_limitador_movidesk()
+    for tentativa in range(1, max_tentativas + 1):
+        await limitador.adquirir()
+        espera = min(30.0, 2 ** (tentativa - 1)) + random.uniform(0, 0.5)
+        try:
+            resp = await client.get(url, params=params, timeout=timeout)
+            if resp.status_code != 429 and resp.status_code < 500:
+                resp.raise_for_status()
+                return resp
+            if tentativa == max_tentativas:
+                resp.raise_for_status()
+            retry_after = resp.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                espera = float(retry_after)
+            logger.warning(f"Movidesk respondeu {resp.status_code} em {url} (tentativa {tentativa}/{max_tentativas}). Nova tentativa em {espera:.1f}s.")
+        except httpx.TransportError as e:
+            if tentativa == max_tentativas:
+                raise
+            logger.warning(f"Erro de rede ao chamar {url} (tentativa {tentativa}/{max_tentativas}): {e}. Nova tentativa em {espera:.1f}s.")
+        await asyncio.sleep(espera)
+    raise RuntimeError(f"Falha ao chamar {url} após {max_tentativas} tentativas.")
+
+
 async def buscar_lista_artigos(
     client: httpx.AsyncClient,
     pagina: int,
@@ -76,12 +123,7 @@ async def buscar_lista_artigos(
         "status": status,
     }
 
-    resp = await client.get(
-        base_url,
-        params=params,
-        timeout=30
-    )
-    resp.raise_for_status()
+    resp = await _requisitar_movidesk(client, base_url, params=params, timeout=30)
     data = resp.json()
     items = data if isinstance(data, list) else data.get("items", [])
 
@@ -100,8 +142,7 @@ async def buscar_detalhes_artigo(client: httpx.AsyncClient, artigo_id: int) -> O
     url = obter_parametro("movi_detail_url")
     if not url:
         return None
-    resp = await client.get(f"{url}/{artigo_id}", params={"token": settings.MOVI_TOKEN}, timeout=20)
-    resp.raise_for_status()
+    resp = await _requisitar_movidesk(client, f"{url}/{artigo_id}", params={"token": settings.MOVI_TOKEN}, timeout=20)
     art = resp.json()
     art["createdDate"] = normalizar_data_movidesk(art.get("createdDate"))
     art["updatedDate"] = normalizar_data_movidesk(art.get("updatedDate"))
@@ -111,16 +152,15 @@ async def buscar_detalhes_artigo(client: httpx.AsyncClient, artigo_id: int) -> O
 async def gerar_embedding_conteudo(conteudo: str) -> Optional[List[float]]:
     """Gera o embedding vetorial para um texto."""
     if not conteudo or not conteudo.strip(): return None
-    try:
-        return get_openai_client().embeddings.create(model=obter_parametro("embedding_model"), input=conteudo.replace("\n", " ")).data[0].embedding
-    except Exception as e:
-        logger.error(f"❌ Erro ao gerar embedding: {e}")
-        return None
+    return (await gerar_embeddings_em_lote([conteudo]))[0]
 
 async def verificar_e_criar_schema(resetar_base: bool = True):
     """Verifica e cria o schema 'Article' no Weaviate com todas as propriedades necessárias."""
     client = get_weaviate_client()
     collection_name = "Article"
+    if resetar_base:
+        # As passagens referenciam 'Article' e por isso são removidas antes.
+        remover_colecao_passagens()
     if resetar_base and client.collections.exists(collection_name):
         client.collections.delete(collection_name)
         await asyncio.sleep(2)
@@ -136,6 +176,107 @@ async def verificar_e_criar_schema(resetar_base: bool = True):
             Property(name="updatedDate", data_type=DataType.TEXT),
             Property(name="categoria", data_type=DataType.TEXT),
         ])
+    criar_colecao_passagens()
+
+# --- PROCESSAMENTO DE UM ARTIGO ---
+async def _processar_artigo(
+    client: httpx.AsyncClient,
+    collection,
+    item: Dict[str, Any],
+    reset_base: bool,
+    semaforo: asyncio.Semaphore,
+    contadores: Dict[str, int]
+) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """
+    Decide se um artigo da lista precisa ser (re)importado e, se sim, retorna o par
+    (uuid, propriedades). Os detalhes do artigo são buscados no Movidesk uma única
+    vez e reaproveitados na comparação e na montagem. O embedding é gerado depois,
+    em lote, por 'gravar_lote_artigos'.
+    """
+    aid = item.get("id")
+    if not aid:
+        logger.warning("Artigo sem ID recebido, pulado.")
+        contadores["falhas_datas"] += 1
+        return None
+
+    uuid = generate_uuid5(str(aid))
+    async with semaforo:
+        weav_date = None
+        motivo = "novo artigo"
+        obj = None
+        if not reset_base:
+            try:
+                obj = await collection.query.fetch_object_by_id(uuid=uuid)
+            except Exception as e:
+                logger.warning(f"Erro ao consultar o artigo {aid} no Weaviate, será reimportado: {e}")
+        try:
+            det = await buscar_detalhes_artigo(client, aid)
+        except Exception as e:
+            logger.error(f"Erro ao buscar detalhes do artigo {aid}: {e}")
+            contadores["falhas_detalhes"] += 1
+            return None
+
+        if obj is not None:
+            weav_date = obj.properties.get("updatedDate")
+            try:
+                raw_date = det.get("updatedDate") if det else None
+                t1 = converter_iso_para_timestamp_utc3(raw_date)
+                t2 = converter_iso_para_timestamp_utc3(weav_date)
+                if abs(t1 - t2) <= 1:
+                    logger.debug(f"Artigo {aid} sem alterações, pulado.")
+                    return None
+                motivo = "timestamps divergem"
+            except Exception:
+                contadores["falhas_datas"] += 1
+                motivo = "erro ao comparar datas"
+
+    raw_date = det.get("updatedDate") if det else None
+    logger.info(
+        f"Artigo {aid}: processar devido a {motivo}. MoviData: {raw_date!r}, WeavData: {weav_date!r}"
+    )
+
+    if not det or not det.get("contentText"):
+        contadores["pulados_sem_conteudo"] += 1
+        logger.warning(f"Artigo {aid} sem conteúdo, mas será importado.")
+
+    return uuid, montar_propriedades_artigo(aid, det)
+
+def montar_propriedades_artigo(aid: int, det: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Converte os detalhes de um artigo do Movidesk nas propriedades do objeto 'Article'."""
+    return {
+        "movidesk_id": aid,
+        "title": det.get("title", "") if det else "",
+        "content": det.get("contentText") or "" if det else "",
+        "resumo": det.get("shortContent", "") if det else "",
+        "status": det.get("statusDescription", "") if det else "",
+        "url": f"{obter_parametro('base_article_url','')}/{aid}/{det.get('slug','')}" if det else "",
+        "createdDate": det.get("createdDate") if det else None,
+        "updatedDate": det.get("updatedDate") if det else None,
+        "categoria": det.get("categoryName", "geral") if det else "geral"
+    }
+
+async def gravar_lote_artigos(collection, pendentes: List[Tuple[str, Dict[str, Any]]], contadores: Dict[str, int]) -> bool:
+    """
+    Gera os embeddings dos artigos pendentes em lote e grava os objetos no Weaviate.
+    Retorna False se a gravação do lote falhar.
+    """
+    vetores = await gerar_embeddings_em_lote([props["content"] for _, props in pendentes])
+    batch = []
+    for (uuid, props), vetor in zip(pendentes, vetores):
+        if not vetor:
+            contadores["pulados_embedding"] += 1
+            logger.warning(f"Artigo {props['movidesk_id']} sem embedding, mas será importado.")
+        batch.append(DataObject(properties=props, vector=vetor, uuid=uuid))
+    try:
+        await collection.data.insert_many(objects=batch)
+        contadores["enviados"] += len(batch)
+        logger.info(f"{len(batch)} artigos gravados no Weaviate")
+    except WeaviateInsertManyAllFailedError as e:
+        logger.error(f"Erro ao inserir lote de {len(batch)} artigos: {e}")
+        return False
+    if indexacao_por_passagens():
+        return await indexar_passagens(pendentes, contadores)
+    return True
 
 # --- FUNÇÃO PRINCIPAL DE IMPORTAÇÃO ---
 async def importar_artigos_movidesk(progresso_callback=None, reset_base: bool = True):
@@ -149,16 +290,23 @@ async def importar_artigos_movidesk(progresso_callback=None, reset_base: bool =
         "enviados": 0,
         "pulados_sem_conteudo": 0,
         "pulados_embedding": 0,
-        "falhas_datas": 0
+        "falhas_datas": 0,
+        "falhas_detalhes": 0,
+        "lotes_com_falha": 0
     }
     pagina = 0
     batch_size = int(obter_parametro("rag_search_limit", 30))
+    # Número máximo de artigos processados ao mesmo tempo (buscas de detalhes em voo)
+    semaforo = asyncio.Semaphore(int(obter_parametro("movi_concorrencia", default=5)))
+    # Artigos que aguardam embedding e gravação; são enviados em lotes deste tamanho
+    lote_gravacao = int(obter_parametro("importacao_lote_gravacao", default=100))
+    pendentes: List[Tuple[str, Dict[str, Any]]] = []
     # lista para CSV: armazena tuplas (id, titulo)
     all_artigos_meta: List[Tuple[int, str]] = []
 
     try:
         await verificar_e_criar_schema(resetar_base=reset_base)
-        collection = get_weaviate_client().collections.get("Article")
+        collection = get_weaviate_async_client().collections.get("Article")
 
         async with httpx.AsyncClient() as client:
             while True:
@@ -174,88 +322,46 @@ async def importar_artigos_movidesk(progresso_callback=None, reset_base: bool =
 
                 contadores["paginas"] += 1
                 logger.info(f"Página {pagina}: obtidos {len(artigos)} artigos")
-                batch = []
-
-                for item in artigos:
-                    aid = item.get("id")
-                    if not aid:
-                        logger.warning("Artigo sem ID recebido, pulado.")
-                        contadores["falhas_datas"] += 1
-                        continue
-
-                    uuid = generate_uuid5(str(aid))
-                    deve = False
-                    motivo = None
-
-                    # Verifica se precisa processar
-                    if reset_base or not collection.data.exists(uuid=uuid):
-                        deve = True
-                        motivo = "novo artigo"
-                    else:
-                        obj = collection.query.fetch_object_by_id(uuid=uuid)
-                        weav_date = obj.properties.get("updatedDate")
-                        try:
-                            det = await buscar_detalhes_artigo(client, aid)
-                            raw_date = det.get("updatedDate") if det else None
-                            t1 = converter_iso_para_timestamp_utc3(raw_date)
-                            t2 = converter_iso_para_timestamp_utc3(weav_date)
-                            if abs(t1 - t2) > 1:
-                                deve = True
-                                motivo = "timestamps divergem"
-                        except Exception:
-                            contadores["falhas_datas"] += 1
-                            deve = True
-                            motivo = "erro ao comparar datas"
-
-                    if not deve:
-                        logger.debug(f"Artigo {aid} sem alterações, pulado.")
-                        continue
-
-                    det = await buscar_detalhes_artigo(client, aid)
-                    raw_date = det.get("updatedDate") if det else None
-                    weav_date = weav_date if 'weav_date' in locals() else None
-                    logger.info(
-                        f"Artigo {aid}: processar devido a {motivo}. MoviData: {raw_date!r}, WeavData: {weav_date!r}"
-                    )
-
-                    if not det or not det.get("contentText"):
-                        contadores["pulados_sem_conteudo"] += 1
-                        logger.warning(f"Artigo {aid} sem conteúdo, mas será importado.")
-
-                    props = {
-                        "movidesk_id": aid,
-                        "title": det.get("title", "") if det else "",
-                        "content": det.get("contentText") or "" if det else "",
-                        "resumo": det.get("shortContent", "") if det else "",
-                        "status": det.get("statusDescription", "") if det else "",
-                        "url": f"{obter_parametro('base_article_url','')}/{aid}/{det.get('slug','')}" if det else "",
-                        "createdDate": det.get("createdDate") if det else None,
-                        "updatedDate": det.get("updatedDate") if det else None,
-                        "categoria": det.get("categoryName", "geral") if det else "geral"
-                    }
-                    vetor = await gerar_embedding_conteudo(props["content"])
-                    if not vetor:
-                        contadores["pulados_embedding"] += 1
-                        logger.warning(f"Artigo {aid} sem embedding, mas será importado.")
-
-                    batch.append(DataObject(properties=props, vector=vetor, uuid=uuid))
-
-                if batch:
-                    try:
-                        collection.data.insert_many(objects=batch)
-                        contadores["enviados"] += len(batch)
-                        logger.info(f"Página {pagina}: {len(batch)} artigos gravados no Weaviate")
-                    except WeaviateInsertManyAllFailedError as e:
-                        logger.error(f"Erro ao inserir batch página {pagina}: {e}")
+
+                resultados = await asyncio.gather(*[
+                    _processar_artigo(client, collection, item, reset_base, semaforo, contadores)
+                    for item in artigos
+                ])
+                pendentes.extend(r for r in resultados if r is not None)
+
+                if len(pendentes) >= lote_gravacao:
+                    if not await gravar_lote_artigos(collection, pendentes, contadores):
+                        contadores["lotes_com_falha"] += 1
+                    pendentes = []
 
                 pagina += 1
 
+            if pendentes:
+                if not await gravar_lote_artigos(collection, pendentes, contadores):
+                    contadores["lotes_com_falha"] += 1
+
         # Resumo final
         logger.info(
             f"Importação concluída: {contadores['paginas']} páginas, {contadores['enviados']} gravados, "
             f"{contadores['pulados_sem_conteudo']} sem conteúdo, "
-            f"{contadores['pulados_embedding']} sem embedding, {contadores['falhas_datas']} falhas de data"
+            f"{contadores['pulados_embedding']} sem embedding, {contadores['falhas_datas']} falhas de data, "
+            f"{contadores['falhas_detalhes']} falhas ao buscar detalhes, "
+            f"{contadores['lotes_com_falha']} lotes com falha na gravação"
         )
+        horario = datetime.now().strftime('%H:%M:%S')
+        if contadores["lotes_com_falha"]:
+            import_status["message"] = (
+                f"Importação concluída com falhas às {horario}: {contadores['lotes_com_falha']} lotes "
+                f"não foram gravados por completo ({contadores['enviados']} artigos gravados)."
+            )
+        else:
+            import_status["message"] = f"Importação concluída às {horario}: {contadores['enviados']} artigos gravados."
+
+        if contadores["enviados"] or reset_base:
+            await asyncio.to_thread(invalidar_cache_semantico, "base de artigos reimportada")
+            # O manifesto da sincronização incremental é reconstruído a partir do Weaviate na próxima execução.
+            await descartar_manifesto()
+            await recarregar_indice_local()
 
         # Gera CSV complementar com id e título
         csv_path = 'artigos_movidesk.csv'
@@ -0,0 +1,44 @@
+# app/services/manifesto_artigos.py
+"""
+Manifesto da base de conhecimento, usado pela sincronização incremental.
+
+Para cada artigo importado guarda o 'updatedAt' do Movidesk (como timestamp) e o
+hash do conteúdo embedado, no formato:
+    {"<movidesk_id>": {"atualizado_em": 1718000000.0, "hash": "<sha256>"}}
+O manifesto fica no banco (tabela 'manifesto_artigos'), compartilhado por todos
+os workers e instâncias: a sincronização pode rodar em qualquer um deles.
+"""
+import hashlib
+import logging
+from typing import Any, Dict, Optional
+
+from app.core.clients import get_supabase_async_client
+
+logger = logging.getLogger(__name__)
+
+
+def calcular_hash_conteudo(conteudo: Optional[str]) -> str:
+    """Hash do texto que é enviado ao modelo de embedding."""
+    return hashlib.sha256((conteudo or "").encode("utf-8")).hexdigest()
+
+
+async def carregar_manifesto() -> Optional[Dict[str, Dict[str, Any]]]:
+    """Lê o manifesto do banco. Retorna None se ele estiver vazio (deve ser reconstruído)."""
+    supabase = get_supabase_async_client()
+    response = await supabase.rpc("carregar_manifesto_artigos").execute()
+    return response.data or None
+
+
+async def salvar_manifesto(manifesto: Dict[str, Dict[str, Any]]):
+    """Substitui o manifesto do banco pelo informado, numa única transação."""
+    supabase = get_supabase_async_client()
+    await supabase.rpc("salvar_manifesto_artigos", {"p_manifesto": manifesto}).execute()
+
+
+async def descartar_manifesto():
+    """Esvazia o manifesto (ex.: após uma importação completa)."""
+    try:
+        await salvar_manifesto({})
+        logger.info("Manifesto de artigos descartado; será reconstruído na próxima sincronização.")
+    except Exception as e:
+        logger.warning(f"Não foi possível descartar o manifesto de artigos: {e}")
@@ -2,13 +2,103 @@
 """
 Serviço para gerenciar o salvamento e atualização de mensagens no banco de dados.
 """
+import asyncio
 import logging
-from typing import Dict, Any, Optional, List
-from app.core.clients import get_supabase_client
+from collections import deque
+from typing import Deque, Dict, Any, Optional, List
+from app.core.clients import get_supabase_async_client
 
 logger = logging.getLogger(__name__)
 
-def salvar_mensagem(
+# Ids reservados em bloco por 'reservar_ids_mensagens'; a maioria das perguntas
+# obtém o seu id sem ida ao banco.
+TAMANHO_RESERVA_IDS = 20
+_ids_reservados: Deque[int] = deque()
+_lock_reserva = asyncio.Lock()
+
+async def reservar_id_mensagem() -> int:
+    """Reserva o id da mensagem de uma pergunta, antes de a mensagem existir no banco. Retorna 0 em caso de erro."""
+    try:
+        async with _lock_reserva:
+            if not _ids_reservados:
+                supabase = get_supabase_async_client()
+                response = await supabase.rpc("reservar_ids_mensagens", {"p_quantidade": TAMANHO_RESERVA_IDS}).execute()
+                _ids_reservados.extend(int(i) for i in response.data or [])
+            return _ids_reservados.popleft()
+    except Exception as e:
+        logger.error(f"Erro ao reservar id de mensagem: {e}")
+        return 0
+
+# Campos de cada artigo guardados em 'metadados.artigos_fonte': a referência ao
+# artigo, sem o conteúdo (que continua no Weaviate).
+CAMPOS_REFERENCIA_ARTIGO = ("id", "movidesk_id", "title", "url", "score", "posicoes")
+
+def referenciar_artigos_fonte(artigos: Optional[List[Dict[str, Any]]]) -> Optional[List[Dict[str, Any]]]:
+    """Reduz os artigos usados como contexto às suas referências (id, movidesk_id, título, url, score, passagens)."""
+    if artigos is None:
+        return None
+    return [
+        {campo: artigo[campo] for campo in CAMPOS_REFERENCIA_ARTIGO if artigo.get(campo) is not None}
+        for artigo in artigos
+    ]
+
+def montar_fontes_resposta(artigos: List[Dict[str, Any]], resumos: Dict[str, str]) -> List[Dict[str, Any]]:
+    """
+    Fontes devolvidas ao cliente: a referência de cada artigo (todos os campos, None
+    quando ausentes) mais o 'resumo', do próprio artigo ou de 'resumos' (por id).
+    """
+    return [
+        {
+            **{campo: artigo.get(campo) for campo in CAMPOS_REFERENCIA_ARTIGO},
+            "resumo": artigo["resumo"] if "resumo" in artigo else resumos.get(artigo.get("id")),
+        }
+        for artigo in artigos
+    ]
+
+def montar_dados_mensagem(
+    pergunta: str,
+    resposta: str,
+    usuario_id: int,
+    sessao_id: int,
+    tipo_resposta: str,
+    **kwargs: Any
+) -> Dict[str, Any]:
+    """Monta a linha da tabela 'mensagens', com os dados extras da resposta em 'metadados'."""
+    # --- CORREÇÃO AQUI: Garantimos que o valor correto de 'rag_utilizado' seja salvo ---
+    # Ele vem do kwargs, que é preenchido no final do fluxo_chat.py
+    rag_final = kwargs.get("rag_utilizado", False)
+
+    metadados = {
+        "prompt_usado": kwargs.get("prompt_usado"),
+        "classificacao": kwargs.get("classificacao"),
+        "rag_utilizado": rag_final, # <-- USA A VARIÁVEL CORRIGIDA
+        "artigos_fonte": referenciar_artigos_fonte(kwargs.get("artigos_fonte")),
+        "custo_total": kwargs.get("custo_total"),
+        "tokens_prompt": kwargs.get("tokens_prompt"),
+        "tokens_completion": kwargs.get("tokens_completion"),
+        "tempo_processamento": kwargs.get("tempo_processamento"),
+        "tempo_primeiro_token": kwargs.get("tempo_primeiro_token"),
+        "tempos_etapas": kwargs.get("tempos_etapas"),
+        "cache_semantico": kwargs.get("cache_semantico"),
+        "interrompida": kwargs.get("interrompida")
+    }
+
+    metadados = {k: v for k, v in metadados.items() if v is not None}
+
+    dados_mensagem = {
+        "pergunta": pergunta,
+        "resposta": resposta,
+        "usuario_id": usuario_id,
+        "sessao_id": sessao_id,
+        "tipo_resposta": tipo_resposta,
+        "metadados": metadados
+    }
+    # O embedding da pergunta alimenta o cache semântico de respostas.
+    if kwargs.get("embedding") is not None:
+        dados_mensagem["embedding"] = kwargs["embedding"]
+    return dados_mensagem
+
+async def salvar_mensagem(
     pergunta: str,
     resposta: str,
     usuario_id: int,
@@ -21,41 +111,16 @@ def salvar_mensagem(
     Cria ou atualiza uma mensagem, salvando os metadados na coluna correta.
     """
     try:
-        supabase = get_supabase_client()
-        
-        # --- CORREÇÃO AQUI: Garantimos que o valor correto de 'rag_utilizado' seja salvo ---
-        # Ele vem do kwargs, que é preenchido no final do fluxo_chat.py
-        rag_final = kwargs.get("rag_utilizado", False)
-
-        metadados = {
-            "prompt_usado": kwargs.get("prompt_usado"),
-            "classificacao": kwargs.get("classificacao"),
-            "rag_utilizado": rag_final, # <-- USA A VARIÁVEL CORRIGIDA
-            "artigos_fonte": kwargs.get("artigos_fonte"),
-            "custo_total": kwargs.get("custo_total"),
-            "tokens_prompt": kwargs.get("tokens_prompt"),
-            "tokens_completion": kwargs.get("tokens_completion"),
-            "tempo_processamento": kwargs.get("tempo_processamento")
-        }
-
-        metadados = {k: v for k, v in metadados.items() if v is not None}
+        supabase = get_supabase_async_client()
+        dados_mensagem = montar_dados_mensagem(pergunta, resposta, usuario_id, sessao_id, tipo_resposta, **kwargs)
 
-        dados_mensagem = {
-            "pergunta": pergunta,
-            "resposta": resposta,
-            "usuario_id": usuario_id,
-            "sessao_id": sessao_id,
-            "tipo_resposta": tipo_resposta,
-            "metadados": metadados
-        }
-        
         if id_da_mensagem_a_atualizar:
-            logger.info(f"Atualizando mensagem ID: {id_da_mensagem_a_atualizar} com metadados RAG: {rag_final}")
-            response = supabase.table("mensagens").update(dados_mensagem).eq("id", id_da_mensagem_a_atualizar).execute()
+            logger.info(f"Atualizando mensagem ID: {id_da_mensagem_a_atualizar} com metadados RAG: {dados_mensagem['metadados'].get('rag_utilizado')}")
+            response = await supabase.table("mensagens").update(dados_mensagem).eq("id", id_da_mensagem_a_atualizar).execute()
             return id_da_mensagem_a_atualizar
         else:
             logger.info(f"Criando nova mensagem para a sessão {sessao_id}")
-            response = supabase.table("mensagens").insert(dados_mensagem).execute()
+            response = await supabase.table("mensagens").insert(dados_mensagem).execute()
             novo_id_mensagem = response.data[0]['id']
             logger.info(f"Mensagem ID: {novo_id_mensagem} criada com sucesso.")
             return novo_id_mensagem
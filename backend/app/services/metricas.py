@@ -1,197 +1,204 @@
 # app/services/metricas.py
+import asyncio
 import logging
-import numpy as np
-import pandas as pd
-from typing import Dict, Any, List, Optional
-from collections import Counter
-from datetime import date, timedelta, datetime
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import date, datetime, timezone
 
-from app.core.clients import get_supabase_client
+from app.core.cache import obter_parametro
+from app.core.clients import get_supabase_async_client
+from app.utils.cache_lru import CacheLRU
 from app.utils.time_utils import formatar_timestamp_para_brt
 
 logger = logging.getLogger(__name__)
 
-def _apply_date_filter(query, data_inicio: Optional[date], data_fim: Optional[date]):
-    """Função auxiliar para aplicar filtros de data a uma query Supabase."""
-    if data_inicio:
-        query = query.gte("criado_em", data_inicio.isoformat())
-    if data_fim:
-        end_date = data_fim + timedelta(days=1)
-        query = query.lt("criado_em", end_date.isoformat())
-    return query
+def _parametros_periodo(data_inicio: Optional[date], data_fim: Optional[date]) -> Dict[str, Optional[str]]:
+    """Converte o período nos parâmetros das funções de métricas do banco (datas inclusivas)."""
+    return {
+        "p_inicio": data_inicio.isoformat() if data_inicio else None,
+        "p_fim": data_fim.isoformat() if data_fim else None,
+    }
 
-def coletar_ultimas_interacoes() -> Dict[str, Any]:
-    """Coleta as 10 últimas interações de IA para monitoramento em tempo real."""
-    try:
-        supabase = get_supabase_client()
-        result = (
-            supabase.table("mensagens")
-            # --- CORREÇÃO: Selecionando todas as colunas para depuração ---
-            .select("*")
-            .eq("tipo_resposta", "ia")
-            .order("criado_em", desc=True)
-            .limit(10)
-            .execute()
-        )
-
-        if not result.data:
-            return {"ultimas_interacoes": []}
-
-        interacoes = [
-            {
-                "Data/Hora": formatar_timestamp_para_brt(item.get('criado_em')),
-                "Pergunta": item.get('pergunta', 'N/A'),
-                "Categoria": item.get('metadados', {}).get('classificacao', 'N/A'),
-                "Tempo (s)": item.get('metadados', {}).get('tempo_processamento', 0)
-            }
-            for item in result.data
-        ]
-        return {"ultimas_interacoes": interacoes}
-    except Exception as e:
-        logger.error(f"Erro ao coletar últimas interações: {e}")
-        return {}
-
-def coletar_historico_desempenho(data_inicio: Optional[date], data_fim: Optional[date]) -> Dict[str, Any]:
-    """Busca dados diários de tempo de resposta para criar um gráfico de histórico."""
-    try:
-        supabase = get_supabase_client()
-        query = supabase.table("mensagens").select("criado_em, metadados->>tempo_processamento")
-        query = _apply_date_filter(query, data_inicio, data_fim)
-        result = query.execute()
-
-        if not result.data:
-            return {"historico_desempenho": []}
-
-        df = pd.DataFrame(result.data)
-        df = df.rename(columns={'f1': 'tempo_processamento'})
-        df['tempo_processamento'] = pd.to_numeric(df['tempo_processamento'], errors='coerce')
-        df = df.dropna(subset=['tempo_processamento'])
-        df['dia'] = pd.to_datetime(df['criado_em']).dt.date
-        
-        historico = df.groupby('dia')['tempo_processamento'].mean().round(2).reset_index()
-        historico.columns = ['Data', 'Tempo Médio (s)']
-        
-        return {"historico_desempenho": historico.to_dict('records')}
-    except Exception as e:
-        logger.error(f"Erro ao coletar histórico de desempenho: {e}")
-        return {}
-        
-def coletar_metricas_gerais(data_inicio: Optional[date] = None, data_fim: Optional[date] = None) -> Dict[str, Any]:
-    try:
-        supabase = get_supabase_client()
-        sessoes_query = supabase.table("sessoes").select("count", count="exact")
-        sessoes_query = _apply_date_filter(sessoes_query, data_inicio, data_fim)
-        sessions_result = sessoes_query.execute()
-        mensagens_query = supabase.table("mensagens").select("count", count="exact")
-        mensagens_query = _apply_date_filter(mensagens_query, data_inicio, data_fim)
-        messages_result = mensagens_query.execute()
-        users_result = supabase.table("usuarios").select("count", count="exact").execute()
-        return {
-            "total_usuarios": users_result.count,
-            "total_sessoes_periodo": sessions_result.count,
-            "total_mensagens_periodo": messages_result.count,
-        }
-    except Exception as e:
-        logger.error(f"Erro ao coletar métricas gerais: {e}")
-        return {}
-        
-def coletar_metricas_feedback(data_inicio: Optional[date] = None, data_fim: Optional[date] = None) -> Dict[str, Any]:
-    try:
-        supabase = get_supabase_client()
-        query = supabase.table("feedbacks").select("id, tipo")
-        query = _apply_date_filter(query, data_inicio, data_fim)
-        feedbacks_result = query.execute()
-        total_feedbacks = len(feedbacks_result.data)
-        positivos = sum(1 for f in feedbacks_result.data if f.get('tipo') == 'positivo')
-        negativos = total_feedbacks - positivos
-        return {
-            "total_feedbacks_periodo": total_feedbacks,
-            "feedbacks_positivos_periodo": positivos,
-            "feedbacks_negativos_periodo": negativos,
-            "percentual_positivos_periodo": round((positivos / total_feedbacks) * 100, 2) if total_feedbacks > 0 else 0,
-        }
-    except Exception as e:
-        logger.error(f"Erro ao coletar métricas de feedback: {e}")
-        return {}
-
-def coletar_metricas_desempenho(data_inicio: Optional[date] = None, data_fim: Optional[date] = None) -> Dict[str, Any]:
-    try:
-        supabase = get_supabase_client()
-        query = supabase.table("mensagens").select("metadados").order("criado_em", desc=True).limit(500)
-        query = _apply_date_filter(query, data_inicio, data_fim)
-        result = query.execute()
-        if not result.data: return {}
-        tempos = [float(item["metadados"].get("tempo_processamento")) for item in result.data if isinstance(item.get("metadados"), dict) and item["metadados"].get("tempo_processamento") is not None]
-        if not tempos: return {}
-        return {
-            "tempo_medio_resposta_s": round(np.mean(tempos), 2),
-            "tempo_minimo_resposta_s": round(min(tempos), 2),
-            "tempo_maximo_resposta_s": round(max(tempos), 2),
-            "tempo_percentil_95_s": round(np.percentile(tempos, 95), 2),
-            "amostras_coletadas": len(tempos)
-        }
-    except Exception as e:
-        logger.error(f"Erro ao coletar métricas de desempenho: {e}")
-        return {}
-
-def coletar_metricas_engajamento(data_inicio: Optional[date] = None, data_fim: Optional[date] = None) -> Dict[str, Any]:
-    try:
-        supabase = get_supabase_client()
-        query = supabase.table("mensagens").select("usuario_id(id, nome)")
-        query = _apply_date_filter(query, data_inicio, data_fim)
-        mensagens_response = query.execute()
-        if not mensagens_response.data: return {"top_10_usuarios_periodo": []}
-        user_names = [msg['usuario_id']['nome'] for msg in mensagens_response.data if msg.get('usuario_id') and msg['usuario_id'].get('nome')]
-        user_counts = Counter(user_names)
-        top_10_list = [{"nome": name, "mensagens": count} for name, count in user_counts.most_common(10)]
-        return {"top_10_usuarios_periodo": top_10_list}
-    except Exception as e:
-        logger.error(f"Erro ao coletar métricas de engajamento: {e}")
-        return {}
-
-def coletar_metricas_custo_e_rag(data_inicio: Optional[date] = None, data_fim: Optional[date] = None) -> Dict[str, Any]:
-    try:
-        supabase = get_supabase_client()
-        query = supabase.table("mensagens").select("metadados, tipo_resposta").eq("tipo_resposta", "ia")
-        query = _apply_date_filter(query, data_inicio, data_fim)
-        result = query.execute()
-        if not result.data:
-            return {"custo_total_usd_periodo": 0, "custo_medio_por_msg_usd": 0, "percentual_respostas_com_rag_periodo": 0, "top_5_categorias_periodo": []}
-        all_metadata = [item['metadados'] for item in result.data if isinstance(item.get('metadados'), dict)]
-        total_cost = sum(meta.get('custo_total', 0) for meta in all_metadata if meta.get('custo_total') is not None)
-        rag_count = sum(1 for meta in all_metadata if meta.get('rag_utilizado') is True)
-        total_ia_messages = len(all_metadata)
-        classifications = [meta.get('classificacao') for meta in all_metadata if meta.get('classificacao')]
-        classification_counts = Counter(classifications)
-        top_5_categories = [{"categoria": cat, "quantidade": count} for cat, count in classification_counts.most_common(5)]
-        return {
-            "custo_total_usd_periodo": round(total_cost, 6),
-            "custo_medio_por_msg_usd": round(total_cost / total_ia_messages, 6) if total_ia_messages > 0 else 0,
-            "percentual_respostas_com_rag_periodo": round((rag_count / total_ia_messages) * 100, 2) if total_ia_messages > 0 else 0,
-            "top_5_categorias_periodo": top_5_categories
+# Seção do painel -> fonte de dados que a atende. Seções da mesma fonte são
+# resolvidas numa única consulta; fontes diferentes rodam em paralelo.
+FONTE_POR_SECAO = {
+    "gerais": "periodo",
+    "feedback": "periodo",
+    "desempenho": "periodo",
+    "engajamento": "periodo",
+    "custo_rag": "periodo",
+    "historico": "periodo",
+    "ultimas_interacoes": "ultimas_interacoes",
+}
+
+async def _buscar_periodo(secoes: List[str], data_inicio: Optional[date], data_fim: Optional[date]) -> Dict[str, Any]:
+    """Uma chamada a 'metricas_consolidadas', que lê as linhas diárias do período uma só vez."""
+    supabase = get_supabase_async_client()
+    result = await supabase.rpc("metricas_consolidadas", {
+        **_parametros_periodo(data_inicio, data_fim),
+        "p_secoes": secoes,
+        "p_limite_usuarios": 10,
+        "p_limite_categorias": 5,
+    }).execute()
+    return result.data or {}
+
+async def _buscar_ultimas_interacoes(secoes: List[str], data_inicio: Optional[date], data_fim: Optional[date]) -> Dict[str, Any]:
+    """As 10 últimas interações de IA, para monitoramento em tempo real (independe do período)."""
+    supabase = get_supabase_async_client()
+    result = await (
+        supabase.table("mensagens")
+        .select("criado_em, pergunta, classificacao:metadados->>classificacao, tempo_processamento:metadados->tempo_processamento")
+        .eq("tipo_resposta", "ia")
+        .order("criado_em", desc=True)
+        .limit(10)
+        .execute()
+    )
+    interacoes = [
+        {
+            "Data/Hora": formatar_timestamp_para_brt(item.get('criado_em')),
+            "Pergunta": item.get('pergunta', 'N/A'),
+            "Categoria": item.get('classificacao') or 'N/A',
+            "Tempo (s)": item.get('tempo_processamento') or 0
         }
-    except Exception as e:
-        logger.error(f"Erro ao coletar métricas de custo e RAG: {e}")
-        return {}
+        for item in result.data or []
+    ]
+    return {"ultimas_interacoes": {"ultimas_interacoes": interacoes}}
 
-def obter_todas_metricas(data_inicio: Optional[date] = None, data_fim: Optional[date] = None) -> Dict[str, Any]:
-    """Orquestra a coleta de todas as métricas."""
-    logger.info(f"Coletando métricas para o período de {data_inicio} a {data_fim}")
-    
-    metricas_gerais = coletar_metricas_gerais(data_inicio, data_fim)
-    metricas_feedback = coletar_metricas_feedback(data_inicio, data_fim)
-    metricas_desempenho = coletar_metricas_desempenho(data_inicio, data_fim)
-    metricas_engajamento = coletar_metricas_engajamento(data_inicio, data_fim)
-    metricas_custo_rag = coletar_metricas_custo_e_rag(data_inicio, data_fim)
-    metricas_historico = coletar_historico_desempenho(data_inicio, data_fim)
-    metricas_ultimas_interacoes = coletar_ultimas_interacoes()
+_BUSCAS_POR_FONTE = {
+    "periodo": _buscar_periodo,
+    "ultimas_interacoes": _buscar_ultimas_interacoes,
+}
+
+async def _executar_plano(secoes: List[str], data_inicio: Optional[date], data_fim: Optional[date]) -> Tuple[Dict[str, Dict[str, Any]], bool]:
+    """
+    Monta o plano de busca (fonte -> seções), executa as fontes em paralelo e devolve
+    o resultado de cada seção e se alguma fonte falhou. Uma fonte com erro resulta em
+    seções vazias, sem derrubar as demais.
+    """
+    plano: Dict[str, List[str]] = {}
+    for secao in secoes:
+        plano.setdefault(FONTE_POR_SECAO[secao], []).append(secao)
+
+    resultados = await asyncio.gather(
+        *(_BUSCAS_POR_FONTE[fonte](secoes_fonte, data_inicio, data_fim) for fonte, secoes_fonte in plano.items()),
+        return_exceptions=True,
+    )
+
+    por_secao: Dict[str, Dict[str, Any]] = {}
+    houve_erro = False
+    for (fonte, secoes_fonte), resultado in zip(plano.items(), resultados):
+        if isinstance(resultado, Exception):
+            logger.error(f"Erro ao coletar as métricas da fonte '{fonte}' ({', '.join(secoes_fonte)}): {resultado}")
+            resultado, houve_erro = {}, True
+        for secao in secoes_fonte:
+            por_secao[secao] = resultado.get(secao) or {}
+    return por_secao, houve_erro
+
+# --- Cache de resultados ---
+# Chave: (endpoint, data_inicio, data_fim). Períodos que incluem o dia atual (ou as
+# últimas interações) mudam a cada mensagem e ficam pouco tempo em cache; períodos
+# encerrados só mudam na consolidação e podem ficar horas.
+_cache_metricas = CacheLRU(tamanho_maximo=256)
+# Cálculos em andamento: requisições idênticas e simultâneas aguardam o mesmo cálculo.
+_calculos_em_andamento: Dict[Tuple, "asyncio.Future[Dict[str, Dict[str, Any]]]"] = {}
+_requisicoes_compartilhadas = 0
+
+def _ttl_metricas(secoes: List[str], data_fim: Optional[date]) -> float:
+    hoje = datetime.now(timezone.utc).date()
+    periodo_aberto = data_fim is None or data_fim >= hoje or "ultimas_interacoes" in secoes
+    if periodo_aberto:
+        return float(obter_parametro("metricas_cache_ttl_segundos", default=60))
+    return float(obter_parametro("metricas_cache_ttl_historico_segundos", default=21600))
+
+async def _calcular_e_guardar(chave: Tuple, secoes: List[str], data_inicio: Optional[date], data_fim: Optional[date]) -> Dict[str, Dict[str, Any]]:
+    por_secao, houve_erro = await _executar_plano(secoes, data_inicio, data_fim)
+    ttl = _ttl_metricas(secoes, data_fim)
+    # Resultados parciais (fonte com erro) não são guardados.
+    if not houve_erro and ttl > 0:
+        _cache_metricas.guardar(chave, por_secao, ttl_segundos=ttl)
+    return por_secao
+
+async def coletar_secoes(endpoint: str, secoes: List[str], data_inicio: Optional[date] = None, data_fim: Optional[date] = None) -> Dict[str, Dict[str, Any]]:
+    """Resultado de cada seção pedida, vindo do cache ou de um único cálculo compartilhado."""
+    global _requisicoes_compartilhadas
+    chave = (endpoint, data_inicio, data_fim)
+    em_cache = _cache_metricas.obter(chave)
+    if em_cache is not None:
+        return em_cache
 
+    calculo = _calculos_em_andamento.get(chave)
+    if calculo is None:
+        calculo = asyncio.ensure_future(_calcular_e_guardar(chave, secoes, data_inicio, data_fim))
+        _calculos_em_andamento[chave] = calculo
+        calculo.add_done_callback(lambda _: _calculos_em_andamento.pop(chave, None))
+    else:
+        _requisicoes_compartilhadas += 1
+    # shield: se um cliente desconectar, o cálculo continua para os demais que aguardam.
+    return await asyncio.shield(calculo)
+
+def obter_estatisticas_cache_metricas() -> Dict[str, Any]:
     return {
-        **metricas_gerais, 
-        **metricas_feedback, 
-        **metricas_desempenho,
-        **metricas_engajamento,
-        **metricas_custo_rag,
-        **metricas_historico,
-        **metricas_ultimas_interacoes
+        **_cache_metricas.estatisticas(),
+        "calculos_em_andamento": len(_calculos_em_andamento),
+        "requisicoes_compartilhadas": _requisicoes_compartilhadas,
     }
+
+async def _coletar_secao(secao: str, data_inicio: Optional[date], data_fim: Optional[date]) -> Dict[str, Any]:
+    return (await coletar_secoes(secao, [secao], data_inicio, data_fim))[secao]
+
+async def coletar_ultimas_interacoes() -> Dict[str, Any]:
+    """Coleta as 10 últimas interações de IA para monitoramento em tempo real."""
+    return await _coletar_secao("ultimas_interacoes", None, None)
+
+async def coletar_historico_desempenho(data_inicio: Optional[date], data_fim: Optional[date]) -> Dict[str, Any]:
+    """Tempo médio de resposta por dia, para o gráfico de histórico."""
+    return await _coletar_secao("historico", data_inicio, data_fim)
+
+async def coletar_metricas_gerais(data_inicio: Optional[date] = None, data_fim: Optional[date] = None) -> Dict[str, Any]:
+    return await _coletar_secao("gerais", data_inicio, data_fim)
+
+async def coletar_metricas_feedback(data_inicio: Optional[date] = None, data_fim: Optional[date] = None) -> Dict[str, Any]:
+    return await _coletar_secao("feedback", data_inicio, data_fim)
+
+async def coletar_metricas_desempenho(data_inicio: Optional[date] = None, data_fim: Optional[date] = None) -> Dict[str, Any]:
+    """Média, mínimo, máximo e percentil 95 do tempo de resposta no período."""
+    return await _coletar_secao("desempenho", data_inicio, data_fim)
+
+async def coletar_metricas_engajamento(data_inicio: Optional[date] = None, data_fim: Optional[date] = None) -> Dict[str, Any]:
+    return await _coletar_secao("engajamento", data_inicio, data_fim)
+
+async def coletar_metricas_custo_e_rag(data_inicio: Optional[date] = None, data_fim: Optional[date] = None) -> Dict[str, Any]:
+    return await _coletar_secao("custo_rag", data_inicio, data_fim)
+
+async def consolidar_metricas_diarias() -> int:
+    """Consolida em 'metricas_diarias' os dias encerrados ainda pendentes; retorna quantos dias processou."""
+    supabase = get_supabase_async_client()
+    result = await supabase.rpc("atualizar_metricas_diarias_pendentes", {}).execute()
+    return int(result.data or 0)
+
+async def _executar_consolidacao_periodica():
+    """Laço da consolidação diária; roda ao iniciar e depois a cada intervalo (relido a cada ciclo)."""
+    while True:
+        intervalo_minutos = float(obter_parametro("metricas_consolidacao_intervalo_minutos", default=60))
+        if intervalo_minutos <= 0:
+            await asyncio.sleep(60)
+            continue
+        try:
+            dias = await consolidar_metricas_diarias()
+            if dias:
+                logger.info(f"📊 Métricas diárias consolidadas: {dias} dia(s) processado(s).")
+        except Exception as e:
+            logger.error(f"❌ Erro ao consolidar as métricas diárias: {e}")
+        await asyncio.sleep(intervalo_minutos * 60)
+
+def iniciar_consolidacao_metricas() -> asyncio.Task:
+    """Agenda a consolidação periódica das métricas (parâmetro 'metricas_consolidacao_intervalo_minutos', 0 = desligada)."""
+    return asyncio.create_task(_executar_consolidacao_periodica())
+
+async def obter_todas_metricas(data_inicio: Optional[date] = None, data_fim: Optional[date] = None) -> Dict[str, Any]:
+    """Orquestra a coleta de todas as métricas: duas consultas em paralelo (período e últimas interações)."""
+    logger.info(f"Coletando métricas para o período de {data_inicio} a {data_fim}")
+    secoes = await coletar_secoes("todas", list(FONTE_POR_SECAO), data_inicio, data_fim)
+    metricas: Dict[str, Any] = {}
+    for resultado in secoes.values():
+        metricas.update(resultado)
+    return metricas
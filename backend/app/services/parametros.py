@@ -8,6 +8,7 @@ from typing import Any
 
 from app.core.clients import get_supabase_client
 from app.core.cache import carregar_parametros_para_cache
+from app.services.cache_semantico import invalidar_cache_semantico, PARAMETROS_QUE_INVALIDAM_CACHE
 
 logger = logging.getLogger(__name__)
 
@@ -22,8 +23,12 @@ def atualizar_parametro(nome: str, valor: Any) -> bool:
         # Atualiza o valor na tabela 'parametros'
         supabase.table("parametros").update({"valor": str(valor)}).eq("nome", nome).execute()
         
-        # Recarrega todos os parâmetros para o cache em memória para refletir a mudança
+        # Recarrega os parâmetros deste worker na hora; os demais workers e instâncias
+        # aplicam a mudança na próxima verificação periódica da configuração.
         carregar_parametros_para_cache(supabase)
+
+        if nome in PARAMETROS_QUE_INVALIDAM_CACHE:
+            invalidar_cache_semantico(f"parâmetro '{nome}' alterado")
         
         logger.info(f"Parâmetro '{nome}' atualizado e cache recarregado com sucesso.")
         return True
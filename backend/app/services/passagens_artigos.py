@@ -0,0 +1,114 @@
+# app/services/passagens_artigos.py
+"""
+Indexação de artigos em passagens (trechos sobrepostos) na coleção 'ArticlePassage'.
+
+Cada passagem guarda uma referência ao objeto 'Article' de origem, além de
+'movidesk_id', título, URL e categoria copiados do artigo para que a busca não
+precise resolver a referência. Ativada pelo parâmetro 'indexacao_modo' = 'passagens'.
+"""
+import logging
+from typing import Any, Dict, Iterable, List, Tuple
+
+from weaviate.classes.config import Property, DataType, ReferenceProperty
+from weaviate.classes.query import Filter
+from weaviate.collections.classes.data import DataObject
+from weaviate.util import generate_uuid5
+
+from app.core.cache import obter_parametro
+from app.core.clients import get_weaviate_client, get_weaviate_async_client, gerar_embeddings_em_lote
+from app.utils.tokens import dividir_em_trechos
+
+logger = logging.getLogger(__name__)
+
+COLECAO_PASSAGENS = "ArticlePassage"
+
+
+def indexacao_por_passagens() -> bool:
+    """Indica se a base deve ser indexada e consultada por passagens."""
+    return str(obter_parametro("indexacao_modo", default="artigo")).strip().lower() == "passagens"
+
+
+def remover_colecao_passagens():
+    """Remove a coleção de passagens (deve ocorrer antes de remover 'Article', que ela referencia)."""
+    client = get_weaviate_client()
+    if client.collections.exists(COLECAO_PASSAGENS):
+        client.collections.delete(COLECAO_PASSAGENS)
+
+
+def criar_colecao_passagens():
+    """Cria a coleção 'ArticlePassage' se ainda não existir."""
+    client = get_weaviate_client()
+    if client.collections.exists(COLECAO_PASSAGENS):
+        return
+    client.collections.create(
+        name=COLECAO_PASSAGENS,
+        properties=[
+            Property(name="movidesk_id", data_type=DataType.INT),
+            Property(name="posicao", data_type=DataType.INT),
+            Property(name="title", data_type=DataType.TEXT),
+            Property(name="content", data_type=DataType.TEXT),
+            Property(name="url", data_type=DataType.TEXT),
+            Property(name="categoria", data_type=DataType.TEXT),
+        ],
+        references=[ReferenceProperty(name="artigo", target_collection="Article")],
+    )
+
+
+def montar_passagens(uuid_artigo: str, props: Dict[str, Any]) -> List[DataObject]:
+    """Divide o conteúdo do artigo em passagens sobrepostas (sem vetor ainda)."""
+    conteudo = (props.get("content") or "").strip()
+    if not conteudo:
+        return []
+    modelo = obter_parametro("embedding_model", default="text-embedding-ada-002")
+    max_tokens = int(obter_parametro("passagem_max_tokens", default=300))
+    sobreposicao = int(obter_parametro("passagem_sobreposicao_tokens", default=50))
+    aid = props.get("movidesk_id")
+    return [
+        DataObject(
+            uuid=generate_uuid5(f"{aid}:{posicao}"),
+            properties={
+                "movidesk_id": aid,
+                "posicao": posicao,
+                "title": props.get("title", ""),
+                "content": trecho,
+                "url": props.get("url", ""),
+                "categoria": props.get("categoria", "geral"),
+            },
+            references={"artigo": uuid_artigo},
+        )
+        for posicao, trecho in enumerate(dividir_em_trechos(conteudo, modelo, max_tokens, sobreposicao))
+    ]
+
+
+async def remover_passagens(movidesk_ids: Iterable[int]):
+    """Apaga todas as passagens dos artigos informados."""
+    ids = [int(aid) for aid in movidesk_ids]
+    if not ids:
+        return
+    collection = get_weaviate_async_client().collections.get(COLECAO_PASSAGENS)
+    await collection.data.delete_many(where=Filter.by_property("movidesk_id").contains_any(ids))
+
+
+async def indexar_passagens(artigos: List[Tuple[str, Dict[str, Any]]], contadores: Dict[str, int]) -> bool:
+    """
+    Substitui as passagens dos artigos informados: apaga as antigas (o número de
+    trechos pode ter mudado), gera os embeddings em lote e grava as novas.
+    """
+    objetos = [obj for uuid, props in artigos for obj in montar_passagens(uuid, props)]
+    try:
+        await remover_passagens(props["movidesk_id"] for _, props in artigos)
+        if not objetos:
+            return True
+        vetores = await gerar_embeddings_em_lote([obj.properties["content"] for obj in objetos])
+        objetos = [
+            DataObject(properties=obj.properties, uuid=obj.uuid, vector=vetor, references=obj.references)
+            for obj, vetor in zip(objetos, vetores) if vetor
+        ]
+        collection = get_weaviate_async_client().collections.get(COLECAO_PASSAGENS)
+        await collection.data.insert_many(objects=objetos)
+        contadores["passagens"] = contadores.get("passagens", 0) + len(objetos)
+        logger.info(f"{len(objetos)} passagens de {len(artigos)} artigos gravadas no Weaviate")
+        return True
+    except Exception as e:
+        logger.error(f"Erro ao gravar as passagens de {len(artigos)} artigos: {e}")
+        return False
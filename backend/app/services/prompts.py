@@ -7,9 +7,10 @@ from typing import Optional, Dict, Any, List
 from datetime import datetime, timezone
 
 # --- ALTERAÇÃO AQUI: Importa a função do novo módulo de cache ---
-from app.core.cache import obter_prompt
+from app.core.cache import obter_prompt, carregar_prompts_para_cache
 
 from app.core.clients import get_supabase_client
+from app.services.cache_semantico import invalidar_cache_semantico
 
 logger = logging.getLogger(__name__)
 
@@ -42,9 +43,10 @@ def atualizar_prompt_por_id(id_prompt: int, nome: str, conteudo: str) -> bool:
         logger.info(f"A atualizar o prompt ID: {id_prompt}")
         supabase.table("prompts").update(dados_para_atualizar).eq("id", id_prompt).execute()
         logger.info(f"Prompt '{nome}' (ID: {id_prompt}) atualizado com sucesso.")
-        # NOTA: Para que esta alteração seja refletida em tempo real, seria necessário
-        # implementar um mecanismo para invalidar ou recarregar o cache.
-        # Por agora, uma reinicialização do servidor aplicará as mudanças.
+        invalidar_cache_semantico(f"prompt '{nome}' atualizado")
+        # Este worker aplica a alteração na hora; os demais, na próxima verificação
+        # periódica da configuração ('configuracao_intervalo_segundos').
+        carregar_prompts_para_cache(supabase)
         return True
     except Exception as e:
         logger.error(f"Erro ao atualizar o prompt ID {id_prompt}: {e}")
@@ -60,6 +62,7 @@ def criar_novo_prompt(nome: str, conteudo: str) -> bool:
         logger.info(f"A criar novo prompt com o nome: {nome}")
         supabase.table("prompts").insert(dados).execute()
         logger.info(f"Prompt '{nome}' criado com sucesso.")
+        carregar_prompts_para_cache(supabase)
         return True
     except Exception as e:
         logger.error(f"Erro ao criar o prompt '{nome}': {e}")
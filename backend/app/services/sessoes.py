@@ -5,102 +5,197 @@ Módulo de Serviços para Gerenciamento de Sessões de Usuário.
 A lógica de timeout é baseada na inatividade (campo 'atualizado_em').
 """
 
+import asyncio
 import logging
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Set
 
-from app.core.clients import get_supabase_client
+from app.core.cache import obter_parametro
+from app.core.clients import get_supabase_async_client
 
 logger = logging.getLogger(__name__)
 
 # Constante de configuração para o tempo de inatividade da sessão
 SESSAO_TIMEOUT_MINUTOS = 30
 
-def obter_ou_criar_sessao(usuario_id: int) -> int:
-    """
-    Obtém a sessão ativa de um usuário ou cria uma nova se a última
-    interação tiver excedido o tempo limite de inatividade.
+# --- Sessões ativas em memória ---
+# Cada pergunta precisa da sessão ativa do usuário; mantê-la em memória evita o
+# SELECT + UPDATE (e o SELECT de detalhes) a cada turno. A última atividade é
+# gravada no banco em lote, periodicamente ('sessao_gravacao_atividade_segundos').
+# Com vários workers, uma sessão expirada localmente é primeiro procurada no banco,
+# então cada worker adota a mesma sessão em vez de criar outra.
 
-    Args:
-        usuario_id: ID do usuário.
+@dataclass
+class _SessaoAtiva:
+    id: int
+    usuario_id: int
+    criado_em: str
+    ultima_atividade: datetime
 
-    Returns:
-        ID da sessão ativa.
+    def como_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "criado_em": self.criado_em,
+            "atualizado_em": self.ultima_atividade.isoformat(),
+            "usuario_id": self.usuario_id,
+        }
 
-    Raises:
-        Exception: Se não for possível obter ou criar uma sessão.
-    """
-    supabase = get_supabase_client()
+_sessoes_por_usuario: Dict[int, _SessaoAtiva] = {}
+_sessoes_por_id: Dict[int, _SessaoAtiva] = {}
+# Sessões com atividade ainda não gravada no banco
+_atividades_pendentes: Set[int] = set()
+# Resoluções em andamento por usuário: perguntas simultâneas do mesmo usuário
+# aguardam a mesma busca/criação, em vez de criarem duas sessões.
+_resolucoes_em_andamento: Dict[int, "asyncio.Future[_SessaoAtiva]"] = {}
+
+def _expirada(sessao: _SessaoAtiva, agora: datetime) -> bool:
+    return agora - sessao.ultima_atividade >= timedelta(minutes=SESSAO_TIMEOUT_MINUTOS)
+
+def _registrar_sessao(sessao: _SessaoAtiva):
+    anterior = _sessoes_por_usuario.get(sessao.usuario_id)
+    if anterior is not None and anterior.id != sessao.id:
+        _sessoes_por_id.pop(anterior.id, None)
+    _sessoes_por_usuario[sessao.usuario_id] = sessao
+    _sessoes_por_id[sessao.id] = sessao
+
+def _registrar_atividade(sessao: _SessaoAtiva, agora: datetime):
+    sessao.ultima_atividade = agora
+    _atividades_pendentes.add(sessao.id)
+
+async def _buscar_ou_criar_no_banco(usuario_id: int) -> _SessaoAtiva:
+    supabase = get_supabase_async_client()
     now = datetime.now(timezone.utc)
-    
+
     # 1. Tenta encontrar uma sessão ativa baseada na ÚLTIMA ATIVIDADE
     limite_inatividade = now - timedelta(minutes=SESSAO_TIMEOUT_MINUTOS)
-    
     try:
-        response = (
+        response = await (
             supabase.table("sessoes")
-            .select("id")
+            .select("id, criado_em")
             .eq("usuario_id", usuario_id)
-            .gt("atualizado_em", limite_inatividade.isoformat()) # <-- LÓGICA CORRIGIDA
+            .gt("atualizado_em", limite_inatividade.isoformat())
             .order("atualizado_em", desc=True)
             .limit(1)
             .execute()
         )
-
         if response.data:
-            sessao_id = response.data[0]["id"]
-            logger.info(f"Sessão ativa {sessao_id} encontrada para o usuário {usuario_id}.")
-            
-            # 2. Mantém a sessão viva, atualizando seu timestamp
-            (supabase.table("sessoes")
-             .update({"atualizado_em": now.isoformat()})
-             .eq("id", sessao_id)
-             .execute())
-             
-            return sessao_id
-
+            sessao = _SessaoAtiva(response.data[0]["id"], usuario_id, response.data[0]["criado_em"], now)
+            logger.info(f"Sessão ativa {sessao.id} encontrada para o usuário {usuario_id}.")
+            # A atividade é gravada no próximo lote.
+            _atividades_pendentes.add(sessao.id)
+            return sessao
     except Exception as e:
         logger.error(f"Erro ao tentar obter sessão ativa: {e}")
         # Continua para criar uma nova sessão
 
-    # 3. Se nenhuma sessão ativa foi encontrada, cria uma nova
+    # 2. Se nenhuma sessão ativa foi encontrada, cria uma nova (INSERT ... RETURNING)
     logger.info(f"Nenhuma sessão ativa encontrada. Criando nova sessão para o usuário {usuario_id}.")
     try:
-        dados_nova_sessao = {
-            "usuario_id": usuario_id,
-            "criado_em": now.isoformat(),
-            "atualizado_em": now.isoformat(),
-        }
-        
-        insert_response = (
-            supabase.table("sessoes")
-            .insert(dados_nova_sessao, returning="minimal") # Use returning="minimal" para performance
-            .execute()
-        )
-        
-        # Após a inserção, busca o ID da sessão recém-criada
-        # É a maneira mais confiável de obter o ID em diferentes configurações do Supabase
-        id_response = (
+        insert_response = await (
             supabase.table("sessoes")
-            .select("id")
-            .eq("usuario_id", usuario_id)
-            .order("criado_em", desc=True)
-            .limit(1)
+            .insert({"usuario_id": usuario_id, "criado_em": now.isoformat(), "atualizado_em": now.isoformat()})
             .execute()
         )
-
-        if id_response.data:
-            nova_sessao_id = id_response.data[0]["id"]
-            logger.info(f"Nova sessão {nova_sessao_id} criada com sucesso.")
-            return nova_sessao_id
-        else:
+        if not insert_response.data:
             raise Exception("Falha ao recuperar o ID da sessão recém-criada.")
-
+        linha = insert_response.data[0]
+        logger.info(f"Nova sessão {linha['id']} criada com sucesso.")
+        return _SessaoAtiva(linha["id"], usuario_id, linha["criado_em"], now)
     except Exception as e:
         logger.error(f"❌ Erro crítico ao criar nova sessão: {e}")
         raise
 
-def listar_sessoes_usuario(usuario_id: int) -> List[Dict[str, Any]]:
+async def resolver_sessao(usuario_id: int) -> Dict[str, Any]:
+    """
+    Retorna os dados da sessão ativa do usuário (id, criado_em, atualizado_em, usuario_id),
+    criando uma nova se a última interação tiver excedido o tempo limite de inatividade.
+    Sessões conhecidas são resolvidas em memória, sem ida ao banco.
+
+    Raises:
+        Exception: Se não for possível obter ou criar uma sessão.
+    """
+    agora = datetime.now(timezone.utc)
+    sessao = _sessoes_por_usuario.get(usuario_id)
+    if sessao is not None and not _expirada(sessao, agora):
+        _registrar_atividade(sessao, agora)
+        return sessao.como_dict()
+
+    resolucao = _resolucoes_em_andamento.get(usuario_id)
+    if resolucao is None:
+        resolucao = asyncio.ensure_future(_buscar_ou_criar_no_banco(usuario_id))
+        _resolucoes_em_andamento[usuario_id] = resolucao
+        resolucao.add_done_callback(lambda _: _resolucoes_em_andamento.pop(usuario_id, None))
+    sessao = await asyncio.shield(resolucao)
+    _registrar_sessao(sessao)
+    return sessao.como_dict()
+
+async def obter_ou_criar_sessao(usuario_id: int) -> int:
+    """
+    Obtém a sessão ativa de um usuário ou cria uma nova se a última
+    interação tiver excedido o tempo limite de inatividade.
+
+    Args:
+        usuario_id: ID do usuário.
+
+    Returns:
+        ID da sessão ativa.
+
+    Raises:
+        Exception: Se não for possível obter ou criar uma sessão.
+    """
+    return (await resolver_sessao(usuario_id))["id"]
+
+async def atualizar_ultima_atividade(sessao_id: int) -> bool:
+    """Registra atividade na sessão; retorna False se ela não existir."""
+    agora = datetime.now(timezone.utc)
+    sessao = _sessoes_por_id.get(sessao_id)
+    if sessao is not None:
+        _registrar_atividade(sessao, agora)
+        return True
+    supabase = get_supabase_async_client()
+    response = await supabase.table("sessoes").update({"atualizado_em": agora.isoformat()}).eq("id", sessao_id).execute()
+    return bool(response.data)
+
+async def gravar_atividade_sessoes() -> int:
+    """
+    Grava num único UPDATE a última atividade das sessões com interações pendentes
+    e descarta da memória as sessões expiradas. Retorna quantas sessões foram atualizadas.
+    """
+    agora = datetime.now(timezone.utc)
+    for sessao in [s for s in _sessoes_por_usuario.values() if _expirada(s, agora)]:
+        _sessoes_por_usuario.pop(sessao.usuario_id, None)
+        _sessoes_por_id.pop(sessao.id, None)
+
+    if not _atividades_pendentes:
+        return 0
+    ids = list(_atividades_pendentes)
+    _atividades_pendentes.clear()
+    try:
+        supabase = get_supabase_async_client()
+        # O trigger 'handle_sessao_update' grava now() em 'atualizado_em'.
+        await supabase.table("sessoes").update({"atualizado_em": agora.isoformat()}).in_("id", ids).execute()
+    except Exception:
+        # Devolve os ids para a próxima tentativa.
+        _atividades_pendentes.update(ids)
+        raise
+    return len(ids)
+
+async def _executar_gravacao_periodica():
+    """Laço da gravação em lote da atividade das sessões; o intervalo é relido a cada ciclo."""
+    while True:
+        intervalo_segundos = float(obter_parametro("sessao_gravacao_atividade_segundos", default=30))
+        await asyncio.sleep(max(intervalo_segundos, 1))
+        try:
+            await gravar_atividade_sessoes()
+        except Exception as e:
+            logger.error(f"❌ Erro ao gravar a atividade das sessões: {e}")
+
+def iniciar_gravacao_atividade_sessoes() -> asyncio.Task:
+    """Agenda a gravação periódica da atividade das sessões (parâmetro 'sessao_gravacao_atividade_segundos')."""
+    return asyncio.create_task(_executar_gravacao_periodica())
+
+async def listar_sessoes_usuario(usuario_id: int) -> List[Dict[str, Any]]:
     """
     Lista todas as sessões de um usuário.
 
@@ -111,9 +206,9 @@ def listar_sessoes_usuario(usuario_id: int) -> List[Dict[str, Any]]:
         Lista de sessões ou lista vazia em caso de erro.
     """
     try:
-        supabase = get_supabase_client()
+        supabase = get_supabase_async_client()
         
-        response = (
+        response = await (
             supabase.table("sessoes")
             .select("id, criado_em, atualizado_em")
             .eq("usuario_id", usuario_id)
@@ -129,7 +224,7 @@ def listar_sessoes_usuario(usuario_id: int) -> List[Dict[str, Any]]:
     
     # No final do seu arquivo app/services/sessoes.py
 
-def obter_detalhes_sessao(sessao_id: int) -> Optional[Dict[str, Any]]:
+async def obter_detalhes_sessao(sessao_id: int) -> Optional[Dict[str, Any]]:
     """
     Busca os detalhes completos de uma sessão específica pelo seu ID.
 
@@ -141,12 +236,17 @@ def obter_detalhes_sessao(sessao_id: int) -> Optional[Dict[str, Any]]:
     """
     if not sessao_id:
         return None
-        
+
+    # Sessões ativas deste worker já estão em memória
+    sessao = _sessoes_por_id.get(sessao_id)
+    if sessao is not None:
+        return sessao.como_dict()
+
     try:
-        supabase = get_supabase_client()
+        supabase = get_supabase_async_client()
         logger.info(f"Buscando detalhes para a sessão ID: {sessao_id}")
         
-        response = supabase.table("sessoes") \
+        response = await supabase.table("sessoes") \
                            .select("id, criado_em, atualizado_em, usuario_id") \
                            .eq("id", sessao_id) \
                            .single() \
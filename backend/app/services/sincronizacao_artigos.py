@@ -0,0 +1,275 @@
+# app/services/sincronizacao_artigos.py
+"""
+Sincronização incremental (delta) da base de conhecimento com o Movidesk.
+
+Em vez de revisitar cada artigo no Weaviate e no Movidesk, compara em bloco o
+'updatedAt' devolvido pela listagem do Movidesk com o manifesto guardado no
+banco (ver manifesto_artigos.py) e:
+- busca detalhes apenas dos artigos novos ou alterados;
+- gera embedding apenas quando o hash do conteúdo mudou;
+- remove do Weaviate os artigos que deixaram de ser publicados.
+
+Como o agendamento roda em todos os workers e instâncias, cada execução primeiro
+obtém um bloqueio no banco ('adquirir_bloqueio_tarefa'); sem ele, é pulada.
+"""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+from weaviate.classes.query import Filter
+from weaviate.util import generate_uuid5
+
+from app.core.cache import obter_parametro
+from app.core.clients import get_supabase_async_client, get_weaviate_async_client, iterar_objetos_weaviate, recarregar_indice_local
+from app.services.cache_semantico import invalidar_cache_semantico
+from app.services.importador_artigos import (
+    import_status,
+    buscar_lista_artigos,
+    buscar_detalhes_artigo,
+    converter_iso_para_timestamp_utc3,
+    gravar_lote_artigos,
+    montar_propriedades_artigo,
+    verificar_e_criar_schema,
+)
+from app.services.manifesto_artigos import calcular_hash_conteudo, carregar_manifesto, salvar_manifesto
+from app.services.passagens_artigos import remover_passagens
+
+logger = logging.getLogger(__name__)
+
+NOME_BLOQUEIO = "sincronizacao_artigos"
+# Identifica este processo como dono do bloqueio
+_DONO_BLOQUEIO = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+async def _adquirir_bloqueio(validade_segundos: int) -> bool:
+    supabase = get_supabase_async_client()
+    response = await supabase.rpc("adquirir_bloqueio_tarefa", {
+        "p_nome": NOME_BLOQUEIO,
+        "p_dono": _DONO_BLOQUEIO,
+        "p_validade_segundos": validade_segundos,
+    }).execute()
+    return bool(response.data)
+
+
+async def _renovar_bloqueio(validade_segundos: int):
+    while True:
+        await asyncio.sleep(validade_segundos / 3)
+        try:
+            if not await _adquirir_bloqueio(validade_segundos):
+                logger.error("❌ O bloqueio da sincronização de artigos foi perdido para outro processo.")
+                return
+        except Exception as e:
+            logger.warning(f"Erro ao renovar o bloqueio da sincronização de artigos: {e}")
+
+
+@asynccontextmanager
+async def _bloqueio_sincronizacao() -> AsyncIterator[None]:
+    """Impede que workers/instâncias diferentes sincronizem ao mesmo tempo."""
+    validade = int(obter_parametro("sync_bloqueio_validade_segundos", default=300))
+    if not await _adquirir_bloqueio(validade):
+        raise RuntimeError("Uma sincronização já está em andamento em outro worker ou instância.")
+    renovacao = asyncio.create_task(_renovar_bloqueio(validade))
+    try:
+        yield
+    finally:
+        renovacao.cancel()
+        try:
+            await get_supabase_async_client().rpc("liberar_bloqueio_tarefa", {
+                "p_nome": NOME_BLOQUEIO,
+                "p_dono": _DONO_BLOQUEIO,
+            }).execute()
+        except Exception as e:
+            logger.warning(f"Erro ao liberar o bloqueio da sincronização de artigos (expira sozinho): {e}")
+
+
+def _timestamp_ou_none(data_iso: Optional[str]) -> Optional[float]:
+    try:
+        return converter_iso_para_timestamp_utc3(data_iso)
+    except Exception:
+        return None
+
+
+async def _reconstruir_manifesto() -> Dict[str, Dict[str, Any]]:
+    """Monta o manifesto a partir dos objetos já gravados no Weaviate."""
+    logger.info("⚙️ Reconstruindo o manifesto de artigos a partir do Weaviate...")
+    manifesto: Dict[str, Dict[str, Any]] = {}
+    async for obj in iterar_objetos_weaviate("Article", return_properties=["movidesk_id", "updatedDate", "content"]):
+        aid = obj.properties.get("movidesk_id")
+        if aid is None:
+            continue
+        manifesto[str(aid)] = {
+            "atualizado_em": _timestamp_ou_none(obj.properties.get("updatedDate")),
+            "hash": calcular_hash_conteudo(obj.properties.get("content")),
+        }
+    logger.info(f"✅ Manifesto reconstruído com {len(manifesto)} artigos.")
+    return manifesto
+
+
+async def _listar_todos_artigos(client: httpx.AsyncClient) -> Dict[str, Dict[str, Any]]:
+    """Percorre todas as páginas da listagem do Movidesk (apenas id, updatedAt e título)."""
+    por_pagina = int(obter_parametro("movi_itens_por_pagina", default=100))
+    artigos: Dict[str, Dict[str, Any]] = {}
+    pagina = 0
+    while True:
+        itens = await buscar_lista_artigos(client, pagina, por_pagina)
+        if not itens:
+            break
+        for item in itens:
+            if item.get("id"):
+                artigos[str(item["id"])] = item
+        pagina += 1
+    return artigos
+
+
+async def sincronizar_artigos_movidesk() -> Dict[str, int]:
+    """Executa uma sincronização incremental e retorna os contadores do que foi feito."""
+    async with _bloqueio_sincronizacao():
+        return await _sincronizar()
+
+
+async def _sincronizar() -> Dict[str, int]:
+    if import_status["in_progress"]:
+        raise RuntimeError("Uma importação já está em andamento.")
+    import_status["in_progress"] = True
+    import_status["message"] = f"Sincronização iniciada às {datetime.now().strftime('%H:%M:%S')}"
+
+    contadores = {
+        "listados": 0,
+        "novos": 0,
+        "alterados": 0,
+        "reembedados": 0,
+        "apenas_propriedades": 0,
+        "removidos": 0,
+        "enviados": 0,
+        "pulados_embedding": 0,
+        "falhas_detalhes": 0,
+    }
+    try:
+        await verificar_e_criar_schema(resetar_base=False)
+        collection = get_weaviate_async_client().collections.get("Article")
+        manifesto = await carregar_manifesto()
+        if manifesto is None:
+            manifesto = await _reconstruir_manifesto()
+
+        semaforo = asyncio.Semaphore(int(obter_parametro("movi_concorrencia", default=5)))
+
+        async with httpx.AsyncClient() as client:
+            lista = await _listar_todos_artigos(client)
+            contadores["listados"] = len(lista)
+            if not lista:
+                # Uma listagem vazia quase sempre indica falha na API; nunca apaga a base por causa dela.
+                logger.warning("Listagem do Movidesk vazia; sincronização abortada sem alterações.")
+                return contadores
+
+            # 1. Comparação em bloco com o manifesto
+            candidatos: List[Tuple[str, Optional[float]]] = []
+            for aid, item in lista.items():
+                ts_movidesk = _timestamp_ou_none(item.get("updatedAt"))
+                entrada = manifesto.get(aid)
+                if entrada is None:
+                    contadores["novos"] += 1
+                elif ts_movidesk is None or entrada.get("atualizado_em") is None or abs(ts_movidesk - entrada["atualizado_em"]) > 1:
+                    contadores["alterados"] += 1
+                else:
+                    continue
+                candidatos.append((aid, ts_movidesk))
+            removidos = [aid for aid in manifesto if aid not in lista]
+            logger.info(
+                f"🔄 Delta: {contadores['novos']} novos, {contadores['alterados']} alterados, "
+                f"{len(removidos)} removidos de {len(lista)} artigos listados."
+            )
+
+            # 2. Detalhes apenas dos artigos novos ou alterados
+            async def buscar(aid: str) -> Optional[Dict[str, Any]]:
+                async with semaforo:
+                    try:
+                        return await buscar_detalhes_artigo(client, int(aid))
+                    except Exception as e:
+                        logger.error(f"Erro ao buscar detalhes do artigo {aid}: {e}")
+                        contadores["falhas_detalhes"] += 1
+                        return None
+
+            detalhes = await asyncio.gather(*[buscar(aid) for aid, _ in candidatos])
+
+        # 3. Reembeda só o que mudou de conteúdo; o resto atualiza apenas as propriedades
+        para_embedar: List[Tuple[str, Dict[str, Any], Dict[str, Any]]] = []
+        apenas_propriedades: List[Tuple[str, Dict[str, Any], Dict[str, Any]]] = []
+        for (aid, ts_movidesk), det in zip(candidatos, detalhes):
+            if det is None:
+                continue
+            props = montar_propriedades_artigo(int(aid), det)
+            nova_entrada = {"atualizado_em": ts_movidesk, "hash": calcular_hash_conteudo(props["content"])}
+            entrada = manifesto.get(aid)
+            destino = apenas_propriedades if entrada and entrada.get("hash") == nova_entrada["hash"] else para_embedar
+            destino.append((aid, props, nova_entrada))
+
+        lote_gravacao = int(obter_parametro("importacao_lote_gravacao", default=100))
+        for inicio in range(0, len(para_embedar), lote_gravacao):
+            lote = para_embedar[inicio:inicio + lote_gravacao]
+            if await gravar_lote_artigos(collection, [(generate_uuid5(aid), props) for aid, props, _ in lote], contadores):
+                for aid, _, nova_entrada in lote:
+                    manifesto[aid] = nova_entrada
+                contadores["reembedados"] += len(lote)
+
+        async def atualizar(aid: str, props: Dict[str, Any], nova_entrada: Dict[str, Any]):
+            try:
+                await collection.data.update(uuid=generate_uuid5(aid), properties=props)
+                manifesto[aid] = nova_entrada
+                contadores["apenas_propriedades"] += 1
+            except Exception as e:
+                logger.error(f"Erro ao atualizar as propriedades do artigo {aid}: {e}")
+
+        await asyncio.gather(*[atualizar(*item) for item in apenas_propriedades])
+
+        # 4. Remove os artigos que não estão mais publicados
+        if removidos:
+            try:
+                await remover_passagens(removidos)
+                await collection.data.delete_many(
+                    where=Filter.by_id().contains_any([generate_uuid5(aid) for aid in removidos])
+                )
+                for aid in removidos:
+                    manifesto.pop(aid, None)
+                contadores["removidos"] = len(removidos)
+            except Exception as e:
+                logger.error(f"Erro ao remover {len(removidos)} artigos do Weaviate: {e}")
+
+        await salvar_manifesto(manifesto)
+
+        if contadores["reembedados"] or contadores["apenas_propriedades"] or contadores["removidos"]:
+            await asyncio.to_thread(invalidar_cache_semantico, "sincronização incremental de artigos")
+            await recarregar_indice_local()
+
+        logger.info(f"✅ Sincronização concluída: {contadores}")
+        return contadores
+    finally:
+        import_status["in_progress"] = False
+        import_status["message"] = f"Última sincronização às {datetime.now().strftime('%H:%M:%S')}"
+
+
+async def _executar_sincronizacao_periodica():
+    """Laço da sincronização agendada; o intervalo é relido a cada ciclo."""
+    while True:
+        intervalo_minutos = float(obter_parametro("sync_intervalo_minutos", default=0))
+        if intervalo_minutos <= 0:
+            # Agendamento desabilitado; verifica novamente o parâmetro mais tarde.
+            await asyncio.sleep(60)
+            continue
+        await asyncio.sleep(intervalo_minutos * 60)
+        try:
+            await sincronizar_artigos_movidesk()
+        except RuntimeError as e:
+            logger.info(f"Sincronização agendada pulada: {e}")
+        except Exception as e:
+            logger.error(f"❌ Erro na sincronização agendada de artigos: {e}")
+
+
+def iniciar_sincronizacao_periodica() -> asyncio.Task:
+    """Agenda a sincronização periódica (parâmetro 'sync_intervalo_minutos', 0 = desligada)."""
+    return asyncio.create_task(_executar_sincronizacao_periodica())
@@ -0,0 +1,79 @@
+# app/utils/cache_lru.py
+"""
+Cache LRU em memória, limitado em tamanho, com TTL opcional e contadores de acerto.
+É thread-safe, pois também é usado a partir de threads de trabalho.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterator, Optional, Tuple
+
+
+class CacheLRU:
+    """Mapa chave → valor que descarta a entrada menos usada ao atingir o tamanho máximo."""
+
+    def __init__(self, tamanho_maximo: int, ttl_segundos: Optional[float] = None):
+        self.tamanho_maximo = max(1, int(tamanho_maximo))
+        self.ttl_segundos = ttl_segundos
+        self._dados: "OrderedDict[Hashable, Tuple[Any, Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+
+    def obter(self, chave: Hashable, default: Any = None) -> Any:
+        """Retorna o valor da chave (marcando-a como usada) ou 'default' se ausente/expirada."""
+        with self._lock:
+            item = self._dados.get(chave)
+            if item is not None:
+                valor, expira_em = item
+                if expira_em is None or expira_em > time.monotonic():
+                    self._dados.move_to_end(chave)
+                    self.acertos += 1
+                    return valor
+                del self._dados[chave]
+            self.falhas += 1
+            return default
+
+    def guardar(self, chave: Hashable, valor: Any, ttl_segundos: Optional[float] = None):
+        """Guarda um valor; 'ttl_segundos' sobrescreve o TTL padrão do cache."""
+        ttl = ttl_segundos if ttl_segundos is not None else self.ttl_segundos
+        expira_em = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._dados[chave] = (valor, expira_em)
+            self._dados.move_to_end(chave)
+            while len(self._dados) > self.tamanho_maximo:
+                self._dados.popitem(last=False)
+
+    def remover(self, chave: Hashable):
+        with self._lock:
+            self._dados.pop(chave, None)
+
+    def limpar(self):
+        with self._lock:
+            self._dados.clear()
+
+    def redimensionar(self, tamanho_maximo: int):
+        """Altera o tamanho máximo, descartando as entradas mais antigas se necessário."""
+        with self._lock:
+            self.tamanho_maximo = max(1, int(tamanho_maximo))
+            while len(self._dados) > self.tamanho_maximo:
+                self._dados.popitem(last=False)
+
+    def itens(self) -> Iterator[Tuple[Hashable, Any]]:
+        """Retorna uma cópia das entradas ainda válidas, da menos para a mais usada."""
+        agora = time.monotonic()
+        with self._lock:
+            return iter([(k, v) for k, (v, expira_em) in self._dados.items() if expira_em is None or expira_em > agora])
+
+    def __len__(self) -> int:
+        return len(self._dados)
+
+    def estatisticas(self) -> Dict[str, Any]:
+        total = self.acertos + self.falhas
+        return {
+            "tamanho": len(self._dados),
+            "tamanho_maximo": self.tamanho_maximo,
+            "acertos": self.acertos,
+            "falhas": self.falhas,
+            "taxa_acerto": round(self.acertos / total, 4) if total else 0.0,
+        }
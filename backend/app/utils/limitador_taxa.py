@@ -0,0 +1,34 @@
+# app/utils/limitador_taxa.py
+"""
+Limitador de taxa do tipo "token bucket" para chamadas assíncronas a APIs externas.
+"""
+import asyncio
+import time
+
+
+class LimitadorTaxa:
+    """
+    Permite, em média, 'taxa_por_segundo' aquisições por segundo, com rajadas de até
+    'capacidade' aquisições. Compartilhado entre as corrotinas que chamam a mesma API.
+    """
+
+    def __init__(self, taxa_por_segundo: float, capacidade: int = 1):
+        self.taxa_por_segundo = max(0.01, float(taxa_por_segundo))
+        self.capacidade = max(1, int(capacidade))
+        self._fichas = float(self.capacidade)
+        self._ultima_recarga = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _recarregar(self):
+        agora = time.monotonic()
+        self._fichas = min(self.capacidade, self._fichas + (agora - self._ultima_recarga) * self.taxa_por_segundo)
+        self._ultima_recarga = agora
+
+    async def adquirir(self):
+        """Aguarda até haver uma ficha disponível e a consome."""
+        async with self._lock:
+            self._recarregar()
+            while self._fichas < 1:
+                await asyncio.sleep((1 - self._fichas) / self.taxa_por_segundo)
+                self._recarregar()
+            self._fichas -= 1
@@ -0,0 +1,137 @@
+# app/utils/microlotes.py
+"""
+Processador de micro-lotes: reúne requisições concorrentes vindas do event loop
+e as executa em lote numa thread de trabalho dedicada.
+"""
+import asyncio
+import queue
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+_PARAR = object()
+
+
+def _resolver(futuro: asyncio.Future, resultado: Any = None, erro: Optional[BaseException] = None):
+    # A requisição pode ter sido cancelada enquanto aguardava o lote.
+    if futuro.done():
+        return
+    if erro is not None:
+        futuro.set_exception(erro)
+    else:
+        futuro.set_result(resultado)
+
+
+class ProcessadorMicroLotes:
+    """
+    Cada chamada a 'submeter' entra numa fila. A thread de trabalho pega o primeiro
+    item, espera até 'espera_maxima_ms' por outros (até 'tamanho_maximo_lote'),
+    chama 'processar_lote' uma única vez e devolve a cada chamador o seu resultado.
+    """
+
+    def __init__(
+        self,
+        processar_lote: Callable[[List[Any]], List[Any]],
+        tamanho_maximo_lote: int = 16,
+        espera_maxima_ms: float = 5.0,
+        nome: str = "microlotes",
+    ):
+        self.processar_lote = processar_lote
+        self.tamanho_maximo_lote = max(1, int(tamanho_maximo_lote))
+        self.espera_maxima_ms = max(0.0, float(espera_maxima_ms))
+        self.nome = nome
+        self._fila: "queue.Queue[Any]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._requisicoes = 0
+        self._lotes = 0
+        self._maior_lote = 0
+        self._tempo_total_lotes = 0.0
+        self._tamanhos_lote: Counter = Counter()
+
+    def configurar(self, tamanho_maximo_lote: int, espera_maxima_ms: float):
+        """Ajusta os limites; vale a partir do próximo lote."""
+        self.tamanho_maximo_lote = max(1, int(tamanho_maximo_lote))
+        self.espera_maxima_ms = max(0.0, float(espera_maxima_ms))
+
+    def iniciar(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._executar, name=self.nome, daemon=True)
+                self._thread.start()
+
+    def parar(self, timeout: float = 5.0):
+        """Encerra a thread de trabalho após processar o que já está na fila."""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None and thread.is_alive():
+            self._fila.put(_PARAR)
+            thread.join(timeout)
+
+    async def submeter(self, item: Any) -> Any:
+        """Enfileira um item e aguarda o resultado do lote em que ele foi processado."""
+        self.iniciar()
+        loop = asyncio.get_running_loop()
+        futuro = loop.create_future()
+        self._fila.put((item, futuro, loop))
+        return await futuro
+
+    def _coletar_lote(self, primeiro: Tuple) -> Tuple[List[Tuple], bool]:
+        lote = [primeiro]
+        prazo = time.monotonic() + self.espera_maxima_ms / 1000
+        while len(lote) < self.tamanho_maximo_lote:
+            restante = prazo - time.monotonic()
+            try:
+                # Depois do prazo ainda recolhe o que já estiver na fila, sem esperar.
+                item = self._fila.get(timeout=restante) if restante > 0 else self._fila.get_nowait()
+            except queue.Empty:
+                break
+            if item is _PARAR:
+                return lote, True
+            lote.append(item)
+        return lote, False
+
+    def _executar(self):
+        parar = False
+        while not parar:
+            primeiro = self._fila.get()
+            if primeiro is _PARAR:
+                break
+            lote, parar = self._coletar_lote(primeiro)
+
+            inicio = time.perf_counter()
+            try:
+                resultados = list(self.processar_lote([item for item, _, _ in lote]))
+                if len(resultados) != len(lote):
+                    # Sem a correspondência um a um, nenhum resultado é confiável.
+                    raise RuntimeError(
+                        f"'{self.nome}': processar_lote retornou {len(resultados)} resultados para {len(lote)} itens."
+                    )
+                for (_, futuro, loop), resultado in zip(lote, resultados):
+                    loop.call_soon_threadsafe(_resolver, futuro, resultado)
+            except Exception as e:
+                for _, futuro, loop in lote:
+                    loop.call_soon_threadsafe(_resolver, futuro, None, e)
+
+            with self._lock:
+                self._requisicoes += len(lote)
+                self._lotes += 1
+                self._maior_lote = max(self._maior_lote, len(lote))
+                self._tempo_total_lotes += time.perf_counter() - inicio
+                self._tamanhos_lote[len(lote)] += 1
+
+    def estatisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "profundidade_fila": self._fila.qsize(),
+                "requisicoes": self._requisicoes,
+                "lotes": self._lotes,
+                "tamanho_medio_lote": round(self._requisicoes / self._lotes, 2) if self._lotes else 0.0,
+                "maior_lote": self._maior_lote,
+                "tempo_medio_lote_ms": round(self._tempo_total_lotes / self._lotes * 1000, 2) if self._lotes else 0.0,
+                "distribuicao_tamanhos": dict(sorted(self._tamanhos_lote.items())),
+                "tamanho_maximo_lote": self.tamanho_maximo_lote,
+                "espera_maxima_ms": self.espera_maxima_ms,
+            }
@@ -0,0 +1,40 @@
+# app/utils/tokens.py
+"""
+Funções utilitárias de contagem e divisão de texto em tokens (tiktoken),
+usadas para respeitar os limites de entrada dos modelos da OpenAI.
+"""
+from functools import lru_cache
+from typing import List
+
+import tiktoken
+
+
+@lru_cache(maxsize=8)
+def obter_codificador(modelo: str) -> tiktoken.Encoding:
+    """Retorna o codificador do modelo ou, se desconhecido, o 'cl100k_base'."""
+    try:
+        return tiktoken.encoding_for_model(modelo)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def contar_tokens(texto: str, modelo: str) -> int:
+    return len(obter_codificador(modelo).encode(texto, disallowed_special=()))
+
+
+def dividir_em_trechos(texto: str, modelo: str, max_tokens: int, sobreposicao: int = 0) -> List[str]:
+    """
+    Divide o texto em trechos de até 'max_tokens' tokens. Trechos consecutivos
+    compartilham 'sobreposicao' tokens para não cortar o contexto nas bordas.
+    """
+    codificador = obter_codificador(modelo)
+    tokens = codificador.encode(texto, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return [texto]
+    passo = max(1, max_tokens - sobreposicao)
+    trechos = []
+    for inicio in range(0, len(tokens), passo):
+        trechos.append(codificador.decode(tokens[inicio:inicio + max_tokens]))
+        if inicio + max_tokens >= len(tokens):
+            break
+    return trechos
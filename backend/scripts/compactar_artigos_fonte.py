@@ -0,0 +1,47 @@
+# compactar_artigos_fonte.py
+"""
+Compacta 'metadados.artigos_fonte' das mensagens já gravadas: os artigos inteiros
+(com 'content' e 'resumo') são trocados pelas suas referências (id, movidesk_id,
+título, url, score, passagens), e a tabela 'mensagens_artigos_fonte' é preenchida
+pelo trigger. O trabalho é feito no banco, em lotes por id, pela função
+'compactar_artigos_fonte'; o script pode ser interrompido e retomado com --apos-id.
+
+Uso (a partir da pasta 'backend'):
+    python -m scripts.compactar_artigos_fonte
+    python -m scripts.compactar_artigos_fonte --lote 200 --apos-id 150000
+"""
+import argparse
+import time
+
+from app.core.clients import get_supabase_client
+
+
+def compactar(apos_id: int, tamanho_lote: int):
+    supabase = get_supabase_client()
+    total_compactadas, lotes = 0, 0
+    inicio = time.perf_counter()
+    while True:
+        resultado = supabase.rpc("compactar_artigos_fonte", {"p_apos_id": apos_id, "p_limite": tamanho_lote}).execute().data
+        if not resultado or resultado.get("ultimo_id") is None:
+            break
+        apos_id = resultado["ultimo_id"]
+        total_compactadas += resultado.get("compactadas", 0)
+        lotes += 1
+        print(f"   Lote {lotes}: até a mensagem {apos_id}, {resultado.get('compactadas', 0)} compactadas")
+
+    duracao = time.perf_counter() - inicio
+    print(f"✅ {total_compactadas} mensagens compactadas em {lotes} lotes ({duracao:.1f}s).")
+    print("   Execute VACUUM (ANALYZE) public.mensagens para devolver o espaço das versões antigas das linhas.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lote", type=int, default=500, help="Mensagens examinadas por chamada.")
+    parser.add_argument("--apos-id", type=int, default=0, help="Retoma a partir deste id de mensagem.")
+    args = parser.parse_args()
+    print("🚀 Compactando as fontes das mensagens...")
+    compactar(args.apos_id, args.lote)
+
+
+if __name__ == "__main__":
+    main()
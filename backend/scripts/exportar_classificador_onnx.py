@@ -0,0 +1,127 @@
+# exportar_classificador_onnx.py
+"""
+Exporta o classificador fine-tuneado para ONNX, aplica quantização dinâmica int8
+e verifica a paridade dos rótulos com o PyTorch em dados/dataset_classificador.csv.
+
+Uso (a partir da pasta 'backend'):
+    python -m scripts.exportar_classificador_onnx
+    python -m scripts.exportar_classificador_onnx --apenas-paridade --limiar 0.98
+
+Depois, defina os parâmetros 'classificador_backend' = 'onnx' e
+'classificador_onnx_dir' com a pasta de saída.
+"""
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+from app.services.classificador import (
+    ARQUIVO_ONNX_QUANTIZADO,
+    DIRETORIO_ONNX_PADRAO,
+    MODEL_ID,
+    ClassificadorOnnx,
+    ClassificadorPyTorch,
+    normalizar_texto,
+)
+
+CAMINHO_CSV = "dados/dataset_classificador.csv"
+TAMANHO_LOTE = 32
+
+
+def exportar(saida: str):
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    print(f"🚀 Exportando '{MODEL_ID}' para ONNX em '{saida}'...")
+    tokenizador = AutoTokenizer.from_pretrained(MODEL_ID)
+    modelo = AutoModelForSequenceClassification.from_pretrained(MODEL_ID).eval()
+    os.makedirs(saida, exist_ok=True)
+
+    exemplo = tokenizador(["como emitir nota fiscal"], return_tensors="pt")
+    caminho_fp32 = os.path.join(saida, "modelo.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            modelo,
+            (exemplo["input_ids"], exemplo["attention_mask"]),
+            caminho_fp32,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["logits"],
+            dynamic_axes={
+                "input_ids": {0: "lote", 1: "sequencia"},
+                "attention_mask": {0: "lote", 1: "sequencia"},
+                "logits": {0: "lote"},
+            },
+            opset_version=17,
+            do_constant_folding=True,
+        )
+
+    caminho_int8 = os.path.join(saida, ARQUIVO_ONNX_QUANTIZADO)
+    quantize_dynamic(caminho_fp32, caminho_int8, weight_type=QuantType.QInt8)
+    tokenizador.save_pretrained(saida)
+    modelo.config.save_pretrained(saida)
+
+    tamanho_fp32 = os.path.getsize(caminho_fp32) / 1024 / 1024
+    tamanho_int8 = os.path.getsize(caminho_int8) / 1024 / 1024
+    print(f"✅ Modelo exportado: {tamanho_fp32:.0f} MB (fp32) -> {tamanho_int8:.0f} MB (int8)")
+
+
+def _classificar_em_lotes(classificador, perguntas):
+    rotulos = []
+    inicio = time.perf_counter()
+    for i in range(0, len(perguntas), TAMANHO_LOTE):
+        resultado = classificador.classificar(perguntas[i:i + TAMANHO_LOTE])
+        rotulos.extend(r[0]["label"].lower() for r in resultado)
+    duracao_ms = (time.perf_counter() - inicio) * 1000
+    return rotulos, duracao_ms
+
+
+def verificar_paridade(saida: str, caminho_csv: str, limiar: float) -> bool:
+    """Compara os rótulos do ONNX quantizado com os do PyTorch e com o gabarito do dataset."""
+    df = pd.read_csv(caminho_csv)
+    perguntas = [normalizar_texto(p) for p in df["pergunta"].astype(str)]
+    gabarito = df["categoria"].astype(str).str.lower().tolist()
+
+    rotulos_pytorch, ms_pytorch = _classificar_em_lotes(ClassificadorPyTorch(MODEL_ID), perguntas)
+    rotulos_onnx, ms_onnx = _classificar_em_lotes(ClassificadorOnnx(saida), perguntas)
+
+    total = len(perguntas)
+    concordancia = sum(a == b for a, b in zip(rotulos_pytorch, rotulos_onnx)) / total
+    acuracia_pytorch = sum(a == b for a, b in zip(rotulos_pytorch, gabarito)) / total
+    acuracia_onnx = sum(a == b for a, b in zip(rotulos_onnx, gabarito)) / total
+
+    print(f"📊 {total} perguntas de '{caminho_csv}'")
+    print(f"   Concordância ONNX x PyTorch: {concordancia:.2%} (mínimo exigido: {limiar:.2%})")
+    print(f"   Acurácia PyTorch: {acuracia_pytorch:.2%} | ONNX: {acuracia_onnx:.2%}")
+    print(f"   Tempo por pergunta PyTorch: {ms_pytorch / total:.1f} ms | ONNX: {ms_onnx / total:.1f} ms")
+
+    divergencias = [
+        (df["pergunta"].iloc[i], a, b)
+        for i, (a, b) in enumerate(zip(rotulos_pytorch, rotulos_onnx)) if a != b
+    ]
+    for pergunta, a, b in divergencias[:20]:
+        print(f"   ⚠️ '{pergunta}': PyTorch={a} ONNX={b}")
+
+    return concordancia >= limiar
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--saida", default=DIRETORIO_ONNX_PADRAO, help="Pasta de saída do modelo ONNX.")
+    parser.add_argument("--dataset", default=CAMINHO_CSV, help="CSV com as colunas 'pergunta' e 'categoria'.")
+    parser.add_argument("--limiar", type=float, default=0.98, help="Concordância mínima com o PyTorch.")
+    parser.add_argument("--apenas-paridade", action="store_true", help="Não reexporta; só verifica a paridade.")
+    args = parser.parse_args()
+
+    if not args.apenas_paridade:
+        exportar(args.saida)
+    if not verificar_paridade(args.saida, args.dataset, args.limiar):
+        print("❌ Paridade abaixo do limiar; não ative o backend ONNX com este modelo.")
+        sys.exit(1)
+    print("✅ Paridade aprovada.")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,13 @@
 -- Rodar APENAS este bloco primeiro para garantir um ambiente limpo.
 -- =================================================================
 
+DROP FUNCTION IF EXISTS public.metricas_consolidadas(date, date, text[], integer, integer);
+DROP FUNCTION IF EXISTS public.metricas_secao_gerais(public.metricas_diarias[]);
+DROP FUNCTION IF EXISTS public.metricas_secao_feedback(public.metricas_diarias[]);
+DROP FUNCTION IF EXISTS public.metricas_secao_desempenho(public.metricas_diarias[]);
+DROP FUNCTION IF EXISTS public.metricas_secao_engajamento(public.metricas_diarias[], integer);
+DROP FUNCTION IF EXISTS public.metricas_secao_custo_rag(public.metricas_diarias[], integer);
+DROP FUNCTION IF EXISTS public.metricas_secao_historico(public.metricas_diarias[]);
 DROP TABLE IF EXISTS public.mensagens_artigos_fonte CASCADE;
 DROP TABLE IF EXISTS public.feedbacks CASCADE;
 DROP TABLE IF EXISTS public.mensagens CASCADE;
@@ -10,8 +17,29 @@ DROP TABLE IF EXISTS public.sessoes CASCADE;
 DROP TABLE IF EXISTS public.usuarios CASCADE;
 DROP TABLE IF EXISTS public.prompts CASCADE;
 DROP TABLE IF EXISTS public.parametros CASCADE;
+DROP TABLE IF EXISTS public.metricas_diarias CASCADE;
+DROP TABLE IF EXISTS public.bloqueios_tarefas CASCADE;
+DROP TABLE IF EXISTS public.manifesto_artigos CASCADE;
 DROP FUNCTION IF EXISTS public.update_atualizado_em_column();
 DROP FUNCTION IF EXISTS public.match_mensagens(vector, double precision, integer);
+DROP FUNCTION IF EXISTS public.match_respostas_cache(vector, double precision, integer, integer);
+DROP FUNCTION IF EXISTS public.invalidar_cache_respostas();
+DROP FUNCTION IF EXISTS public.reservar_ids_mensagens(integer);
+DROP FUNCTION IF EXISTS public.versao_configuracao();
+DROP FUNCTION IF EXISTS public.adquirir_bloqueio_tarefa(text, text, integer);
+DROP FUNCTION IF EXISTS public.liberar_bloqueio_tarefa(text, text);
+DROP FUNCTION IF EXISTS public.carregar_manifesto_artigos();
+DROP FUNCTION IF EXISTS public.salvar_manifesto_artigos(jsonb);
+DROP FUNCTION IF EXISTS public.obter_ou_criar_usuario(text, text);
+DROP FUNCTION IF EXISTS public.usuarios_recentes(integer, integer);
+DROP FUNCTION IF EXISTS public.sincronizar_mensagens_artigos_fonte();
+DROP FUNCTION IF EXISTS public.referencias_artigos_fonte(jsonb);
+DROP FUNCTION IF EXISTS public.compactar_artigos_fonte(bigint, integer);
+DROP FUNCTION IF EXISTS public.metricas_dias_periodo(date, date);
+DROP FUNCTION IF EXISTS public.calcular_metricas_diarias(date, date);
+DROP FUNCTION IF EXISTS public.atualizar_metricas_diarias(date, date);
+DROP FUNCTION IF EXISTS public.atualizar_metricas_diarias_pendentes();
+DROP FUNCTION IF EXISTS public.percentil_histograma(integer[], double precision, double precision);
 
 -- FIM DA PRIMEIRA PARTE
 -- =================================================================
@@ -64,6 +92,8 @@ CREATE TABLE IF NOT EXISTS public.mensagens (
     resposta TEXT,
     tipo_resposta TEXT,
     embedding VECTOR(1536),
+    -- Geração do cache semântico em que a resposta foi gerada ('cache_semantico_geracao')
+    cache_geracao INT,
     -- Coluna única para guardar todos os dados extras da resposta da IA
     metadados JSONB,
     criado_em TIMESTAMPTZ DEFAULT now() NOT NULL,
@@ -72,6 +102,46 @@ CREATE TABLE IF NOT EXISTS public.mensagens (
 CREATE TRIGGER handle_mensagem_update BEFORE UPDATE ON public.mensagens FOR EACH ROW EXECUTE PROCEDURE public.update_atualizado_em_column();
 CREATE INDEX IF NOT EXISTS idx_mensagens_usuario ON public.mensagens(usuario_id);
 CREATE INDEX IF NOT EXISTS idx_mensagens_sessao ON public.mensagens(sessao_id);
+-- Índice vetorial usado pelo cache semântico de respostas (match_respostas_cache)
+CREATE INDEX IF NOT EXISTS idx_mensagens_embedding ON public.mensagens USING hnsw (embedding vector_cosine_ops);
+-- Filtros por período usados pelas funções de métricas
+CREATE INDEX IF NOT EXISTS idx_mensagens_criado_em ON public.mensagens(criado_em);
+
+-- Artigos usados como fonte de cada resposta, em linhas. 'metadados.artigos_fonte'
+-- guarda só as referências (sem o conteúdo dos artigos) e esta tabela é preenchida
+-- a partir delas pelo trigger abaixo, sem escrita extra da API.
+CREATE TABLE IF NOT EXISTS public.mensagens_artigos_fonte (
+    mensagem_id BIGINT REFERENCES public.mensagens(id) ON DELETE CASCADE NOT NULL,
+    ordem SMALLINT NOT NULL,
+    artigo_id TEXT,
+    movidesk_id BIGINT,
+    titulo TEXT,
+    url TEXT,
+    score REAL,
+    posicoes INT[],
+    PRIMARY KEY (mensagem_id, ordem)
+);
+CREATE INDEX IF NOT EXISTS idx_mensagens_artigos_fonte_movidesk ON public.mensagens_artigos_fonte(movidesk_id);
+
+CREATE OR REPLACE FUNCTION public.sincronizar_mensagens_artigos_fonte()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND NEW.metadados->'artigos_fonte' IS NOT DISTINCT FROM OLD.metadados->'artigos_fonte' THEN
+        RETURN NEW;
+    END IF;
+    DELETE FROM public.mensagens_artigos_fonte WHERE mensagem_id = NEW.id;
+    IF jsonb_typeof(NEW.metadados->'artigos_fonte') = 'array' THEN
+        INSERT INTO public.mensagens_artigos_fonte (mensagem_id, ordem, artigo_id, movidesk_id, titulo, url, score, posicoes)
+        SELECT NEW.id, t.ordem, t.a->>'id', (t.a->>'movidesk_id')::bigint, t.a->>'title', t.a->>'url', (t.a->>'score')::real,
+               CASE WHEN jsonb_typeof(t.a->'posicoes') = 'array'
+                    THEN ARRAY(SELECT jsonb_array_elements_text(t.a->'posicoes')::int) END
+        FROM jsonb_array_elements(NEW.metadados->'artigos_fonte') WITH ORDINALITY AS t(a, ordem);
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+CREATE TRIGGER handle_mensagem_artigos_fonte AFTER INSERT OR UPDATE OF metadados ON public.mensagens
+FOR EACH ROW EXECUTE PROCEDURE public.sincronizar_mensagens_artigos_fonte();
 
 CREATE TABLE IF NOT EXISTS public.feedbacks (
     id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
@@ -82,6 +152,7 @@ CREATE TABLE IF NOT EXISTS public.feedbacks (
     usuario_id BIGINT REFERENCES public.usuarios(id),
     criado_em TIMESTAMPTZ DEFAULT now() NOT NULL
 );
+CREATE INDEX IF NOT EXISTS idx_feedbacks_criado_em ON public.feedbacks(criado_em);
 
 CREATE TABLE public.prompts (
     id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
@@ -171,13 +242,55 @@ INSERT INTO public.parametros (nome, valor, descricao) VALUES
 ('modelo', 'gpt-4', 'Modelo de linguagem padrão para o chat (ex: gpt-4, gpt-3.5-turbo).'),
 ('temperatura', '0.7', 'Criatividade da IA (0.0 a 2.0). Mais baixo = mais factual.'),
 ('embedding_model', 'text-embedding-ada-002', 'Modelo usado para gerar os embeddings dos artigos.'),
+('embedding_max_tokens_entrada', '8000', 'Máximo de tokens por entrada de embedding; textos maiores são divididos em trechos.'),
+('embedding_tokens_por_lote', '200000', 'Máximo de tokens somados em uma única requisição de embeddings em lote.'),
+('importacao_lote_gravacao', '100', 'Número de artigos acumulados antes de gerar os embeddings em lote e gravar no Weaviate.'),
+('cache_embeddings_tamanho', '2048', 'Número máximo de embeddings mantidos no cache em memória.'),
+('cache_embeddings_arquivo', '', 'Caminho do arquivo SQLite do cache de embeddings em disco (vazio = desabilitado).'),
 ('limiar_confianca_classificador', '0.3', 'Confiança mínima do classificador de tópicos para aceitar uma categoria (0.0 a 1.0).'),
+('classificador_backend', 'pytorch', 'Backend de inferência do classificador: ''pytorch'' ou ''onnx'' (modelo quantizado int8).'),
+('classificador_onnx_dir', 'dados/classificador_onnx', 'Pasta do modelo ONNX gerado por scripts/exportar_classificador_onnx.py.'),
+('classificador_threads', '0', 'Threads de inferência do ONNX Runtime por processo (0 = padrão do runtime).'),
+('classificador_lote_maximo', '16', 'Número máximo de perguntas classificadas num mesmo micro-lote.'),
+('classificador_espera_lote_ms', '5', 'Tempo máximo (ms) que o classificador espera por outras perguntas para formar um lote.'),
+('cache_classificador_tamanho', '1024', 'Número máximo de perguntas normalizadas com a classificação em cache.'),
+('cache_classificador_ttl_horas', '24', 'Validade (em horas) das classificações em cache.'),
+('cache_classificador_arquivo', 'dados/cache_classificador.json', 'Arquivo onde o cache de classificações é salvo entre reinícios (vazio = desabilitado).'),
 ('rag_search_limit', '3', 'Número máximo de artigos que a busca vetorial deve retornar.'),
+('indexacao_modo', 'artigo', 'Modo de indexação/busca RAG: ''artigo'' (artigo inteiro) ou ''passagens'' (trechos sobrepostos). Após mudar, execute a importação completa.'),
+('passagem_max_tokens', '300', 'Tamanho máximo (em tokens) de cada passagem no modo de indexação por passagens.'),
+('passagem_sobreposicao_tokens', '50', 'Tokens compartilhados entre passagens consecutivas.'),
+('rag_passagens_por_artigo', '3', 'Número máximo de passagens de um mesmo artigo enviadas ao prompt.'),
+('indice_local_ativo', 'false', 'Responde a busca RAG de artigos com uma réplica local (NumPy) dos vetores do Weaviate.'),
+('indice_local_arquivo', '', 'Caminho do arquivo .npy do índice local, aberto com mmap (vazio = apenas em memória).'),
+('cache_semantico_ativo', 'true', 'Habilita o cache semântico de respostas do chat.'),
+('cache_semantico_limiar', '0.95', 'Similaridade mínima (0.0 a 1.0) para reaproveitar uma resposta do cache semântico.'),
+('cache_semantico_ttl_horas', '24', 'Validade (em horas) das respostas guardadas no cache semântico.'),
+('cache_semantico_geracao', '0', 'Geração atual do cache semântico; avançada por invalidar_cache_respostas (não editar).'),
 ('log_level', 'INFO', 'Nível de log da aplicação (INFO, DEBUG, ERROR).'),
 ('base_article_url', 'https://sisand.movidesk.com/kb/pt-br/article', 'URL base para os links dos artigos no frontend.'),
 ('weaviate_url', 'https://kegwrhvasmc0n279eqrqra.c0.us-west3.gcp.weaviate.cloud', 'URL da instância do Weaviate.'),
+('weaviate_timeout_consulta', '10', 'Tempo máximo (em segundos) de cada consulta ao Weaviate.'),
+('weaviate_pool_conexoes', '10', 'Número de conexões mantidas no pool do cliente Weaviate assíncrono.'),
+('weaviate_pool_maximo', '50', 'Tamanho máximo do pool de conexões do cliente Weaviate assíncrono.'),
 ('movi_list_url', 'https://api.movidesk.com/public/v1/kb/article', 'URL da API do Movidesk para listar artigos.'),
-('movi_detail_url', 'https://api.movidesk.com/public/v1/article', 'URL da API do Movidesk para detalhar um artigo.');
+('movi_detail_url', 'https://api.movidesk.com/public/v1/article', 'URL da API do Movidesk para detalhar um artigo.'),
+('movi_concorrencia', '5', 'Número máximo de artigos processados ao mesmo tempo durante a importação.'),
+('movi_requisicoes_por_segundo', '2', 'Limite de requisições por segundo à API do Movidesk.'),
+('movi_max_tentativas', '4', 'Número máximo de tentativas (com backoff) para cada chamada à API do Movidesk.'),
+('movi_itens_por_pagina', '100', 'Quantidade de artigos por página na listagem do Movidesk durante a sincronização.'),
+('sync_intervalo_minutos', '0', 'Intervalo (em minutos) da sincronização incremental automática de artigos (0 = desligada).'),
+('sync_bloqueio_validade_segundos', '300', 'Validade do bloqueio que impede sincronizações simultâneas em workers/instâncias diferentes; renovado durante a execução.'),
+('metricas_consolidacao_intervalo_minutos', '60', 'Intervalo (em minutos) da consolidação das métricas diárias em metricas_diarias (0 = desligada).'),
+('metricas_cache_ttl_segundos', '60', 'Validade (em segundos) das métricas em cache para períodos que incluem o dia atual (0 = sem cache).'),
+('metricas_cache_ttl_historico_segundos', '21600', 'Validade (em segundos) das métricas em cache para períodos inteiramente encerrados (0 = sem cache).'),
+('sessao_gravacao_atividade_segundos', '30', 'Intervalo (em segundos) da gravação em lote da última atividade das sessões ativas.'),
+('mensagens_fila_maxima', '1000', 'Número máximo de mensagens aguardando gravação; com a fila cheia, novas respostas aguardam espaço.'),
+('mensagens_lote_maximo', '50', 'Número máximo de mensagens gravadas por escrita em lote.'),
+('usuarios_cache_tamanho', '10000', 'Número máximo de usuários (login -> id) mantidos em cache na API.'),
+('usuarios_cache_ttl_minutos', '60', 'Validade (em minutos) de um usuário no cache da API.'),
+('usuarios_cache_aquecimento_dias', '7', 'No startup, carrega no cache os usuários com sessões nos últimos N dias (0 = sem aquecimento).'),
+('configuracao_intervalo_segundos', '15', 'Intervalo (em segundos) da verificação de alterações em parâmetros e prompts em cada worker (0 = desligada).');
 
 -- =================================================================
 -- FUNÇÃO DE BUSCA SEMÂNTICA
@@ -208,6 +321,601 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
+-- =================================================================
+-- VERSÃO DA CONFIGURAÇÃO
+-- Consultada periodicamente por cada worker da API: só quando muda os
+-- parâmetros e prompts são relidos.
+-- =================================================================
+CREATE OR REPLACE FUNCTION public.versao_configuracao()
+RETURNS TEXT AS $$
+    SELECT concat_ws('|',
+        (SELECT concat(max(atualizado_em), ':', count(*)) FROM public.parametros),
+        (SELECT concat(max(atualizado_em), ':', count(*)) FROM public.prompts)
+    );
+$$ LANGUAGE sql STABLE;
+
+-- =================================================================
+-- RESOLUÇÃO DE USUÁRIOS
+-- =================================================================
+-- Retorna o id do usuário com o login informado, criando-o se não existir.
+-- Seguro com chamadas simultâneas para o mesmo login (ON CONFLICT DO NOTHING).
+CREATE OR REPLACE FUNCTION public.obter_ou_criar_usuario(p_login TEXT, p_nome TEXT DEFAULT NULL)
+RETURNS BIGINT AS $$
+DECLARE
+    v_id BIGINT;
+BEGIN
+    SELECT id INTO v_id FROM public.usuarios WHERE login = p_login;
+    IF FOUND THEN
+        RETURN v_id;
+    END IF;
+    INSERT INTO public.usuarios (login, nome) VALUES (p_login, coalesce(p_nome, p_login))
+    ON CONFLICT (login) DO NOTHING
+    RETURNING id INTO v_id;
+    IF v_id IS NULL THEN
+        -- Outra requisição criou o usuário entre a busca e a inserção
+        SELECT id INTO v_id FROM public.usuarios WHERE login = p_login;
+    END IF;
+    RETURN v_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Usuários com sessões nos últimos 'p_dias', do mais para o menos recente (aquecimento do cache da API).
+CREATE OR REPLACE FUNCTION public.usuarios_recentes(p_dias INT DEFAULT 7, p_limite INT DEFAULT 10000)
+RETURNS TABLE (id BIGINT, login TEXT) AS $$
+    SELECT u.id, u.login
+    FROM public.usuarios AS u
+    JOIN (
+        SELECT usuario_id, max(atualizado_em) AS ultima_atividade
+        FROM public.sessoes
+        WHERE atualizado_em > now() - make_interval(days => p_dias)
+        GROUP BY usuario_id
+    ) AS s ON s.usuario_id = u.id
+    ORDER BY s.ultima_atividade DESC
+    LIMIT p_limite;
+$$ LANGUAGE sql STABLE;
+
+-- =================================================================
+-- RESERVA DE IDS DE MENSAGENS
+-- A API reserva ids em bloco e grava a mensagem completa depois, numa única escrita.
+-- =================================================================
+CREATE OR REPLACE FUNCTION public.reservar_ids_mensagens(p_quantidade INT)
+RETURNS SETOF BIGINT AS $$
+    SELECT nextval(pg_get_serial_sequence('public.mensagens', 'id'))
+    FROM generate_series(1, p_quantidade);
+$$ LANGUAGE sql VOLATILE;
+
+-- =================================================================
+-- BLOQUEIOS ENTRE PROCESSOS
+-- Tarefas agendadas em todos os workers e instâncias (ex.: a sincronização de
+-- artigos) só executam onde obtiverem o bloqueio. Ele tem validade, renovada
+-- pelo dono enquanto trabalha, e expira sozinho se o processo morrer.
+-- (pg_try_advisory_lock não serve aqui: cada chamada RPC pode usar outra conexão.)
+-- =================================================================
+CREATE TABLE IF NOT EXISTS public.bloqueios_tarefas (
+    nome TEXT PRIMARY KEY,
+    dono TEXT NOT NULL,
+    expira_em TIMESTAMPTZ NOT NULL
+);
+
+-- Obtém (ou renova, se já for do mesmo dono) o bloqueio; retorna FALSE se outro dono o detém.
+CREATE OR REPLACE FUNCTION public.adquirir_bloqueio_tarefa(p_nome TEXT, p_dono TEXT, p_validade_segundos INT)
+RETURNS BOOLEAN AS $$
+    WITH obtido AS (
+        INSERT INTO public.bloqueios_tarefas AS b (nome, dono, expira_em)
+        VALUES (p_nome, p_dono, now() + make_interval(secs => p_validade_segundos))
+        ON CONFLICT (nome) DO UPDATE
+            SET dono = EXCLUDED.dono, expira_em = EXCLUDED.expira_em
+            WHERE b.dono = EXCLUDED.dono OR b.expira_em < now()
+        RETURNING 1
+    )
+    SELECT EXISTS (SELECT 1 FROM obtido);
+$$ LANGUAGE sql VOLATILE;
+
+CREATE OR REPLACE FUNCTION public.liberar_bloqueio_tarefa(p_nome TEXT, p_dono TEXT)
+RETURNS VOID AS $$
+    DELETE FROM public.bloqueios_tarefas WHERE nome = p_nome AND dono = p_dono;
+$$ LANGUAGE sql;
+
+-- =================================================================
+-- MANIFESTO DA SINCRONIZAÇÃO DE ARTIGOS
+-- 'updatedAt' do Movidesk e hash do conteúdo embedado de cada artigo no Weaviate.
+-- Fica no banco para que qualquer worker/instância que obtenha o bloqueio da
+-- sincronização parta do mesmo estado. Vazio = reconstruir a partir do Weaviate.
+-- =================================================================
+CREATE TABLE IF NOT EXISTS public.manifesto_artigos (
+    movidesk_id TEXT PRIMARY KEY,
+    atualizado_em DOUBLE PRECISION,
+    hash TEXT NOT NULL
+);
+
+-- O manifesto inteiro como {"<movidesk_id>": {"atualizado_em": ..., "hash": ...}}
+CREATE OR REPLACE FUNCTION public.carregar_manifesto_artigos()
+RETURNS JSONB AS $$
+    SELECT coalesce(
+        jsonb_object_agg(movidesk_id, jsonb_build_object('atualizado_em', atualizado_em, 'hash', hash)),
+        '{}'::jsonb
+    )
+    FROM public.manifesto_artigos;
+$$ LANGUAGE sql STABLE;
+
+-- Substitui o manifesto pelo informado (no mesmo formato), numa única transação.
+CREATE OR REPLACE FUNCTION public.salvar_manifesto_artigos(p_manifesto JSONB)
+RETURNS VOID AS $$
+BEGIN
+    DELETE FROM public.manifesto_artigos AS m
+    WHERE NOT (p_manifesto ? m.movidesk_id);
+
+    INSERT INTO public.manifesto_artigos (movidesk_id, atualizado_em, hash)
+    SELECT e.key, (e.value->>'atualizado_em')::DOUBLE PRECISION, e.value->>'hash'
+    FROM jsonb_each(p_manifesto) AS e
+    ON CONFLICT (movidesk_id) DO UPDATE
+        SET atualizado_em = EXCLUDED.atualizado_em, hash = EXCLUDED.hash
+        WHERE (manifesto_artigos.atualizado_em, manifesto_artigos.hash)
+              IS DISTINCT FROM (EXCLUDED.atualizado_em, EXCLUDED.hash);
+END;
+$$ LANGUAGE plpgsql;
+
+-- =================================================================
+-- COMPACTAÇÃO DAS FONTES DAS MENSAGENS
+-- Mensagens antigas guardavam os artigos inteiros em 'metadados.artigos_fonte'.
+-- 'compactar_artigos_fonte' as reduz às referências, em lotes por id
+-- (usado por scripts/compactar_artigos_fonte.py).
+-- =================================================================
+CREATE OR REPLACE FUNCTION public.referencias_artigos_fonte(p_artigos JSONB)
+RETURNS JSONB AS $$
+    SELECT coalesce(jsonb_agg(jsonb_strip_nulls(jsonb_build_object(
+        'id', a->'id',
+        'movidesk_id', a->'movidesk_id',
+        'title', a->'title',
+        'url', a->'url',
+        'score', a->'score',
+        'posicoes', a->'posicoes'
+    )) ORDER BY ordem), '[]'::jsonb)
+    FROM jsonb_array_elements(p_artigos) WITH ORDINALITY AS t(a, ordem);
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Compacta até 'p_limite' mensagens com id maior que 'p_apos_id'. Retorna o último id
+-- examinado (NULL quando não há mais mensagens) e quantas foram compactadas.
+CREATE OR REPLACE FUNCTION public.compactar_artigos_fonte(p_apos_id BIGINT DEFAULT 0, p_limite INT DEFAULT 500)
+RETURNS JSON AS $$
+DECLARE
+    v_ultimo_id BIGINT;
+    v_compactadas INT;
+BEGIN
+    SELECT max(id) INTO v_ultimo_id
+    FROM (SELECT id FROM public.mensagens WHERE id > p_apos_id ORDER BY id LIMIT p_limite) AS lote;
+
+    UPDATE public.mensagens
+    SET metadados = jsonb_set(metadados, '{artigos_fonte}', public.referencias_artigos_fonte(metadados->'artigos_fonte'))
+    WHERE id > p_apos_id AND id <= v_ultimo_id
+      AND jsonb_typeof(metadados->'artigos_fonte') = 'array'
+      AND jsonb_path_exists(metadados->'artigos_fonte', '$[*] ? (exists(@.content) || exists(@.resumo))');
+    GET DIAGNOSTICS v_compactadas = ROW_COUNT;
+
+    RETURN json_build_object('ultimo_id', v_ultimo_id, 'compactadas', v_compactadas);
+END;
+$$ LANGUAGE plpgsql;
+
+-- =================================================================
+-- CACHE SEMÂNTICO DE RESPOSTAS
+-- As entradas do cache são as mensagens da IA com 'embedding' preenchido e
+-- gravadas na geração atual do cache ('cache_semantico_geracao'). Invalidar
+-- o cache é só avançar a geração: as mensagens antigas não são reescritas.
+-- =================================================================
+CREATE OR REPLACE FUNCTION public.match_respostas_cache(
+    embedding_input VECTOR(1536),
+    min_similarity FLOAT,
+    match_count INT,
+    validade_segundos INT
+)
+RETURNS TABLE (
+    id BIGINT,
+    pergunta TEXT,
+    resposta TEXT,
+    metadados JSONB,
+    similarity FLOAT
+) AS $$
+BEGIN
+    RETURN QUERY
+    SELECT
+        m.id,
+        m.pergunta,
+        m.resposta,
+        m.metadados,
+        1 - (m.embedding <=> embedding_input) AS similarity
+    FROM public.mensagens AS m
+    WHERE m.embedding IS NOT NULL
+      AND m.tipo_resposta = 'ia'
+      AND m.cache_geracao = (
+          SELECT p.valor::INT FROM public.parametros AS p WHERE p.nome = 'cache_semantico_geracao'
+      )
+      AND m.criado_em > now() - make_interval(secs => validade_segundos)
+      AND (1 - (m.embedding <=> embedding_input)) > min_similarity
+      -- Respostas avaliadas negativamente nunca são reaproveitadas
+      AND NOT EXISTS (
+          SELECT 1 FROM public.feedbacks AS f
+          WHERE f.mensagem_id = m.id AND f.tipo = 'negativo'
+      )
+    ORDER BY m.embedding <=> embedding_input
+    LIMIT match_count;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Invalida o cache semântico (chamada quando prompts, parâmetros ou artigos mudam)
+-- avançando a geração; retorna a nova geração.
+CREATE OR REPLACE FUNCTION public.invalidar_cache_respostas()
+RETURNS INT AS $$
+    UPDATE public.parametros
+    SET valor = (valor::INT + 1)::TEXT
+    WHERE nome = 'cache_semantico_geracao'
+    RETURNING valor::INT;
+$$ LANGUAGE sql;
+
+
+-- =================================================================
+-- MÉTRICAS DO PAINEL
+-- Agregações feitas no banco; a API recebe apenas os resultados.
+-- Os períodos são datas inclusivas (UTC); NULL significa "sem limite".
+--
+-- Os dias já encerrados ficam consolidados em 'metricas_diarias'
+-- (atualizada por 'atualizar_metricas_diarias_pendentes', chamada
+-- periodicamente pela API). Só os dias ainda não consolidados,
+-- normalmente apenas "hoje", são calculados na hora.
+-- =================================================================
+CREATE TABLE IF NOT EXISTS public.metricas_diarias (
+    dia DATE PRIMARY KEY,
+    total_mensagens INT NOT NULL DEFAULT 0,
+    total_sessoes INT NOT NULL DEFAULT 0,
+    respostas_ia INT NOT NULL DEFAULT 0,
+    respostas_com_rag INT NOT NULL DEFAULT 0,
+    custo_total NUMERIC NOT NULL DEFAULT 0,
+    amostras_tempo INT NOT NULL DEFAULT 0,
+    soma_tempo DOUBLE PRECISION NOT NULL DEFAULT 0,
+    tempo_minimo DOUBLE PRECISION,
+    tempo_maximo DOUBLE PRECISION,
+    -- Contagem por faixa de 0,5 s: posição 1 = tempos negativos, 2..121 = [0 s, 60 s), 122 = 60 s ou mais
+    histograma_tempo INT[] NOT NULL DEFAULT '{}',
+    categorias JSONB NOT NULL DEFAULT '{}',            -- categoria -> quantidade de respostas
+    mensagens_por_usuario JSONB NOT NULL DEFAULT '{}', -- usuario_id -> quantidade de mensagens
+    feedbacks_positivos INT NOT NULL DEFAULT 0,
+    feedbacks_negativos INT NOT NULL DEFAULT 0,
+    atualizado_em TIMESTAMPTZ DEFAULT now() NOT NULL
+);
+
+-- Calcula as linhas de 'metricas_diarias' de um intervalo de dias diretamente das tabelas de origem.
+CREATE OR REPLACE FUNCTION public.calcular_metricas_diarias(p_inicio DATE, p_fim DATE)
+RETURNS SETOF public.metricas_diarias AS $$
+    WITH dias AS (
+        SELECT generate_series(p_inicio, p_fim, interval '1 day')::date AS dia
+    ),
+    msg AS (
+        SELECT (criado_em AT TIME ZONE 'UTC')::date AS dia, usuario_id, tipo_resposta, metadados,
+               CASE WHEN jsonb_typeof(metadados->'tempo_processamento') = 'number'
+                    THEN (metadados->>'tempo_processamento')::float END AS tempo
+        FROM public.mensagens
+        WHERE criado_em >= (p_inicio::timestamp AT TIME ZONE 'UTC')
+          AND criado_em < ((p_fim + 1)::timestamp AT TIME ZONE 'UTC')
+    ),
+    base AS (
+        SELECT dia,
+               count(*) AS total_mensagens,
+               count(*) FILTER (WHERE tipo_resposta = 'ia' AND jsonb_typeof(metadados) = 'object') AS respostas_ia,
+               count(*) FILTER (WHERE tipo_resposta = 'ia' AND metadados->'rag_utilizado' = 'true'::jsonb) AS respostas_com_rag,
+               coalesce(sum((metadados->>'custo_total')::numeric) FILTER (
+                   WHERE tipo_resposta = 'ia' AND jsonb_typeof(metadados->'custo_total') = 'number'), 0) AS custo_total,
+               count(tempo) AS amostras_tempo,
+               coalesce(sum(tempo), 0) AS soma_tempo,
+               min(tempo) AS tempo_minimo,
+               max(tempo) AS tempo_maximo
+        FROM msg
+        GROUP BY dia
+    ),
+    faixas AS (
+        SELECT dia, width_bucket(tempo, 0, 60, 120) AS faixa, count(*) AS qtd
+        FROM msg WHERE tempo IS NOT NULL
+        GROUP BY 1, 2
+    ),
+    histogramas AS (
+        SELECT d.dia, array_agg(coalesce(f.qtd, 0)::int ORDER BY b.faixa) AS histograma_tempo
+        FROM (SELECT DISTINCT dia FROM faixas) AS d
+        CROSS JOIN generate_series(0, 121) AS b(faixa)
+        LEFT JOIN faixas AS f ON f.dia = d.dia AND f.faixa = b.faixa
+        GROUP BY d.dia
+    ),
+    categorias AS (
+        SELECT dia, jsonb_object_agg(categoria, qtd) AS categorias
+        FROM (
+            SELECT dia, metadados->>'classificacao' AS categoria, count(*) AS qtd
+            FROM msg
+            WHERE tipo_resposta = 'ia' AND coalesce(metadados->>'classificacao', '') <> ''
+            GROUP BY 1, 2
+        ) AS c
+        GROUP BY dia
+    ),
+    usuarios AS (
+        SELECT dia, jsonb_object_agg(usuario_id::text, qtd) AS mensagens_por_usuario
+        FROM (SELECT dia, usuario_id, count(*) AS qtd FROM msg GROUP BY 1, 2) AS u
+        GROUP BY dia
+    ),
+    sessoes AS (
+        SELECT (criado_em AT TIME ZONE 'UTC')::date AS dia, count(*) AS total_sessoes
+        FROM public.sessoes
+        WHERE criado_em >= (p_inicio::timestamp AT TIME ZONE 'UTC')
+          AND criado_em < ((p_fim + 1)::timestamp AT TIME ZONE 'UTC')
+        GROUP BY 1
+    ),
+    feedbacks AS (
+        SELECT (criado_em AT TIME ZONE 'UTC')::date AS dia,
+               count(*) FILTER (WHERE tipo = 'positivo') AS positivos,
+               count(*) FILTER (WHERE tipo IS DISTINCT FROM 'positivo') AS negativos
+        FROM public.feedbacks
+        WHERE criado_em >= (p_inicio::timestamp AT TIME ZONE 'UTC')
+          AND criado_em < ((p_fim + 1)::timestamp AT TIME ZONE 'UTC')
+        GROUP BY 1
+    )
+    SELECT
+        d.dia,
+        coalesce(b.total_mensagens, 0)::int,
+        coalesce(s.total_sessoes, 0)::int,
+        coalesce(b.respostas_ia, 0)::int,
+        coalesce(b.respostas_com_rag, 0)::int,
+        coalesce(b.custo_total, 0),
+        coalesce(b.amostras_tempo, 0)::int,
+        coalesce(b.soma_tempo, 0),
+        b.tempo_minimo,
+        b.tempo_maximo,
+        coalesce(h.histograma_tempo, '{}'),
+        coalesce(c.categorias, '{}'),
+        coalesce(u.mensagens_por_usuario, '{}'),
+        coalesce(f.positivos, 0)::int,
+        coalesce(f.negativos, 0)::int,
+        now()
+    FROM dias AS d
+    LEFT JOIN base AS b ON b.dia = d.dia
+    LEFT JOIN histogramas AS h ON h.dia = d.dia
+    LEFT JOIN categorias AS c ON c.dia = d.dia
+    LEFT JOIN usuarios AS u ON u.dia = d.dia
+    LEFT JOIN sessoes AS s ON s.dia = d.dia
+    LEFT JOIN feedbacks AS f ON f.dia = d.dia;
+$$ LANGUAGE sql STABLE;
+
+-- Recalcula (idempotente) os dias informados na tabela de consolidação.
+CREATE OR REPLACE FUNCTION public.atualizar_metricas_diarias(p_inicio DATE, p_fim DATE)
+RETURNS VOID AS $$
+    INSERT INTO public.metricas_diarias
+    SELECT * FROM public.calcular_metricas_diarias(p_inicio, p_fim)
+    ON CONFLICT (dia) DO UPDATE SET
+        total_mensagens = EXCLUDED.total_mensagens,
+        total_sessoes = EXCLUDED.total_sessoes,
+        respostas_ia = EXCLUDED.respostas_ia,
+        respostas_com_rag = EXCLUDED.respostas_com_rag,
+        custo_total = EXCLUDED.custo_total,
+        amostras_tempo = EXCLUDED.amostras_tempo,
+        soma_tempo = EXCLUDED.soma_tempo,
+        tempo_minimo = EXCLUDED.tempo_minimo,
+        tempo_maximo = EXCLUDED.tempo_maximo,
+        histograma_tempo = EXCLUDED.histograma_tempo,
+        categorias = EXCLUDED.categorias,
+        mensagens_por_usuario = EXCLUDED.mensagens_por_usuario,
+        feedbacks_positivos = EXCLUDED.feedbacks_positivos,
+        feedbacks_negativos = EXCLUDED.feedbacks_negativos,
+        atualizado_em = now();
+$$ LANGUAGE sql;
+
+-- Consolida os dias encerrados que ainda não estão na tabela (e reprocessa o último,
+-- que pode ter sido consolidado antes de terminar). Retorna o número de dias processados.
+CREATE OR REPLACE FUNCTION public.atualizar_metricas_diarias_pendentes()
+RETURNS INT AS $$
+DECLARE
+    v_ontem DATE := (now() AT TIME ZONE 'UTC')::date - 1;
+    v_inicio DATE;
+BEGIN
+    SELECT max(dia) INTO v_inicio FROM public.metricas_diarias WHERE dia <= v_ontem;
+    IF v_inicio IS NULL THEN
+        SELECT min((criado_em AT TIME ZONE 'UTC')::date) INTO v_inicio FROM public.mensagens;
+    END IF;
+    IF v_inicio IS NULL OR v_inicio > v_ontem THEN
+        RETURN 0;
+    END IF;
+    PERFORM public.atualizar_metricas_diarias(v_inicio, v_ontem);
+    RETURN v_ontem - v_inicio + 1;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Linhas diárias de um período: dias consolidados vêm da tabela; os demais são calculados na hora.
+CREATE OR REPLACE FUNCTION public.metricas_dias_periodo(p_inicio DATE DEFAULT NULL, p_fim DATE DEFAULT NULL)
+RETURNS SETOF public.metricas_diarias AS $$
+DECLARE
+    v_hoje DATE := (now() AT TIME ZONE 'UTC')::date;
+    v_fim DATE := least(coalesce(p_fim, v_hoje), v_hoje);
+    v_ultimo DATE;
+    v_inicio DATE;
+BEGIN
+    SELECT max(dia) INTO v_ultimo FROM public.metricas_diarias WHERE dia < v_hoje;
+
+    RETURN QUERY
+    SELECT * FROM public.metricas_diarias
+    WHERE dia <= v_ultimo AND dia <= v_fim AND (p_inicio IS NULL OR dia >= p_inicio);
+
+    IF v_ultimo IS NULL THEN
+        v_inicio := coalesce(p_inicio, (SELECT min((criado_em AT TIME ZONE 'UTC')::date) FROM public.mensagens), v_hoje);
+    ELSE
+        v_inicio := greatest(v_ultimo + 1, coalesce(p_inicio, v_ultimo + 1));
+    END IF;
+    IF v_inicio <= v_fim THEN
+        RETURN QUERY SELECT * FROM public.calcular_metricas_diarias(v_inicio, v_fim);
+    END IF;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- Percentil aproximado a partir de um histograma de 'metricas_diarias' (interpolação linear na faixa).
+CREATE OR REPLACE FUNCTION public.percentil_histograma(p_histograma INT[], p_percentil FLOAT, p_largura FLOAT DEFAULT 0.5)
+RETURNS FLOAT AS $$
+DECLARE
+    v_total BIGINT;
+    v_alvo FLOAT;
+    v_acumulado BIGINT := 0;
+BEGIN
+    SELECT coalesce(sum(v), 0) INTO v_total FROM unnest(p_histograma) AS v;
+    IF v_total = 0 THEN
+        RETURN NULL;
+    END IF;
+    v_alvo := p_percentil * v_total;
+    FOR i IN 1 .. array_length(p_histograma, 1) LOOP
+        IF p_histograma[i] > 0 AND v_acumulado + p_histograma[i] >= v_alvo THEN
+            -- A posição i guarda a faixa [(i - 2) * largura, (i - 1) * largura)
+            RETURN greatest(0, (i - 2) * p_largura) + (v_alvo - v_acumulado) / p_histograma[i] * p_largura;
+        END IF;
+        v_acumulado := v_acumulado + p_histograma[i];
+    END LOOP;
+    RETURN (array_length(p_histograma, 1) - 2) * p_largura;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+-- Seções do painel. Cada função recebe as linhas diárias já montadas por
+-- 'metricas_dias_periodo', para que 'metricas_consolidadas' as leia uma única vez.
+CREATE OR REPLACE FUNCTION public.metricas_secao_gerais(p_dias public.metricas_diarias[])
+RETURNS JSON AS $$
+    SELECT json_build_object(
+        'total_usuarios', (SELECT count(*) FROM public.usuarios),
+        'total_sessoes_periodo', coalesce(sum(total_sessoes), 0),
+        'total_mensagens_periodo', coalesce(sum(total_mensagens), 0)
+    )
+    FROM unnest(p_dias);
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION public.metricas_secao_feedback(p_dias public.metricas_diarias[])
+RETURNS JSON AS $$
+    SELECT json_build_object(
+        'total_feedbacks_periodo', t.positivos + t.negativos,
+        'feedbacks_positivos_periodo', t.positivos,
+        'feedbacks_negativos_periodo', t.negativos,
+        'percentual_positivos_periodo', CASE WHEN t.positivos + t.negativos > 0
+            THEN round(100.0 * t.positivos / (t.positivos + t.negativos), 2) ELSE 0 END
+    )
+    FROM (
+        SELECT coalesce(sum(feedbacks_positivos), 0) AS positivos, coalesce(sum(feedbacks_negativos), 0) AS negativos
+        FROM unnest(p_dias)
+    ) AS t;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION public.metricas_secao_desempenho(p_dias public.metricas_diarias[])
+RETURNS JSON AS $$
+    WITH dias AS (
+        SELECT * FROM unnest(p_dias) WHERE amostras_tempo > 0
+    ),
+    histograma AS (
+        SELECT array_agg(qtd ORDER BY faixa) AS faixas
+        FROM (
+            SELECT h.faixa, sum(h.qtd)::int AS qtd
+            FROM dias, unnest(dias.histograma_tempo) WITH ORDINALITY AS h(qtd, faixa)
+            GROUP BY h.faixa
+        ) AS t
+    ),
+    totais AS (
+        SELECT sum(amostras_tempo) AS amostras, sum(soma_tempo) AS soma,
+               min(tempo_minimo) AS minimo, max(tempo_maximo) AS maximo
+        FROM dias
+    )
+    SELECT CASE WHEN coalesce(t.amostras, 0) = 0 THEN '{}'::json ELSE json_build_object(
+        'tempo_medio_resposta_s', round((t.soma / t.amostras)::numeric, 2),
+        'tempo_minimo_resposta_s', round(t.minimo::numeric, 2),
+        'tempo_maximo_resposta_s', round(t.maximo::numeric, 2),
+        'tempo_percentil_95_s', round(least(greatest(public.percentil_histograma(h.faixas, 0.95), t.minimo), t.maximo)::numeric, 2),
+        'amostras_coletadas', t.amostras
+    ) END
+    FROM totais AS t, histograma AS h;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION public.metricas_secao_engajamento(p_dias public.metricas_diarias[], p_limite INT DEFAULT 10)
+RETURNS JSON AS $$
+    SELECT json_build_object('top_10_usuarios_periodo', coalesce(json_agg(t ORDER BY t.mensagens DESC, t.nome), '[]'::json))
+    FROM (
+        SELECT u.nome, sum(m.qtd::int) AS mensagens
+        FROM unnest(p_dias) AS d
+        CROSS JOIN LATERAL jsonb_each_text(d.mensagens_por_usuario) AS m(usuario_id, qtd)
+        JOIN public.usuarios AS u ON u.id = m.usuario_id::bigint
+        WHERE u.nome IS NOT NULL AND u.nome <> ''
+        GROUP BY u.nome
+        ORDER BY 2 DESC, u.nome
+        LIMIT p_limite
+    ) AS t;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION public.metricas_secao_custo_rag(p_dias public.metricas_diarias[], p_limite_categorias INT DEFAULT 5)
+RETURNS JSON AS $$
+    WITH totais AS (
+        SELECT coalesce(sum(respostas_ia), 0) AS total, coalesce(sum(custo_total), 0) AS custo,
+               coalesce(sum(respostas_com_rag), 0) AS com_rag
+        FROM unnest(p_dias)
+    ),
+    categorias AS (
+        SELECT c.categoria, sum(c.qtd::int) AS quantidade
+        FROM unnest(p_dias) AS d
+        CROSS JOIN LATERAL jsonb_each_text(d.categorias) AS c(categoria, qtd)
+        GROUP BY c.categoria
+        ORDER BY 2 DESC, 1
+        LIMIT p_limite_categorias
+    )
+    SELECT json_build_object(
+        'custo_total_usd_periodo', round(t.custo, 6),
+        'custo_medio_por_msg_usd', CASE WHEN t.total > 0 THEN round(t.custo / t.total, 6) ELSE 0 END,
+        'percentual_respostas_com_rag_periodo', CASE WHEN t.total > 0 THEN round(100.0 * t.com_rag / t.total, 2) ELSE 0 END,
+        'top_5_categorias_periodo', (
+            SELECT coalesce(json_agg(c ORDER BY c.quantidade DESC, c.categoria), '[]'::json) FROM categorias AS c
+        )
+    )
+    FROM totais AS t;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION public.metricas_secao_historico(p_dias public.metricas_diarias[])
+RETURNS JSON AS $$
+    SELECT json_build_object('historico_desempenho', coalesce(json_agg(
+        json_build_object('Data', dia, 'Tempo Médio (s)', round((soma_tempo / amostras_tempo)::numeric, 2)) ORDER BY dia
+    ), '[]'::json))
+    FROM unnest(p_dias)
+    WHERE amostras_tempo > 0;
+$$ LANGUAGE sql STABLE;
+
+-- Ponto de entrada do painel: monta as linhas diárias do período uma vez e devolve
+-- as seções pedidas (todas, se 'p_secoes' for NULL) num único objeto, por nome de seção.
+CREATE OR REPLACE FUNCTION public.metricas_consolidadas(
+    p_inicio DATE DEFAULT NULL,
+    p_fim DATE DEFAULT NULL,
+    p_secoes TEXT[] DEFAULT NULL,
+    p_limite_usuarios INT DEFAULT 10,
+    p_limite_categorias INT DEFAULT 5
+)
+RETURNS JSON AS $$
+DECLARE
+    v_dias public.metricas_diarias[] := ARRAY(SELECT d FROM public.metricas_dias_periodo(p_inicio, p_fim) AS d);
+    v_resultado JSONB := '{}';
+BEGIN
+    IF p_secoes IS NULL OR 'gerais' = ANY(p_secoes) THEN
+        v_resultado := v_resultado || jsonb_build_object('gerais', public.metricas_secao_gerais(v_dias));
+    END IF;
+    IF p_secoes IS NULL OR 'feedback' = ANY(p_secoes) THEN
+        v_resultado := v_resultado || jsonb_build_object('feedback', public.metricas_secao_feedback(v_dias));
+    END IF;
+    IF p_secoes IS NULL OR 'desempenho' = ANY(p_secoes) THEN
+        v_resultado := v_resultado || jsonb_build_object('desempenho', public.metricas_secao_desempenho(v_dias));
+    END IF;
+    IF p_secoes IS NULL OR 'engajamento' = ANY(p_secoes) THEN
+        v_resultado := v_resultado || jsonb_build_object('engajamento', public.metricas_secao_engajamento(v_dias, p_limite_usuarios));
+    END IF;
+    IF p_secoes IS NULL OR 'custo_rag' = ANY(p_secoes) THEN
+        v_resultado := v_resultado || jsonb_build_object('custo_rag', public.metricas_secao_custo_rag(v_dias, p_limite_categorias));
+    END IF;
+    IF p_secoes IS NULL OR 'historico' = ANY(p_secoes) THEN
+        v_resultado := v_resultado || jsonb_build_object('historico', public.metricas_secao_historico(v_dias));
+    END IF;
+    RETURN v_resultado::json;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- Consolidação inicial do histórico existente
+SELECT public.atualizar_metricas_diarias_pendentes();
+
 
 -- =================================================================
 -- SEGURANÇA: HABILITAR ROW LEVEL SECURITY (RLS) E CRIAR POLÍTICAS